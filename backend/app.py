@@ -1,36 +1,69 @@
 import os
 import io
 import uuid
+import zlib
 import json
+import gzip
+import bisect
+import hashlib
+import html
 import logging
+import mimetypes
 import re
+import shutil
+import stat
+import struct
+import threading
+import time
+import zipfile
+from collections import Counter, OrderedDict
 from datetime import datetime, timedelta
 from functools import wraps
-from typing import List, Optional
+from typing import List, Optional, Tuple
 from urllib.parse import urlparse, parse_qs, urlencode, urlunparse
 
 import requests
 from flask import (
     Flask,
+    Response,
     jsonify,
     make_response,
     request,
     send_file,
     send_from_directory,
     session,
+    stream_with_context,
 )
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy.orm import relationship
-from sqlalchemy import text
+from sqlalchemy.orm import defer, relationship, selectinload
+from sqlalchemy import bindparam, case, event, or_, select, text, union_all, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.pool import QueuePool
 from werkzeug.security import check_password_hash, generate_password_hash
 from werkzeug.utils import secure_filename
 
+from process_workers import (
+    PAINT_JSON_MAGIC,
+    PAINT_STROKES_MAGIC,
+    decode_paint_data,
+    document_import_process,
+    encode_paint_data,
+    iter_document_text,
+    render_paint_process,
+    replay_paint_ops,
+)
+
 try:
     from openai import OpenAI
 except ImportError:  # pragma: no cover - optional dependency
     OpenAI = None
 
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
 try:
     from dotenv import load_dotenv
     load_dotenv()  # Load environment variables from .env file
@@ -43,19 +76,74 @@ except ImportError:
 ###############################################################################
 
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
-UPLOAD_ROOT = os.path.join(BASE_DIR, "uploads")
+UPLOAD_ROOT = os.environ.get("UPLOAD_ROOT") or os.path.join(BASE_DIR, "uploads")
 VIDEO_DIR = os.path.join(UPLOAD_ROOT, "videos")
 BLOG_IMAGE_DIR = os.path.join(UPLOAD_ROOT, "blogs")
 MESSAGE_ATTACH_DIR = os.path.join(UPLOAD_ROOT, "messages")
 AI_IMAGE_DIR = os.path.join(UPLOAD_ROOT, "ai_images")
 CLOUD_PC_STORAGE_DIR = os.path.join(UPLOAD_ROOT, "cloud_pcs")
 RESEARCH_PHOTO_DIR = os.path.join(UPLOAD_ROOT, "research_photos")
+AI_APP_ASSET_DIR = os.path.join(UPLOAD_ROOT, "ai_apps")
+DOC_IMPORT_DIR = os.path.join(UPLOAD_ROOT, "doc_imports")
+PAINT_RENDER_DIR = os.path.join(UPLOAD_ROOT, "paint_renders")
 
-for path in [UPLOAD_ROOT, VIDEO_DIR, BLOG_IMAGE_DIR, MESSAGE_ATTACH_DIR, AI_IMAGE_DIR, CLOUD_PC_STORAGE_DIR, RESEARCH_PHOTO_DIR]:
+for path in [UPLOAD_ROOT, VIDEO_DIR, BLOG_IMAGE_DIR, MESSAGE_ATTACH_DIR, AI_IMAGE_DIR, CLOUD_PC_STORAGE_DIR, RESEARCH_PHOTO_DIR, AI_APP_ASSET_DIR, DOC_IMPORT_DIR, PAINT_RENDER_DIR]:
     os.makedirs(path, exist_ok=True)
 
 ALLOWED_DOC_IMPORT_EXTENSIONS = {".txt", ".md", ".markdown", ".rtf", ".pdf", ".docx"}
 MAX_DOC_IMPORT_SIZE_BYTES = int(os.environ.get("MAX_DOC_IMPORT_SIZE_BYTES", 5 * 1024 * 1024))
+# PDF/DOCX text extraction runs in separate processes, off the request thread
+DOC_IMPORT_WORKER_EXTENSIONS = {".pdf", ".docx"}
+AI_DOC_IMPORT_WORKERS = int(os.environ.get("AI_DOC_IMPORT_WORKERS", 2))
+AI_DOC_IMPORT_TIMEOUT_SECONDS = int(os.environ.get("AI_DOC_IMPORT_TIMEOUT_SECONDS", 120))
+AI_DOC_IMPORT_PAGE_TIMEOUT_SECONDS = int(os.environ.get("AI_DOC_IMPORT_PAGE_TIMEOUT_SECONDS", 30))
+AI_DOC_IMPORT_MEMORY_MB = int(os.environ.get("AI_DOC_IMPORT_MEMORY_MB", 512))
+# Storage quotas in bytes (0 disables the limit)
+USER_STORAGE_QUOTA_BYTES = int(os.environ.get("USER_STORAGE_QUOTA_BYTES", 20 * 1024 * 1024 * 1024))
+CLOUD_PC_STORAGE_QUOTA_BYTES = int(os.environ.get("CLOUD_PC_STORAGE_QUOTA_BYTES", 5 * 1024 * 1024 * 1024))
+# Limits for extracting uploaded ZIP archives into a Cloud PC
+MAX_ZIP_IMPORT_ENTRIES = int(os.environ.get("MAX_ZIP_IMPORT_ENTRIES", 10000))
+MAX_ZIP_IMPORT_BYTES = int(os.environ.get("MAX_ZIP_IMPORT_BYTES", 2 * 1024 * 1024 * 1024))
+MAX_CLOUD_PC_SNAPSHOTS = int(os.environ.get("MAX_CLOUD_PC_SNAPSHOTS", 10))
+MAX_BATCH_FILE_OPERATIONS = int(os.environ.get("MAX_BATCH_FILE_OPERATIONS", 500))
+# Text files larger than this are not added to the Cloud PC full-text index
+MAX_SEARCH_INDEX_BYTES = int(os.environ.get("MAX_SEARCH_INDEX_BYTES", 1024 * 1024))
+# Number of change-feed events kept per Cloud PC; older cursors get a reset
+CLOUD_PC_CHANGE_RETENTION = int(os.environ.get("CLOUD_PC_CHANGE_RETENTION", 1000))
+# AI app history: a full snapshot every N revisions, deltas against it in between
+AI_APP_REVISION_SNAPSHOT_INTERVAL = int(os.environ.get("AI_APP_REVISION_SNAPSHOT_INTERVAL", 10))
+MAX_AI_APP_REVISIONS = int(os.environ.get("MAX_AI_APP_REVISIONS", 200))
+# Paint op-log saves are folded into the stroke snapshot once this many ops are pending
+PAINT_COMPACT_OPS = int(os.environ.get("PAINT_COMPACT_OPS", 50))
+# Painting rasterization runs in worker processes (at most PAINT_RENDER_WORKERS at a time, each killed
+# after the timeout); rendered images are cached per revision and size
+PAINT_RENDER_WORKERS = int(os.environ.get("PAINT_RENDER_WORKERS", 2))
+PAINT_RENDER_TIMEOUT_SECONDS = int(os.environ.get("PAINT_RENDER_TIMEOUT_SECONDS", 20))
+MAX_PAINT_RENDER_SIZE = int(os.environ.get("MAX_PAINT_RENDER_SIZE", 2048))
+# In-memory member autocomplete index: how often each worker checks for users added elsewhere
+MEMBER_INDEX_RECHECK_SECONDS = int(os.environ.get("MEMBER_INDEX_RECHECK_SECONDS", 30))
+# SQLite connection profile (unused on Postgres); see apply_sqlite_pragmas
+SQLITE_JOURNAL_MODE = os.environ.get("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", 30000))
+SQLITE_MMAP_SIZE = int(os.environ.get("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))
+SQLITE_CACHE_SIZE_KB = int(os.environ.get("SQLITE_CACHE_SIZE_KB", 64 * 1024))
+SQLITE_POOL_SIZE = int(os.environ.get("SQLITE_POOL_SIZE", 8))
+# Patch-mode builder chat: how much of each earlier reply the model is shown
+AI_APP_EDIT_HISTORY_CHARS = int(os.environ.get("AI_APP_EDIT_HISTORY_CHARS", 1000))
+# Token budget for the app code shown to the builder model (about 4 characters per token)
+AI_APP_CONTEXT_TOKEN_BUDGET = int(os.environ.get("AI_APP_CONTEXT_TOKEN_BUDGET", 4000))
+# AI chat memory: recent turns are sent verbatim, older ones are folded into a rolling summary
+AI_CHAT_RECENT_TURNS = int(os.environ.get("AI_CHAT_RECENT_TURNS", 6))
+AI_CHAT_MEMORY_TOKEN_BUDGET = int(os.environ.get("AI_CHAT_MEMORY_TOKEN_BUDGET", 3000))
+AI_CHAT_SUMMARY_TOKEN_BUDGET = int(os.environ.get("AI_CHAT_SUMMARY_TOKEN_BUDGET", 600))
+# AI docs are split into paragraph chunks of about this many characters for retrieval
+AI_DOC_CHUNK_CHARS = int(os.environ.get("AI_DOC_CHUNK_CHARS", 1200))
+AI_DOC_RETRIEVAL_TOP_K = int(os.environ.get("AI_DOC_RETRIEVAL_TOP_K", 4))
+# Already-compressed formats are stored rather than deflated in ZIP exports
+ZIP_STORED_EXTENSIONS = {
+    ".zip", ".gz", ".bz2", ".xz", ".7z", ".rar", ".png", ".jpg", ".jpeg", ".gif", ".webp",
+    ".mp3", ".mp4", ".mov", ".m4a", ".ogg", ".webm", ".pdf", ".docx", ".dmg",
+}
 BUG_HISTORY_WINDOW = timedelta(days=1)
 
 app = Flask(__name__)
@@ -153,6 +241,18 @@ else:
     # Fallback to SQLite for local development
     database_uri = f"sqlite:///{DATABASE_PATH}"
 
+# SQLite is one local file shared by every gunicorn worker. Pooled connections keep their
+# page cache and mmap, so they are held rather than overflowed and discarded, and a
+# checkout waits for a free one. There is no server to drop idle connections, so no
+# pre-ping or recycling. Pragmas are applied per connection by apply_sqlite_pragmas.
+SQLITE_ENGINE_OPTIONS = {
+    "poolclass": QueuePool,
+    "pool_size": SQLITE_POOL_SIZE,
+    "max_overflow": 0,
+    "pool_timeout": 30,
+    "connect_args": {"timeout": SQLITE_BUSY_TIMEOUT_MS / 1000},
+}
+
 app.config.update(
     SECRET_KEY=os.environ.get("FLASK_SECRET_KEY", "dev-secret"),
     SQLALCHEMY_DATABASE_URI=database_uri,
@@ -164,8 +264,8 @@ app.config.update(
         "connect_args": {
             "connect_timeout": 10,
             "sslmode": "require",
-        } if DATABASE_URL else {}
-    },
+        },
+    } if DATABASE_URL else SQLITE_ENGINE_OPTIONS,
     SQLALCHEMY_TRACK_MODIFICATIONS=False,
     JSON_SORT_KEYS=False,
     SESSION_COOKIE_NAME=os.environ.get("SESSION_COOKIE_NAME", "ff_session"),
@@ -220,8 +320,32 @@ CORS(
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("friendly-friends-backend")
 
+
+def apply_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    """Tune each new SQLite connection.
+
+    WAL lets readers run alongside the single writer, and synchronous=NORMAL then fsyncs at
+    checkpoints instead of on every commit. busy_timeout makes a writer wait for the lock
+    instead of failing with "database is locked"; it is set first so the WAL switch waits too.
+    """
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute(f"PRAGMA journal_mode = {SQLITE_JOURNAL_MODE}")
+        cursor.execute("PRAGMA synchronous = NORMAL")
+        cursor.execute(f"PRAGMA mmap_size = {SQLITE_MMAP_SIZE}")
+        cursor.execute(f"PRAGMA cache_size = -{SQLITE_CACHE_SIZE_KB}")  # negative: KiB rather than pages
+        cursor.execute("PRAGMA temp_store = MEMORY")
+    finally:
+        cursor.close()
+
+
 db = SQLAlchemy(app)
 
+if not DATABASE_URL:
+    with app.app_context():
+        event.listen(db.engine, "connect", apply_sqlite_pragmas)
+
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
 OPENAI_MODEL = os.environ.get("OPENAI_MODEL", "gpt-4o-mini")
 
@@ -338,6 +462,10 @@ class Blog(TimestampMixin, db.Model):
 
 class Message(TimestampMixin, db.Model):
     __tablename__ = "messages"
+    __table_args__ = (
+        db.Index("ix_messages_sender_recipient", "sender_id", "recipient_id", "id"),
+        db.Index("ix_messages_recipient_sender", "recipient_id", "sender_id", "id"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     sender_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
@@ -356,27 +484,98 @@ class Message(TimestampMixin, db.Model):
         }
 
 
+class Conversation(TimestampMixin, db.Model):
+    """Inbox summary for one pair of users (user_low_id < user_high_id), kept current by send_message."""
+
+    __tablename__ = "conversations"
+    __table_args__ = (
+        db.UniqueConstraint("user_low_id", "user_high_id", name="uq_conversation_pair"),
+        db.Index("ix_conversations_low_recent", "user_low_id", "last_message_id"),
+        db.Index("ix_conversations_high_recent", "user_high_id", "last_message_id"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_low_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
+    user_high_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
+    last_message_id = db.Column(db.Integer, db.ForeignKey("messages.id"), nullable=True)
+    last_at = db.Column(db.DateTime, nullable=True)
+    # Messages each side has received and not read yet
+    unread_low = db.Column(db.Integer, nullable=False, default=0)
+    unread_high = db.Column(db.Integer, nullable=False, default=0)
+    # Read receipts: the newest message each side has read (a high-water mark)
+    last_read_low_id = db.Column(db.Integer, nullable=True)
+    last_read_high_id = db.Column(db.Integer, nullable=True)
+
+    def side_columns(self, user_id: int):
+        """(unread, last read, partner's last read) column names for ``user_id``'s side of the pair."""
+        if user_id == self.user_low_id:
+            return "unread_low", "last_read_low_id", "last_read_high_id"
+        return "unread_high", "last_read_high_id", "last_read_low_id"
+
+
 class Paint(TimestampMixin, db.Model):
     __tablename__ = "paints"
 
     id = db.Column(db.Integer, primary_key=True)
     owner_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
     name = db.Column(db.String(120), nullable=False)
-    data = db.Column(db.Text, nullable=False)  # JSON payload describing strokes
+    # JSON payload describing strokes; only used by paintings saved before `state` existed
+    data = db.Column(db.Text, nullable=False)
 
-    def to_dict(self):
-        return {
+    state = relationship("PaintState", uselist=False, cascade="all, delete-orphan")
+
+    def to_dict(self, include_data: bool = True):
+        payload = {
             "id": self.id,
             "owner_id": self.owner_id,
             "name": self.name,
-            "data": json.loads(self.data),
             "created_at": self.created_at.isoformat(),
             "updated_at": self.updated_at.isoformat(),
         }
+        if self.state is not None:
+            payload.update({
+                "revision": self.state.revision,
+                "stroke_count": self.state.stroke_count,
+                "width": self.state.width,
+                "height": self.state.height,
+                "thumbnail_url": f"/api/paint/{self.id}/thumbnail?v={self.state.revision}",
+                "image_url": f"/api/paint/{self.id}/image?v={self.state.revision}",
+            })
+        if include_data:
+            payload["data"] = get_paint_data(self)
+        return payload
+
+
+class PaintState(TimestampMixin, db.Model):
+    """Current strokes of a painting in the compact encoding (see encode_paint_data)."""
+
+    __tablename__ = "paint_states"
+
+    paint_id = db.Column(db.Integer, db.ForeignKey("paints.id"), primary_key=True)
+    revision = db.Column(db.Integer, nullable=False, default=1)
+    snapshot = db.Column(db.LargeBinary, nullable=False)
+    stroke_count = db.Column(db.Integer, nullable=False, default=0)
+    point_count = db.Column(db.Integer, nullable=False, default=0)
+    width = db.Column(db.Integer, nullable=True)
+    height = db.Column(db.Integer, nullable=True)
+
+
+class PaintOp(TimestampMixin, db.Model):
+    """An incremental save (new strokes, undo or clear) applied on top of the painting's snapshot."""
+
+    __tablename__ = "paint_ops"
+    __table_args__ = (db.UniqueConstraint("paint_id", "revision", name="uq_paint_op_revision"),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    paint_id = db.Column(db.Integer, db.ForeignKey("paints.id"), nullable=False)
+    revision = db.Column(db.Integer, nullable=False)
+    kind = db.Column(db.String(16), nullable=False)  # strokes, undo or clear
+    payload = db.Column(db.LargeBinary, nullable=False)
 
 
 class Todo(TimestampMixin, db.Model):
     __tablename__ = "todos"
+    __table_args__ = (db.Index("ix_todos_owner_created", "owner_id", "created_at"),)
 
     id = db.Column(db.Integer, primary_key=True)
     owner_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
@@ -402,6 +601,7 @@ class AIChat(TimestampMixin, db.Model):
     title = db.Column(db.String(255), nullable=False)
 
     messages = relationship("AIMessage", backref="chat", cascade="all, delete-orphan")
+    memory = relationship("AIChatMemory", uselist=False, cascade="all, delete-orphan")
 
     def to_dict(self, include_messages: bool = False):
         payload = {
@@ -417,6 +617,7 @@ class AIChat(TimestampMixin, db.Model):
 
 class AIMessage(TimestampMixin, db.Model):
     __tablename__ = "ai_messages"
+    __table_args__ = (db.Index("ix_ai_messages_chat", "chat_id", "id"),)
 
     id = db.Column(db.Integer, primary_key=True)
     chat_id = db.Column(db.Integer, db.ForeignKey("ai_chats.id"), nullable=False)
@@ -433,6 +634,18 @@ class AIMessage(TimestampMixin, db.Model):
         }
 
 
+class AIChatMemory(TimestampMixin, db.Model):
+    """Rolling summary of the turns of an AI chat that are no longer sent verbatim."""
+
+    __tablename__ = "ai_chat_memory"
+
+    chat_id = db.Column(db.Integer, db.ForeignKey("ai_chats.id"), primary_key=True)
+    summary = db.Column(db.Text, nullable=False, default="")
+    # Id of the newest message already folded into the summary
+    summarized_through_id = db.Column(db.Integer, nullable=False, default=0)
+    summarized_messages = db.Column(db.Integer, nullable=False, default=0)
+
+
 class AITraining(TimestampMixin, db.Model):
     __tablename__ = "ai_training"
 
@@ -492,19 +705,83 @@ class AIDoc(TimestampMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     owner_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
     title = db.Column(db.String(255), nullable=False)
+    # Only used by docs written before chunked storage; the text lives in ai_doc_chunks once `info` exists
     content = db.Column(db.Text, nullable=False)
     prompt = db.Column(db.Text, nullable=True)  # Original prompt used to generate the doc
 
-    def to_dict(self):
-        return {
+    info = relationship("AIDocInfo", uselist=False, cascade="all, delete-orphan")
+
+    def to_dict(self, include_content: bool = True):
+        payload = {
             "id": self.id,
             "owner_id": self.owner_id,
             "title": self.title,
-            "content": self.content,
             "prompt": self.prompt,
             "created_at": self.created_at.isoformat(),
             "updated_at": self.updated_at.isoformat(),
         }
+        if self.info is not None:
+            payload.update({
+                "excerpt": self.info.excerpt,
+                "size": self.info.size,
+                "chunk_count": self.info.chunk_count,
+            })
+        if include_content:
+            payload["content"] = get_ai_doc_text(self)
+        return payload
+
+
+class AIDocInfo(TimestampMixin, db.Model):
+    """Per-doc totals and list excerpt, kept up to date as chunks are written."""
+
+    __tablename__ = "ai_doc_info"
+
+    doc_id = db.Column(db.Integer, db.ForeignKey("ai_docs.id"), primary_key=True)
+    size = db.Column(db.Integer, nullable=False, default=0)  # UTF-16 code units, as the editor counts them
+    chunk_count = db.Column(db.Integer, nullable=False, default=0)
+    excerpt = db.Column(db.String(300), nullable=False, default="")
+
+
+class AIDocChunk(TimestampMixin, db.Model):
+    """One paragraph chunk of an AI doc, in `position` order; also the unit of retrieval and of edits."""
+
+    __tablename__ = "ai_doc_chunks"
+    __table_args__ = (db.Index("ix_ai_doc_chunks_doc_position", "doc_id", "position"),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    doc_id = db.Column(db.Integer, db.ForeignKey("ai_docs.id"), nullable=False)
+    owner_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False, index=True)
+    position = db.Column(db.Integer, nullable=False)
+    content_hash = db.Column(db.String(64), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+
+
+class AIDocImport(TimestampMixin, db.Model):
+    """Progress of a PDF/DOCX import whose text is extracted in a worker process."""
+
+    __tablename__ = "ai_doc_imports"
+
+    id = db.Column(db.Integer, primary_key=True)
+    owner_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False, index=True)
+    doc_id = db.Column(db.Integer, db.ForeignKey("ai_docs.id"), nullable=True)
+    filename = db.Column(db.String(255), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default="queued")  # queued, processing, done, partial, failed
+    pages_done = db.Column(db.Integer, nullable=False, default=0)
+    pages_total = db.Column(db.Integer, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "doc_id": self.doc_id,
+            "filename": self.filename,
+            "status": self.status,
+            "pages_done": self.pages_done,
+            "pages_total": self.pages_total,
+            "error": self.error,
+            "created_at": self.created_at.isoformat(),
+            "updated_at": self.updated_at.isoformat(),
+        }
 
 
 class AIImage(TimestampMixin, db.Model):
@@ -591,6 +868,108 @@ class CloudPC(TimestampMixin, db.Model):
         }
 
 
+class CloudPCFile(TimestampMixin, db.Model):
+    """Catalog entry mirroring one file or directory in a Cloud PC's storage."""
+
+    __tablename__ = "cloud_pc_files"
+
+    id = db.Column(db.Integer, primary_key=True)
+    pc_id = db.Column(db.Integer, db.ForeignKey("cloud_pcs.id"), nullable=False)
+    path = db.Column(db.String(1024), nullable=False)  # e.g. "/My Paintings/Test.png"
+    parent = db.Column(db.String(1024), nullable=False)  # e.g. "/My Paintings"
+    name = db.Column(db.String(255), nullable=False)
+    extension = db.Column(db.String(32), nullable=True)  # lowercase, without the dot
+    is_dir = db.Column(db.Boolean, default=False, nullable=False)
+    size = db.Column(db.BigInteger, default=0, nullable=False)
+    mtime = db.Column(db.DateTime, nullable=False)
+    mime_type = db.Column(db.String(255), nullable=True)
+    content_hash = db.Column(db.String(64), nullable=True)  # sha256 hex digest, files only
+
+    __table_args__ = (
+        db.UniqueConstraint('pc_id', 'path', name='unique_cloud_pc_file_path'),
+        db.Index('ix_cloud_pc_files_pc_parent', 'pc_id', 'parent'),
+        db.Index('ix_cloud_pc_files_pc_extension', 'pc_id', 'extension'),
+    )
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "path": self.path,
+            "type": "directory" if self.is_dir else "file",
+            "size": self.size,
+            "modified": self.mtime.isoformat() if self.mtime else None,
+            "mime_type": self.mime_type,
+            "content_hash": self.content_hash,
+        }
+
+
+class CloudPCFileText(db.Model):
+    """Extracted text of a cataloged Cloud PC file, backing the full-text index."""
+
+    __tablename__ = "cloud_pc_file_text"
+
+    # Keyed by catalog row, so renames and moves never need re-indexing
+    file_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    pc_id = db.Column(db.Integer, db.ForeignKey("cloud_pcs.id"), nullable=False, index=True)
+    content_hash = db.Column(db.String(64), nullable=True)
+    body = db.Column(db.Text, nullable=False, default="")
+
+
+class CloudPCChangeCounter(db.Model):
+    """Per-PC change-feed version; bumped with an atomic UPDATE so versions commit in order."""
+
+    __tablename__ = "cloud_pc_change_counters"
+
+    pc_id = db.Column(db.Integer, db.ForeignKey("cloud_pcs.id"), primary_key=True, autoincrement=False)
+    version = db.Column(db.BigInteger, default=0, nullable=False)
+
+
+class CloudPCChange(TimestampMixin, db.Model):
+    """One entry of a Cloud PC's storage change feed."""
+
+    __tablename__ = "cloud_pc_changes"
+
+    id = db.Column(db.Integer, primary_key=True)
+    pc_id = db.Column(db.Integer, db.ForeignKey("cloud_pcs.id"), nullable=False)
+    version = db.Column(db.BigInteger, nullable=False)
+    event = db.Column(db.String(16), nullable=False)  # created, modified, renamed, deleted, reset
+    path = db.Column(db.String(1024), nullable=False)
+    old_path = db.Column(db.String(1024), nullable=True)  # renamed only
+
+    __table_args__ = (
+        db.UniqueConstraint('pc_id', 'version', name='unique_cloud_pc_change_version'),
+    )
+
+    def to_dict(self):
+        return {
+            "version": self.version,
+            "event": self.event,
+            "path": self.path,
+            "old_path": self.old_path,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+        }
+
+
+class CloudPCSnapshot(TimestampMixin, db.Model):
+    __tablename__ = "cloud_pc_snapshots"
+
+    id = db.Column(db.Integer, primary_key=True)
+    pc_id = db.Column(db.Integer, db.ForeignKey("cloud_pcs.id"), nullable=False, index=True)
+    name = db.Column(db.String(255), nullable=False)
+    file_count = db.Column(db.Integer, default=0, nullable=False)
+    total_bytes = db.Column(db.BigInteger, default=0, nullable=False)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "pc_id": self.pc_id,
+            "name": self.name,
+            "file_count": self.file_count,
+            "total_bytes": self.total_bytes,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+        }
+
+
 class AIApp(TimestampMixin, db.Model):
     __tablename__ = "ai_apps"
 
@@ -602,22 +981,72 @@ class AIApp(TimestampMixin, db.Model):
     is_live = db.Column(db.Boolean, default=False, nullable=False)  # Visible to community
     live_at = db.Column(db.DateTime, nullable=True)  # When it went live
 
-    def to_dict(self):
-        return {
+    def to_dict(self, include_code: bool = True):
+        data = {
             "id": self.id,
             "developer_id": self.developer_id,
             "name": self.name,
             "description": self.description,
-            "code": self.code,
             "is_live": self.is_live,
             "live_at": self.live_at.isoformat() if self.live_at else None,
             "created_at": self.created_at.isoformat() if self.created_at else None,
             "updated_at": self.updated_at.isoformat() if self.updated_at else None,
         }
+        if include_code:
+            data["code"] = self.code
+        return data
+
+
+class AIAppAsset(TimestampMixin, db.Model):
+    """Current published build of an app's code, stored on disk with precompressed variants."""
+
+    __tablename__ = "ai_app_assets"
+
+    app_id = db.Column(db.Integer, db.ForeignKey("ai_apps.id"), primary_key=True, autoincrement=False)
+    code_hash = db.Column(db.String(64), nullable=False)
+    size = db.Column(db.Integer, default=0, nullable=False)
+    gzip_size = db.Column(db.Integer, nullable=True)
+    brotli_size = db.Column(db.Integer, nullable=True)
+
+    @property
+    def url(self) -> str:
+        return f"/apps/{self.app_id}/v/{self.code_hash[:16]}/index.html"
+
+
+class AIAppRevision(TimestampMixin, db.Model):
+    """One saved version of an app's code, stored as a full snapshot or a delta against one."""
+
+    __tablename__ = "ai_app_revisions"
+
+    id = db.Column(db.Integer, primary_key=True)
+    app_id = db.Column(db.Integer, db.ForeignKey("ai_apps.id"), nullable=False)
+    revision = db.Column(db.Integer, nullable=False)
+    kind = db.Column(db.String(8), nullable=False)  # "full" or "delta"
+    base_revision = db.Column(db.Integer, nullable=True)  # full snapshot a delta applies to
+    data = db.Column(db.LargeBinary, nullable=False)  # zlib-compressed code or delta ops
+    code_hash = db.Column(db.String(64), nullable=False)
+    size = db.Column(db.Integer, default=0, nullable=False)  # uncompressed code size
+    source = db.Column(db.String(32), nullable=True)  # edit, generate, restore
+
+    __table_args__ = (
+        db.UniqueConstraint('app_id', 'revision', name='unique_ai_app_revision'),
+    )
+
+    def to_dict(self):
+        return {
+            "revision": self.revision,
+            "kind": self.kind,
+            "code_hash": self.code_hash,
+            "size": self.size,
+            "stored_bytes": len(self.data) if self.data is not None else 0,
+            "source": self.source,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+        }
 
 
 class AIAppChat(TimestampMixin, db.Model):
     __tablename__ = "ai_app_chats"
+    __table_args__ = (db.Index("ix_ai_app_chats_app_user", "app_id", "user_id", "created_at"),)
 
     id = db.Column(db.Integer, primary_key=True)
     app_id = db.Column(db.Integer, db.ForeignKey("ai_apps.id"), nullable=False)
@@ -707,6 +1136,7 @@ class ResearchParticipant(TimestampMixin, db.Model):
 
 class ResearchSubmission(TimestampMixin, db.Model):
     __tablename__ = "research_submissions"
+    __table_args__ = (db.Index("ix_research_submissions_research", "research_id", "created_at"),)
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
@@ -745,6 +1175,7 @@ class ResearchSubmissionPhoto(TimestampMixin, db.Model):
 
 class Reminder(TimestampMixin, db.Model):
     __tablename__ = "reminders"
+    __table_args__ = (db.Index("ix_reminders_user_time", "user_id", "reminder_time"),)
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
@@ -799,6 +1230,64 @@ class UserSession(TimestampMixin, db.Model):
         return datetime.utcnow() > self.expires_at
 
 
+class StorageLedger(db.Model):
+    """Byte-exact storage usage per user and per Cloud PC."""
+
+    __tablename__ = "storage_ledger"
+
+    id = db.Column(db.Integer, primary_key=True)
+    scope = db.Column(db.String(20), nullable=False)  # "user" or "cloud_pc"
+    scope_id = db.Column(db.Integer, nullable=False)
+    bytes_used = db.Column(db.BigInteger, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (db.UniqueConstraint('scope', 'scope_id', name='unique_storage_ledger_scope'),)
+
+    def to_dict(self):
+        return {
+            "scope": self.scope,
+            "scope_id": self.scope_id,
+            "bytes_used": self.bytes_used,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None,
+        }
+
+
+class SchemaMigration(db.Model):
+    """One applied entry of SCHEMA_MIGRATIONS."""
+
+    __tablename__ = "schema_migrations"
+
+    version = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    name = db.Column(db.String(255), nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+
+class SearchDocument(db.Model):
+    """Searchable text of one blog, todo, message, AI doc (or doc chunk) or AI chat message.
+
+    Rows are written by ORM events on the source models; ``result_type``/``result_id`` name
+    what a hit links to, and the owner/viewer/public columns decide who may see it.
+    """
+
+    __tablename__ = "search_documents"
+    __table_args__ = (
+        db.UniqueConstraint("source", "source_id", name="uq_search_document_source"),
+        db.Index("ix_search_documents_result", "result_type", "result_id"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    source = db.Column(db.String(32), nullable=False)
+    source_id = db.Column(db.Integer, nullable=False)
+    result_type = db.Column(db.String(16), nullable=False)
+    result_id = db.Column(db.Integer, nullable=False)
+    owner_id = db.Column(db.Integer, nullable=False, index=True)
+    # Second participant who may see the row (message recipients)
+    viewer_id = db.Column(db.Integer, nullable=True, index=True)
+    is_public = db.Column(db.Boolean, nullable=False, default=False)
+    title = db.Column(db.String(255), nullable=False, default="")
+    body = db.Column(db.Text, nullable=False, default="")
+
+
 ###############################################################################
 # Helper utilities                                                             #
 ###############################################################################
@@ -901,6 +1390,167 @@ def ensure_json_request() -> dict:
     return data
 
 
+class StorageQuotaExceeded(Exception):
+    """Raised when a write would push a user or Cloud PC over its storage quota."""
+
+
+def get_storage_used(scope: str, scope_id: int) -> int:
+    bytes_used = (
+        db.session.query(StorageLedger.bytes_used)
+        .filter_by(scope=scope, scope_id=scope_id)
+        .scalar()
+    )
+    return bytes_used or 0
+
+
+def _ensure_ledger_row(scope: str, scope_id: int) -> None:
+    if db.session.query(StorageLedger.id).filter_by(scope=scope, scope_id=scope_id).first():
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.add(StorageLedger(scope=scope, scope_id=scope_id, bytes_used=0))
+    except IntegrityError:
+        pass  # Another worker created the row first
+
+
+def _charge_ledger(scope: str, scope_id: int, delta: int, quota: int = 0) -> bool:
+    """Atomically add `delta` bytes to a ledger row.
+
+    Growth is refused (returns False) when it would exceed `quota`; the check and
+    the increment happen in one UPDATE so concurrent workers cannot both pass it.
+    """
+    _ensure_ledger_row(scope, scope_id)
+    new_total = StorageLedger.bytes_used + delta
+    stmt = (
+        update(StorageLedger)
+        .where(StorageLedger.scope == scope, StorageLedger.scope_id == scope_id)
+        .values(bytes_used=case((new_total < 0, 0), else_=new_total), updated_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    if delta > 0 and quota:
+        stmt = stmt.where(new_total <= quota)
+    return db.session.execute(stmt).rowcount > 0
+
+
+def record_storage_change(user_id: int, delta: int, pc_id: Optional[int] = None, enforce_quota: bool = True) -> None:
+    """Apply a byte delta to the user's ledger (and the Cloud PC's, if given).
+
+    Runs inside the caller's transaction; raises StorageQuotaExceeded if a quota
+    would be exceeded, in which case the caller should roll back and clean up.
+    """
+    if not delta:
+        return
+    if pc_id is not None:
+        quota = CLOUD_PC_STORAGE_QUOTA_BYTES if enforce_quota else 0
+        if not _charge_ledger("cloud_pc", pc_id, delta, quota):
+            raise StorageQuotaExceeded("This Cloud PC is out of storage space.")
+        # Keep the legacy MB counter derived from the exact byte total
+        db.session.execute(
+            update(CloudPC)
+            .where(CloudPC.id == pc_id)
+            .values(storage_used_mb=get_storage_used("cloud_pc", pc_id) // (1024 * 1024))
+            .execution_options(synchronize_session=False)
+        )
+    quota = USER_STORAGE_QUOTA_BYTES if enforce_quota else 0
+    if not _charge_ledger("user", user_id, delta, quota):
+        raise StorageQuotaExceeded("You have reached your storage limit.")
+
+
+def remaining_storage_bytes(user_id: int, pc_id: Optional[int] = None) -> Optional[int]:
+    """Bytes that may still be written, or None when no quota applies."""
+    limits = []
+    if USER_STORAGE_QUOTA_BYTES:
+        limits.append(USER_STORAGE_QUOTA_BYTES - get_storage_used("user", user_id))
+    if pc_id is not None and CLOUD_PC_STORAGE_QUOTA_BYTES:
+        limits.append(CLOUD_PC_STORAGE_QUOTA_BYTES - get_storage_used("cloud_pc", pc_id))
+    if not limits:
+        return None
+    return max(0, min(limits))
+
+
+def stream_to_temp_file(stream, dest_path: str, max_bytes: Optional[int] = None):
+    """Copy a stream next to `dest_path` in chunks.
+
+    Returns (temp_path, size, sha256 hex digest); the caller moves the temp file
+    into place with os.replace once the write has been accepted. Raises
+    StorageQuotaExceeded as soon as more than `max_bytes` arrive.
+    """
+    tmp_path = f"{dest_path}.{uuid.uuid4().hex}.part"
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(tmp_path, "wb") as out:
+            while True:
+                chunk = stream.read(1024 * 1024)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if max_bytes is not None and size > max_bytes:
+                    raise StorageQuotaExceeded("Upload exceeds your remaining storage space.")
+                digest.update(chunk)
+                out.write(chunk)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return tmp_path, size, digest.hexdigest()
+
+
+def save_user_upload(stream, dest_path: str, user_id: int, pc_id: Optional[int] = None):
+    """Stream an upload to disk under quota and charge it to the storage ledger.
+
+    Overwrites are charged only for growth. Returns (size, sha256 hex digest).
+    """
+    previous_size = os.path.getsize(dest_path) if os.path.isfile(dest_path) else 0
+    remaining = remaining_storage_bytes(user_id, pc_id)
+    max_bytes = None if remaining is None else remaining + previous_size
+    if max_bytes is not None and request.content_length and request.content_length > max_bytes + 64 * 1024:
+        # Reject before reading the body; the slack covers multipart framing
+        raise StorageQuotaExceeded("Upload exceeds your remaining storage space.")
+
+    tmp_path, size, content_hash = stream_to_temp_file(stream, dest_path, max_bytes=max_bytes)
+    try:
+        record_storage_change(user_id, size - previous_size, pc_id=pc_id)
+        os.replace(tmp_path, dest_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return size, content_hash
+
+
+def write_user_bytes(dest_path: str, data: bytes, user_id: int, pc_id: Optional[int] = None) -> str:
+    """Atomically write `data` to `dest_path`, charging the size change to the ledger.
+
+    Returns the sha256 hex digest of the data.
+    """
+    previous_size = os.path.getsize(dest_path) if os.path.isfile(dest_path) else 0
+    record_storage_change(user_id, len(data) - previous_size, pc_id=pc_id)
+    tmp_path = f"{dest_path}.{uuid.uuid4().hex}.part"
+    try:
+        with open(tmp_path, "wb") as out:
+            out.write(data)
+        os.replace(tmp_path, dest_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return hashlib.sha256(data).hexdigest()
+
+
+def release_user_file(file_path: str, user_id: int, pc_id: Optional[int] = None) -> None:
+    """Delete a stored file and credit its size back to the ledger."""
+    if not os.path.isfile(file_path):
+        return
+    size = os.path.getsize(file_path)
+    os.remove(file_path)
+    record_storage_change(user_id, -size, pc_id=pc_id)
+
+
+def storage_quota_response(error: StorageQuotaExceeded):
+    return jsonify({"error": str(error), "code": "storage_quota_exceeded"}), 413
+
+
 ###############################################################################
 # AI helper functions                                                          #
 ###############################################################################
@@ -954,6 +1604,388 @@ def transform_error_for_user(raw_error: str) -> str:
         return "An unexpected error occurred. Our team has been notified."
 
 
+def estimate_tokens(text: str) -> int:
+    """Rough token count for prompt budgeting (about 4 characters per token)."""
+    return (len(text or "") + 3) // 4
+
+
+def _fallback_chat_summary(summary: str, messages: List["AIMessage"], budget_chars: int) -> str:
+    """Extractive summary used when the model is unavailable: keep the newest lines that fit."""
+    lines = [line for line in summary.splitlines() if line.strip()]
+    for message in messages:
+        speaker = "User" if message.role == "user" else "Assistant"
+        text = " ".join(message.content.split())
+        if len(text) > 200:
+            text = text[:197] + "..."
+        lines.append(f"- {speaker}: {text}")
+    kept: List[str] = []
+    used = 0
+    for line in reversed(lines):
+        if used + len(line) + 1 > budget_chars:
+            break
+        kept.append(line)
+        used += len(line) + 1
+    return "\n".join(reversed(kept))
+
+
+def summarize_ai_chat_turns(summary: str, messages: List["AIMessage"]) -> str:
+    """Fold ``messages`` into the running ``summary`` of a chat, staying within the summary budget."""
+    budget_chars = AI_CHAT_SUMMARY_TOKEN_BUDGET * 4
+    if get_openai_client() is None:
+        return _fallback_chat_summary(summary, messages, budget_chars)
+
+    per_message_chars = max(AI_CHAT_MEMORY_TOKEN_BUDGET * 4 // max(len(messages), 1), 400)
+    transcript = "\n\n".join(
+        f"{'User' if m.role == 'user' else 'Assistant'}: {m.content[:per_message_chars]}"
+        for m in messages
+    )
+    prompt = (
+        f"Current summary:\n{summary or '(none)'}\n\n"
+        f"New conversation turns:\n{transcript}\n\n"
+        f"Write the updated summary in at most {AI_CHAT_SUMMARY_TOKEN_BUDGET * 3 // 4} words."
+    )
+    instructions = (
+        "You maintain the memory of a chat between a user and an assistant. Merge the new turns "
+        "into the current summary. Keep facts about the user, decisions, open questions and "
+        "anything the assistant promised; drop small talk. Reply with the summary only."
+    )
+    try:
+        updated = call_openai([{"role": "user", "content": prompt}], system_prompt=instructions)
+    except Exception as e:
+        logger.warning(f"Chat summary update failed, using extractive fallback: {e}")
+        return _fallback_chat_summary(summary, messages, budget_chars)
+    return updated[:budget_chars]
+
+
+def build_ai_chat_memory(chat: "AIChat") -> Tuple[str, List[dict]]:
+    """Return ``(summary, recent_messages)`` to send with the next message of ``chat``.
+
+    The last ``AI_CHAT_RECENT_TURNS`` turns are kept verbatim; anything older is folded into
+    the chat's rolling summary, a batch at a time, so the prompt stays near a constant size
+    however long the chat grows. Call before the new user message is added to the session.
+    """
+    memory = chat.memory
+    if memory is None:
+        memory = AIChatMemory(chat_id=chat.id, summary="", summarized_through_id=0, summarized_messages=0)
+        chat.memory = memory
+
+    pending = (
+        db.session.query(AIMessage)
+        .filter(AIMessage.chat_id == chat.id, AIMessage.id > memory.summarized_through_id)
+        .order_by(AIMessage.id)
+        .all()
+    )
+    recent_limit = max(AI_CHAT_RECENT_TURNS, 1) * 2
+    # Fold a few turns at a time rather than one message per request
+    fold_count = len(pending) - recent_limit if len(pending) - recent_limit >= max(recent_limit // 2, 2) else 0
+
+    # Each verbatim message gets at most half of the budget so one huge reply cannot crowd out the rest
+    message_chars = AI_CHAT_MEMORY_TOKEN_BUDGET * 2
+    summary_tokens = estimate_tokens(memory.summary)
+    verbatim_tokens = sum(estimate_tokens(m.content[:message_chars]) for m in pending[fold_count:])
+    while summary_tokens + verbatim_tokens > AI_CHAT_MEMORY_TOKEN_BUDGET and len(pending) - fold_count > 2:
+        verbatim_tokens -= estimate_tokens(pending[fold_count].content[:message_chars])
+        fold_count += 1
+
+    if fold_count:
+        to_fold = pending[:fold_count]
+        summary = memory.summary
+        # Chats that predate the memory layer can have a long backlog; fold it in budget-sized batches
+        batch: List[AIMessage] = []
+        batch_tokens = 0
+        for message in to_fold:
+            batch.append(message)
+            batch_tokens += estimate_tokens(message.content)
+            if batch_tokens >= AI_CHAT_MEMORY_TOKEN_BUDGET:
+                summary = summarize_ai_chat_turns(summary, batch)
+                batch, batch_tokens = [], 0
+        if batch:
+            summary = summarize_ai_chat_turns(summary, batch)
+        memory.summary = summary
+        memory.summarized_through_id = to_fold[-1].id
+        memory.summarized_messages = (memory.summarized_messages or 0) + len(to_fold)
+
+    recent = [
+        {"role": m.role, "content": m.content[:message_chars]}
+        for m in pending[fold_count:]
+        if m.role in ("user", "assistant")
+    ]
+    return memory.summary, recent
+
+
+_DOC_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_DOC_STOPWORDS = {
+    "the", "and", "for", "with", "this", "that", "to", "of", "in", "on", "is", "it", "an", "be", "are",
+    "was", "were", "as", "at", "by", "or", "from", "but", "not", "what", "which", "who", "how", "my",
+    "me", "you", "your", "we", "our", "do", "does", "did", "can", "about", "please", "tell", "there",
+}
+_ai_doc_index_cache = OrderedDict()
+
+
+def _doc_tokens(text_value: str) -> List[str]:
+    tokens = []
+    for token in _DOC_TOKEN_RE.findall(text_value.lower()):
+        if len(token) < 2 or token in _DOC_STOPWORDS:
+            continue
+        tokens.append(token[:-1] if len(token) > 3 and token.endswith("s") else token)
+    return tokens
+
+
+def split_ai_doc_text(content: str) -> List[str]:
+    """Split a document into paragraph chunks of about AI_DOC_CHUNK_CHARS.
+
+    Separators stay attached to the chunk before them, so ``"".join(chunks) == content``.
+    """
+    parts = re.split(r"(\n[ \t]*\n\s*)", content)
+    paragraphs = [parts[i] + (parts[i + 1] if i + 1 < len(parts) else "") for i in range(0, len(parts), 2)]
+
+    chunks, current = [], ""
+    for paragraph in paragraphs:
+        # Very long paragraphs (e.g. PDF text without blank lines) are cut at a line or word break
+        while len(paragraph) > AI_DOC_CHUNK_CHARS * 2:
+            cut = paragraph.rfind("\n", 0, AI_DOC_CHUNK_CHARS) + 1 or paragraph.rfind(" ", 0, AI_DOC_CHUNK_CHARS) + 1
+            if cut <= 0:
+                cut = AI_DOC_CHUNK_CHARS
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(paragraph[:cut])
+            paragraph = paragraph[cut:]
+        current += paragraph
+        if len(current) >= AI_DOC_CHUNK_CHARS:
+            chunks.append(current)
+            current = ""
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+AI_DOC_CHUNK_POSITION_GAP = 1024
+
+
+def _utf16_length(text_value: str) -> int:
+    """Length as the browser counts it, so clients can slice loaded text back into chunks."""
+    return len(text_value.encode("utf-16-le")) // 2
+
+
+def _ai_doc_excerpt(text_value: str) -> str:
+    return " ".join(text_value[:600].split())[:200]
+
+
+def _ai_doc_chunk_meta(row: "AIDocChunk") -> dict:
+    return {"id": row.id, "hash": row.content_hash, "length": _utf16_length(row.body)}
+
+
+def ai_doc_chunk_rows(doc_id: int, with_body: bool = True) -> List["AIDocChunk"]:
+    query = db.session.query(AIDocChunk).filter_by(doc_id=doc_id).order_by(AIDocChunk.position)
+    if not with_body:
+        query = query.options(defer(AIDocChunk.body))
+    return query.all()
+
+
+def get_ai_doc_text(doc: "AIDoc") -> str:
+    if doc.info is None:
+        return doc.content
+    rows = db.session.query(AIDocChunk.body).filter_by(doc_id=doc.id).order_by(AIDocChunk.position)
+    return "".join(body for (body,) in rows)
+
+
+def replace_ai_doc_chunks(doc: "AIDoc", rows: List["AIDocChunk"], start: int, end: int, new_text: str) -> List["AIDocChunk"]:
+    """Replace ``rows[start:end]`` (the doc's chunks in order) with ``new_text``, split into chunks.
+
+    Only the replaced range is written: rows are reused in place where possible and new
+    rows get positions in the gap between their neighbours, so the rest of the document is
+    untouched unless that gap is exhausted. ``rows`` is updated to the new order and the
+    rows now covering the range are returned.
+    """
+    pieces = split_ai_doc_text(new_text) if new_text else []
+    old = rows[start:end]
+    size_delta = sum(_utf16_length(piece) for piece in pieces) - sum(_utf16_length(row.body) for row in old)
+
+    # Same number of chunks: reused rows keep their positions
+    positions = None
+    if len(pieces) != len(old):
+        lower = rows[start - 1].position if start > 0 else None
+        upper = rows[end].position if end < len(rows) else None
+        span = AI_DOC_CHUNK_POSITION_GAP * (len(pieces) + 1)
+        if lower is None:
+            lower = (upper - span) if upper is not None else 0
+        if upper is None:
+            upper = lower + span
+        step = (upper - lower) // (len(pieces) + 1)
+        positions = [lower + step * (number + 1) for number in range(len(pieces))]
+
+    new_rows = []
+    for number, body in enumerate(pieces):
+        content_hash = hashlib.sha256(body.encode("utf-8")).hexdigest()
+        if number < len(old):
+            row = old[number]
+            if row.content_hash != content_hash:
+                row.body, row.content_hash = body, content_hash
+        else:
+            row = AIDocChunk(doc_id=doc.id, owner_id=doc.owner_id, position=0, content_hash=content_hash, body=body)
+            db.session.add(row)
+        if positions is not None:
+            row.position = positions[number]
+        new_rows.append(row)
+    for row in old[len(pieces):]:
+        db.session.delete(row)
+    rows[start:end] = new_rows
+
+    if positions is not None and len(set(row.position for row in rows)) != len(rows):
+        # No room left between the neighbours: respace the whole document
+        for number, row in enumerate(rows):
+            if row.position != (number + 1) * AI_DOC_CHUNK_POSITION_GAP:
+                row.position = (number + 1) * AI_DOC_CHUNK_POSITION_GAP
+
+    doc.info.size += size_delta
+    doc.info.chunk_count = len(rows)
+    if start == 0:
+        doc.info.excerpt = _ai_doc_excerpt(rows[0].body if rows else "")
+    doc.updated_at = datetime.utcnow()
+    return new_rows
+
+
+def delete_ai_doc_chunks(doc_id: int) -> None:
+    """Bulk-delete a doc's chunks along with their search rows (bulk deletes skip ORM events)."""
+    db.session.query(AIDocChunk).filter_by(doc_id=doc_id).delete(synchronize_session=False)
+    db.session.query(SearchDocument).filter_by(source="ai_doc_chunk", result_id=doc_id).delete(synchronize_session=False)
+
+
+def ensure_ai_doc_chunked(doc: "AIDoc") -> None:
+    """Move a doc written before chunked storage into ai_doc_chunks (once)."""
+    if doc.info is not None:
+        return
+    delete_ai_doc_chunks(doc.id)
+    doc.info = AIDocInfo(doc_id=doc.id, size=0, chunk_count=0, excerpt="")
+    replace_ai_doc_chunks(doc, [], 0, 0, doc.content or "")
+    doc.content = ""
+
+
+def set_ai_doc_text(doc: "AIDoc", text_value: str) -> None:
+    """Store the full text of ``doc``, rewriting only the chunks between the unchanged head and tail."""
+    ensure_ai_doc_chunked(doc)
+    rows = ai_doc_chunk_rows(doc.id)
+    start, head = 0, 0
+    while start < len(rows) and text_value.startswith(rows[start].body, head):
+        head += len(rows[start].body)
+        start += 1
+    end, tail = len(rows), len(text_value)
+    while end > start and tail - len(rows[end - 1].body) >= head and text_value.endswith(rows[end - 1].body, head, tail):
+        tail -= len(rows[end - 1].body)
+        end -= 1
+    if start == end and head == tail:
+        return
+    replace_ai_doc_chunks(doc, rows, start, end, text_value[head:tail])
+
+
+def chunk_legacy_ai_docs(batch_size: int = 200) -> int:
+    """Convert docs that still keep their text in ``AIDoc.content``, committing per batch.
+
+    Converted docs drop out of the query, so an interrupted run resumes where it stopped.
+    """
+    converted = 0
+    while True:
+        legacy = (
+            db.session.query(AIDoc)
+            .filter(~db.session.query(AIDocInfo.doc_id).filter(AIDocInfo.doc_id == AIDoc.id).exists())
+            .order_by(AIDoc.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not legacy:
+            return converted
+        for doc in legacy:
+            ensure_ai_doc_chunked(doc)
+        db.session.commit()
+        converted += len(legacy)
+
+
+def append_ai_doc_text(doc: "AIDoc", text_value: str) -> None:
+    """Add text to the end of ``doc`` as new chunks, on a new line."""
+    ensure_ai_doc_chunked(doc)
+    rows = ai_doc_chunk_rows(doc.id, with_body=False)
+    text_value = f"\n{text_value}" if rows else text_value.lstrip()
+    replace_ai_doc_chunks(doc, rows, len(rows), len(rows), text_value)
+
+
+class _DocRetrievalIndex:
+    """BM25 over one user's doc chunks, kept as an inverted index so a query only touches matching postings."""
+
+    def __init__(self, rows: List[tuple]):
+        import math
+        self.chunk_ids = [row[0] for row in rows]
+        term_counts = [Counter(_doc_tokens(row[1])) for row in rows]
+        lengths = [sum(counts.values()) or 1 for counts in term_counts]
+        average_length = (sum(lengths) / len(lengths)) if lengths else 1
+        document_frequency = Counter()
+        for counts in term_counts:
+            document_frequency.update(counts.keys())
+
+        total = len(rows)
+        self.postings = {}
+        for number, (counts, length) in enumerate(zip(term_counts, lengths)):
+            norm = 1.2 * (0.25 + 0.75 * length / average_length)
+            for term, frequency in counts.items():
+                idf = math.log(1 + (total - document_frequency[term] + 0.5) / (document_frequency[term] + 0.5))
+                self.postings.setdefault(term, []).append((number, idf * frequency * 2.2 / (frequency + norm)))
+
+    def search(self, query: str, top_k: int) -> List[Tuple[int, float]]:
+        import heapq
+        scores = {}
+        for term in set(_doc_tokens(query)):
+            for number, weight in self.postings.get(term, ()):
+                scores[number] = scores.get(number, 0.0) + weight
+        best = heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+        return [(self.chunk_ids[number], score) for number, score in best]
+
+
+def get_ai_doc_retrieval_index(owner_id: int) -> _DocRetrievalIndex:
+    """Return the retrieval index for a user's docs, rebuilding it only when their chunks changed."""
+    cached = _ai_doc_index_cache.get(owner_id)
+    signature = tuple(db.session.query(
+        db.func.count(AIDocChunk.id), db.func.max(AIDocChunk.id), db.func.max(AIDocChunk.updated_at)
+    ).filter(AIDocChunk.owner_id == owner_id).one())
+    if cached is not None and cached[0] == signature:
+        _ai_doc_index_cache.move_to_end(owner_id)
+        return cached[1]
+
+    rows = db.session.query(AIDocChunk.id, AIDocChunk.body).filter_by(owner_id=owner_id).all()
+    index = _DocRetrievalIndex(rows)
+    _ai_doc_index_cache[owner_id] = (signature, index)
+    _ai_doc_index_cache.move_to_end(owner_id)
+    while len(_ai_doc_index_cache) > 32:
+        _ai_doc_index_cache.popitem(last=False)
+    return index
+
+
+def search_ai_docs(owner_id: int, query: str, top_k: Optional[int] = None) -> List[dict]:
+    """Return the doc passages that best match ``query``, best first."""
+    hits = get_ai_doc_retrieval_index(owner_id).search(query, top_k or AI_DOC_RETRIEVAL_TOP_K)
+    if not hits:
+        return []
+    rows = (
+        db.session.query(AIDocChunk.id, AIDocChunk.doc_id, AIDocChunk.position, AIDocChunk.body, AIDoc.title)
+        .join(AIDoc, AIDoc.id == AIDocChunk.doc_id)
+        .filter(AIDocChunk.id.in_([chunk_id for chunk_id, _ in hits]))
+        .all()
+    )
+    by_id = {row.id: row for row in rows}
+    passages = []
+    for chunk_id, score in hits:
+        row = by_id.get(chunk_id)
+        if row is None:
+            continue
+        passages.append({
+            "doc_id": row.doc_id,
+            "title": row.title,
+            "position": row.position,
+            "text": row.body.strip(),
+            "score": round(score, 3),
+        })
+    return passages
+
+
 def gather_training_context(message: str) -> List[str]:
     """Return training snippets that match keywords in the user's message."""
     keywords = [word.lower() for word in message.split() if len(word) > 3][:5]
@@ -1005,13 +2037,9 @@ def search_external_sources(message: str) -> List[str]:
     except Exception:
         pass
 
-    blog_matches = (
-        db.session.query(Blog)
-        .filter(Blog.body.ilike(f"%{message}%"))
-        .limit(2)
-        .all()
-    )
-    for blog in blog_matches:
+    blog_ids = [hit["id"] for hit in search_content(None, message, types=("blog",), limit=2)]
+    blogs = {blog.id: blog for blog in db.session.query(Blog).filter(Blog.id.in_(blog_ids))} if blog_ids else {}
+    for blog in (blogs[blog_id] for blog_id in blog_ids if blog_id in blogs):
         results.append(f"Blog: {blog.title} - {blog.body[:200]}...")
 
     return results
@@ -1398,43 +2426,197 @@ def me():
 ###############################################################################
 
 
+class _MemberIndex:
+    """Sorted prefix index over usernames and emails, plus the member ids newest first.
+
+    Keys are the lowercased username, email and every word start inside them
+    ("mary_jane" is found by "ja"), so a lookup is a bisect plus a short scan.
+    """
+
+    def __init__(self, rows):
+        self.members = {}
+        self.keys = []
+        for row in rows:
+            self.keys.extend(self._store(row.id, row.username, row.email, row.is_admin))
+        self.keys.sort()
+        self.ids_desc = sorted(self.members, reverse=True)
+
+    @staticmethod
+    def _words(username: str, email: str) -> set:
+        words = set()
+        for value in (username.lower(), email.lower()):
+            words.add(value)
+            words.update(match.group(0) for match in re.finditer(r"[a-z0-9]+", value))
+        return words
+
+    def _store(self, user_id: int, username: str, email: str, is_admin: bool) -> List[Tuple[str, int]]:
+        self.members[user_id] = {"id": user_id, "username": username, "email": email, "is_admin": bool(is_admin)}
+        return [(word, user_id) for word in self._words(username, email)]
+
+    def add(self, user_id: int, username: str, email: str, is_admin: bool) -> None:
+        self.remove(user_id)
+        for entry in self._store(user_id, username, email, is_admin):
+            bisect.insort(self.keys, entry)
+        bisect.insort(self.ids_desc, user_id, key=lambda value: -value)
+
+    def remove(self, user_id: int) -> None:
+        member = self.members.pop(user_id, None)
+        if member is None:
+            return
+        for word in self._words(member["username"], member["email"]):
+            position = bisect.bisect_left(self.keys, (word, user_id))
+            if position < len(self.keys) and self.keys[position] == (word, user_id):
+                del self.keys[position]
+        position = bisect.bisect_left(self.ids_desc, -user_id, key=lambda value: -value)
+        if position < len(self.ids_desc) and self.ids_desc[position] == user_id:
+            del self.ids_desc[position]
+
+    def matching_ids(self, prefix: str) -> set:
+        prefix = prefix.lower()
+        matches = set()
+        position = bisect.bisect_left(self.keys, (prefix, -1))
+        while position < len(self.keys) and self.keys[position][0].startswith(prefix):
+            matches.add(self.keys[position][1])
+            position += 1
+        return matches
+
+    def complete(self, prefix: str, limit: int) -> List[dict]:
+        lowered = prefix.lower()
+        members = [self.members[user_id] for user_id in self.matching_ids(prefix)]
+        # Username prefix matches first, then everything else, alphabetically within each group
+        members.sort(key=lambda member: (not member["username"].lower().startswith(lowered), member["username"].lower()))
+        return members[:limit]
+
+
+_member_index = None
+_member_index_signature = None
+_member_index_checked_at = 0.0
+_member_index_lock = threading.Lock()
+
+
+def get_member_index() -> _MemberIndex:
+    """The process-wide member index, rebuilt when another worker added or removed users.
+
+    Changes made in this process are applied by the User ORM hooks below; the (count,
+    max id) signature is re-read at most every MEMBER_INDEX_RECHECK_SECONDS.
+    """
+    global _member_index, _member_index_signature, _member_index_checked_at
+    with _member_index_lock:
+        now = time.monotonic()
+        if _member_index is not None and now - _member_index_checked_at < MEMBER_INDEX_RECHECK_SECONDS:
+            return _member_index
+        signature = tuple(db.session.query(db.func.count(User.id), db.func.max(User.id)).one())
+        if _member_index is None or signature != _member_index_signature:
+            _member_index = _MemberIndex(db.session.query(User.id, User.username, User.email, User.is_admin))
+            _member_index_signature = signature
+        _member_index_checked_at = now
+        return _member_index
+
+
+def _queue_member_index_change(target, removed: bool = False):
+    # Applied in after_commit, so a rolled-back signup never shows up in autocomplete
+    session = db.inspect(target).session
+    if session is not None:
+        session.info.setdefault("member_index_changes", []).append(
+            (target.id, None if removed else (target.username, target.email, target.is_admin))
+        )
+
+
+def _on_user_inserted(mapper, connection, target):
+    _queue_member_index_change(target)
+
+
+def _on_user_updated(mapper, connection, target):
+    # last_seen is written on most requests; only the indexed fields matter here
+    state = db.inspect(target)
+    if any(state.attrs[name].history.has_changes() for name in ("username", "email", "is_admin")):
+        _queue_member_index_change(target)
+
+
+def _on_user_deleted(mapper, connection, target):
+    _queue_member_index_change(target, removed=True)
+
+
+@event.listens_for(db.session, "after_commit")
+def _apply_member_index_changes(session):
+    global _member_index_signature
+    changes = session.info.pop("member_index_changes", None)
+    if not changes:
+        return
+    with _member_index_lock:
+        if _member_index is None:
+            return
+        for user_id, fields in changes:
+            if fields is None:
+                _member_index.remove(user_id)
+            else:
+                _member_index.add(user_id, *fields)
+        _member_index_signature = (len(_member_index.members), max(_member_index.members, default=None))
+
+
+@event.listens_for(db.session, "after_rollback")
+def _drop_member_index_changes(session):
+    session.info.pop("member_index_changes", None)
+
+
+event.listen(User, "after_insert", _on_user_inserted)
+event.listen(User, "after_update", _on_user_updated)
+event.listen(User, "after_delete", _on_user_deleted)
+
+
+@app.get("/api/members/autocomplete")
+@login_required
+def autocomplete_members():
+    """Members whose username, email or a word inside them starts with ``q``."""
+    query = request.args.get("q", "").strip()
+    limit = min(max(request.args.get("limit", 10, type=int), 1), 50)
+    if not query:
+        return jsonify({"members": []})
+    return jsonify({"members": get_member_index().complete(query, limit)})
+
+
 @app.get("/api/members")
 @login_required
 def list_members():
-    # Get pagination parameters
-    page = request.args.get('page', 1, type=int)
-    per_page = request.args.get('per_page', 50, type=int)  # Default 50, max 100
-    per_page = min(per_page, 100)  # Cap at 100 per page
-    
-    # Get search query
+    """Members newest first, in pages of ``per_page``.
+
+    Pass the returned ``next_before`` as ``before`` for the next page; ``page`` still works
+    for older clients. ``search`` matches prefixes of usernames, emails and words in them.
+    Totals come from the member index instead of a COUNT(*).
+    """
+    per_page = min(max(request.args.get('per_page', 50, type=int), 1), 100)  # Default 50, max 100
+    before = request.args.get('before', type=int)
     search = request.args.get('search', '').strip()
-    
-    # Build query
-    query = db.session.query(User)
-    
-    # Apply search filter if provided
+
+    index = get_member_index()
     if search:
-        search_pattern = f"%{search}%"
-        query = query.filter(
-            (User.username.ilike(search_pattern)) |
-            (User.email.ilike(search_pattern))
-        )
-    
-    # Get total count (before pagination)
-    total = query.count()
-    
-    # Apply pagination and ordering
-    members = query.order_by(User.created_at.desc()).offset((page - 1) * per_page).limit(per_page).all()
-    
-    return jsonify({
-        "members": [m.to_dict() for m in members],
-        "pagination": {
-            "page": page,
-            "per_page": per_page,
-            "total": total,
-            "pages": (total + per_page - 1) // per_page  # Ceiling division
-        }
-    })
+        ids = sorted(index.matching_ids(search), reverse=True)
+    else:
+        ids = index.ids_desc
+    total = len(ids)
+
+    if before:
+        start = bisect.bisect_left(ids, -before + 1, key=lambda value: -value)
+        page = None
+    else:
+        page = max(request.args.get('page', 1, type=int), 1)
+        start = (page - 1) * per_page
+    page_ids = ids[start:start + per_page]
+
+    members = {
+        member.id: member
+        for member in db.session.query(User).options(selectinload(User.roles)).filter(User.id.in_(page_ids))
+    }
+    ordered = [members[user_id] for user_id in page_ids if user_id in members]
+    pagination = {
+        "per_page": per_page,
+        "total": total,
+        "pages": (total + per_page - 1) // per_page,  # Ceiling division
+        "next_before": page_ids[-1] if start + per_page < total else None,
+    }
+    if page is not None:
+        pagination["page"] = page
+    return jsonify({"members": [m.to_dict() for m in ordered], "pagination": pagination})
 
 
 @app.post("/api/members")
@@ -1537,8 +2719,11 @@ def upload_video():
         
         # Save file with error handling
         try:
-            file.save(filepath)
+            save_user_upload(file.stream, filepath, user.id)
             logger.info(f"Video saved to: {filepath}")
+        except StorageQuotaExceeded as quota_error:
+            db.session.rollback()
+            return storage_quota_response(quota_error)
         except Exception as save_error:
             logger.exception(f"Error saving video file: {save_error}")
             return jsonify({"error": f"Failed to save video file: {str(save_error)}"}), 500
@@ -1557,12 +2742,12 @@ def upload_video():
         except Exception as db_error:
             logger.exception(f"Error creating video record: {db_error}")
             # Try to clean up the file if database save fails
+            db.session.rollback()
             try:
                 if os.path.exists(filepath):
                     os.remove(filepath)
             except:
                 pass
-            db.session.rollback()
             return jsonify({"error": "Failed to save video metadata. Please try again."}), 500
 
         return jsonify({"message": "Video uploaded successfully", "video": video.to_dict()})
@@ -1619,8 +2804,7 @@ def delete_video(video_id: int):
         return jsonify({"error": "Not allowed"}), 403
 
     filepath = os.path.join(VIDEO_DIR, video.filename)
-    if os.path.exists(filepath):
-        os.remove(filepath)
+    release_user_file(filepath, video.owner_id)
 
     db.session.delete(video)
     db.session.commit()
@@ -1653,7 +2837,11 @@ def create_blog():
         image = request.files["image"]
         if image.filename:
             image_filename = ensure_unique_filename(BLOG_IMAGE_DIR, image.filename)
-            image.save(os.path.join(BLOG_IMAGE_DIR, image_filename))
+            try:
+                save_user_upload(image.stream, os.path.join(BLOG_IMAGE_DIR, image_filename), user.id)
+            except StorageQuotaExceeded as quota_error:
+                db.session.rollback()
+                return storage_quota_response(quota_error)
 
     blog = Blog(owner_id=user.id, title=title, body=body, image_filename=image_filename)
     db.session.add(blog)
@@ -1698,9 +2886,7 @@ def delete_blog(blog_id: int):
         return jsonify({"error": "Not allowed"}), 403
 
     if blog.image_filename:
-        img_path = os.path.join(BLOG_IMAGE_DIR, blog.image_filename)
-        if os.path.exists(img_path):
-            os.remove(img_path)
+        release_user_file(os.path.join(BLOG_IMAGE_DIR, blog.image_filename), blog.owner_id)
 
     db.session.delete(blog)
     db.session.commit()
@@ -1808,21 +2994,176 @@ def conversation_query(user_id: int, other_user_id: int):
     )
 
 
+def _conversation_pair(user_id: int, other_user_id: int) -> Tuple[int, int]:
+    return min(user_id, other_user_id), max(user_id, other_user_id)
+
+
+def record_conversation_message(message: Message) -> None:
+    """Fold a new (flushed) message into its conversation row, in the caller's transaction.
+
+    The row is created on first contact; the update itself is one UPDATE with the unread
+    increment done in SQL, so concurrent sends cannot lose a count.
+    """
+    if message.sender_id == message.recipient_id:
+        return
+    low, high = _conversation_pair(message.sender_id, message.recipient_id)
+    if not db.session.query(Conversation.id).filter_by(user_low_id=low, user_high_id=high).first():
+        try:
+            with db.session.begin_nested():
+                db.session.add(Conversation(user_low_id=low, user_high_id=high))
+        except IntegrityError:
+            pass  # Another worker created the row first
+
+    newer = or_(Conversation.last_message_id.is_(None), Conversation.last_message_id < message.id)
+    values = {
+        "last_message_id": case((newer, message.id), else_=Conversation.last_message_id),
+        "last_at": case((newer, message.created_at), else_=Conversation.last_at),
+        "updated_at": datetime.utcnow(),
+    }
+    if message.recipient_id == low:
+        values["unread_low"] = Conversation.unread_low + 1
+    else:
+        values["unread_high"] = Conversation.unread_high + 1
+    db.session.execute(
+        update(Conversation)
+        .where(Conversation.user_low_id == low, Conversation.user_high_id == high)
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def get_conversation_row(user_id: int, other_user_id: int) -> Optional[Conversation]:
+    low, high = _conversation_pair(user_id, other_user_id)
+    return db.session.query(Conversation).filter_by(user_low_id=low, user_high_id=high).first()
+
+
+def mark_conversation_read(conversation: Conversation, user_id: int, up_to_id: Optional[int] = None) -> None:
+    """Move ``user_id``'s read mark forward to ``up_to_id`` (default: the newest message).
+
+    Reading everything just zeroes the counter; a partial read recounts the messages past
+    the mark. Either way it is one UPDATE guarded on the current mark, so marks never move
+    back and a message sent meanwhile keeps its unread increment.
+    """
+    unread_name, read_name, _ = conversation.side_columns(user_id)
+    unread_column = getattr(Conversation, unread_name)
+    read_column = getattr(Conversation, read_name)
+    partner_id = conversation.user_high_id if user_id == conversation.user_low_id else conversation.user_low_id
+
+    mark = conversation.last_message_id if up_to_id is None else min(up_to_id, conversation.last_message_id or 0)
+    if not mark:
+        return
+    remaining = (
+        select(db.func.count(Message.id))
+        .where(Message.sender_id == partner_id, Message.recipient_id == user_id, Message.id > mark)
+        .scalar_subquery()
+    )
+    db.session.execute(
+        update(Conversation)
+        .where(
+            Conversation.id == conversation.id,
+            or_(read_column.is_(None), read_column < mark),
+        )
+        .values({
+            read_name: mark,
+            unread_name: case((Conversation.last_message_id <= mark, 0), else_=remaining),
+        })
+        .execution_options(synchronize_session=False)
+    )
+
+
+def backfill_conversations(batch_size: int = 500) -> int:
+    """Build missing conversation rows from message history (existing history counts as read).
+
+    Pairs that already have a row are left alone, so a re-run only fills gaps; commits every
+    ``batch_size`` rows and returns how many were created.
+    """
+    low = case((Message.sender_id < Message.recipient_id, Message.sender_id), else_=Message.recipient_id)
+    high = case((Message.sender_id < Message.recipient_id, Message.recipient_id), else_=Message.sender_id)
+    pairs = (
+        db.session.query(low.label("low_id"), high.label("high_id"), db.func.max(Message.id).label("last_id"))
+        .filter(Message.sender_id != Message.recipient_id)
+        .group_by(low, high)
+        .subquery()
+    )
+    missing = (
+        db.session.query(pairs.c.low_id, pairs.c.high_id, pairs.c.last_id, Message.created_at)
+        .join(Message, Message.id == pairs.c.last_id)
+        .outerjoin(
+            Conversation,
+            (Conversation.user_low_id == pairs.c.low_id) & (Conversation.user_high_id == pairs.c.high_id),
+        )
+        .filter(Conversation.id.is_(None))
+        .order_by(pairs.c.last_id)
+        .all()
+    )
+    created = 0
+    for start in range(0, len(missing), batch_size):
+        for low_id, high_id, last_id, last_at in missing[start:start + batch_size]:
+            try:
+                with db.session.begin_nested():
+                    db.session.add(Conversation(
+                        user_low_id=low_id, user_high_id=high_id, last_message_id=last_id, last_at=last_at,
+                    ))
+            except IntegrityError:
+                continue  # A message sent meanwhile created the row first
+            created += 1
+        db.session.commit()
+    return created
+
+
 @app.get("/api/messages")
 @login_required
 def list_recent_conversations():
+    """Inbox, most recent first. Pass the returned ``next_before`` as ``before`` for the next page."""
     user = current_user()
-    conversations = (
-        db.session.query(Message.recipient_id)
-        .filter(Message.sender_id == user.id)
-        .union(
-            db.session.query(Message.sender_id).filter(Message.recipient_id == user.id)
-        )
-        .all()
-    )
-    partner_ids = {row[0] for row in conversations if row[0] != user.id}
-    partners = db.session.query(User).filter(User.id.in_(partner_ids)).all()
-    return jsonify({"partners": [p.to_dict() for p in partners]})
+    per_page = min(max(request.args.get("per_page", 30, type=int), 1), 100)
+    before = request.args.get("before", type=int)
+
+    # One range scan per side of the pair, each on its own (user, last_message_id) index
+    sides = []
+    for own, partner, unread, partner_read in (
+        (Conversation.user_low_id, Conversation.user_high_id, Conversation.unread_low, Conversation.last_read_high_id),
+        (Conversation.user_high_id, Conversation.user_low_id, Conversation.unread_high, Conversation.last_read_low_id),
+    ):
+        side = select(
+            Conversation.last_message_id.label("last_message_id"),
+            Conversation.last_at.label("last_at"),
+            partner.label("partner_id"),
+            unread.label("unread_count"),
+            partner_read.label("partner_last_read_id"),
+        ).where(own == user.id, Conversation.last_message_id.isnot(None))
+        if before:
+            side = side.where(Conversation.last_message_id < before)
+        sides.append(select(side.order_by(Conversation.last_message_id.desc()).limit(per_page).subquery()))
+    recent = union_all(*sides).subquery()
+
+    rows = db.session.execute(
+        select(recent, User.username, User.last_seen, Message)
+        .join(User, User.id == recent.c.partner_id)
+        .join(Message, Message.id == recent.c.last_message_id)
+        .order_by(recent.c.last_message_id.desc())
+        .limit(per_page)
+    ).all()
+
+    conversations = [
+        {
+            "partner": {
+                "id": row.partner_id,
+                "username": row.username,
+                "last_seen": row.last_seen.isoformat() if row.last_seen else None,
+            },
+            "last_message": row.Message.to_dict(),
+            "last_at": row.last_at.isoformat() if row.last_at else None,
+            "unread_count": row.unread_count,
+            "partner_last_read_message_id": row.partner_last_read_id,
+        }
+        for row in rows
+    ]
+    return jsonify({
+        "conversations": conversations,
+        "partners": [conversation["partner"] for conversation in conversations],
+        "next_before": rows[-1].last_message_id if len(rows) == per_page else None,
+    })
 
 
 @app.get("/api/messages/<username>")
@@ -1834,9 +3175,73 @@ def get_conversation(username: str):
         return jsonify({"error": "User not found"}), 404
 
     messages = conversation_query(user.id, partner.id).all()
+    conversation = get_conversation_row(user.id, partner.id)
+    receipts = {"unread_count": 0, "last_read_message_id": None, "partner_last_read_message_id": None}
+    if conversation is not None:
+        unread_name, read_name, partner_read_name = conversation.side_columns(user.id)
+        receipts = {
+            "unread_count": getattr(conversation, unread_name),
+            "last_read_message_id": getattr(conversation, read_name),
+            "partner_last_read_message_id": getattr(conversation, partner_read_name),
+        }
     return jsonify({
         "partner": partner.to_dict(),
         "messages": [m.to_dict() for m in messages],
+        **receipts,
+    })
+
+
+@app.post("/api/messages/<username>/read")
+@login_required
+def mark_messages_read(username: str):
+    """Mark the conversation read, up to ``message_id`` when given (otherwise everything)."""
+    user = current_user()
+    partner = db.session.query(User).filter_by(username=username).first()
+    if not partner:
+        return jsonify({"error": "User not found"}), 404
+
+    payload = request.get_json(silent=True) or {}
+    up_to_id = payload.get("message_id")
+    if up_to_id is not None and (isinstance(up_to_id, bool) or not isinstance(up_to_id, int)):
+        return jsonify({"error": "message_id must be an integer"}), 400
+
+    conversation = get_conversation_row(user.id, partner.id)
+    if conversation is None:
+        return jsonify({"unread_count": 0, "last_read_message_id": None})
+    try:
+        mark_conversation_read(conversation, user.id, up_to_id)
+        db.session.commit()
+    except Exception:
+        logger.exception("Failed to mark conversation %s read", conversation.id)
+        db.session.rollback()
+        return jsonify({"error": "Could not update read state"}), 500
+
+    db.session.refresh(conversation)
+    unread_name, read_name, _ = conversation.side_columns(user.id)
+    return jsonify({
+        "unread_count": getattr(conversation, unread_name),
+        "last_read_message_id": getattr(conversation, read_name),
+    })
+
+
+@app.get("/api/messages-unread")
+@login_required
+def get_unread_counts():
+    """Unread badge data, read from the maintained per-conversation counters.
+
+    Not under /api/messages/, where it would shadow the thread with a user named "unread".
+    """
+    user = current_user()
+    counts = {}
+    for own, partner, unread in (
+        (Conversation.user_low_id, Conversation.user_high_id, Conversation.unread_low),
+        (Conversation.user_high_id, Conversation.user_low_id, Conversation.unread_high),
+    ):
+        rows = db.session.query(partner, unread).filter(own == user.id, unread > 0)
+        counts.update({partner_id: count for partner_id, count in rows})
+    return jsonify({
+        "total": sum(counts.values()),
+        "conversations": [{"partner_id": partner_id, "unread_count": count} for partner_id, count in counts.items()],
     })
 
 
@@ -1872,7 +3277,11 @@ def send_message():
             attachment_filename = ensure_unique_filename(
                 MESSAGE_ATTACH_DIR, attachment.filename
             )
-            attachment.save(os.path.join(MESSAGE_ATTACH_DIR, attachment_filename))
+            try:
+                save_user_upload(attachment.stream, os.path.join(MESSAGE_ATTACH_DIR, attachment_filename), user.id)
+            except StorageQuotaExceeded as quota_error:
+                db.session.rollback()
+                return storage_quota_response(quota_error)
 
     message = Message(
         sender_id=user.id,
@@ -1881,6 +3290,8 @@ def send_message():
         attachment_filename=attachment_filename,
     )
     db.session.add(message)
+    db.session.flush()
+    record_conversation_message(message)
     db.session.commit()
 
     return jsonify({"message": "Message sent", "data": message.to_dict()})
@@ -1897,12 +3308,300 @@ def get_message_attachment(filename: str):
 ###############################################################################
 
 
+def _paint_stats(data) -> dict:
+    lines = data.get("lines") if isinstance(data, dict) else None
+    if not isinstance(lines, list):
+        lines = data if isinstance(data, list) else []
+    width = data.get("width") if isinstance(data, dict) else None
+    height = data.get("height") if isinstance(data, dict) else None
+    return {
+        "stroke_count": len(lines),
+        "point_count": sum(len(line.get("points") or []) for line in lines if isinstance(line, dict)),
+        "width": int(width) if isinstance(width, (int, float)) else None,
+        "height": int(height) if isinstance(height, (int, float)) else None,
+    }
+
+
+def set_paint_data(paint: Paint, data, bump_revision: bool = True) -> None:
+    """Store paint data as the painting's snapshot (dropping any pending ops) and bump its revision."""
+    stats = _paint_stats(data)
+    if paint.state is None:
+        paint.state = PaintState(paint_id=paint.id, revision=1, snapshot=encode_paint_data(data), **stats)
+    else:
+        db.session.query(PaintOp).filter_by(paint_id=paint.id).delete(synchronize_session=False)
+        paint.state.snapshot = encode_paint_data(data)
+        if bump_revision:
+            paint.state.revision += 1
+        for key, value in stats.items():
+            setattr(paint.state, key, value)
+    paint.data = ""
+
+
+def ensure_paint_encoded(paint: Paint) -> None:
+    """Move a painting saved as JSON text into the compact encoding (once)."""
+    if paint.state is not None:
+        return
+    try:
+        data = json.loads(paint.data) if paint.data else []
+    except ValueError:
+        data = []
+    set_paint_data(paint, data)
+
+
+def get_paint_data(paint: Paint):
+    """Current strokes: the snapshot with any pending op-log entries replayed on top."""
+    if paint.state is None:
+        return json.loads(paint.data)
+    return replay_paint_ops(decode_paint_data(paint.state.snapshot), _pending_paint_ops(paint.id))
+
+
+def _pending_paint_ops(paint_id: int) -> List[Tuple[str, bytes]]:
+    rows = db.session.query(PaintOp.kind, PaintOp.payload).filter_by(paint_id=paint_id).order_by(PaintOp.revision)
+    return [(kind, payload) for kind, payload in rows]
+
+
+def _parse_paint_ops(ops) -> List[Tuple[str, bytes, int, int]]:
+    """Validate client ops into ``(kind, payload, lines, points)`` tuples; raises ValueError."""
+    if not isinstance(ops, list):
+        raise ValueError("ops must be a list")
+    parsed = []
+    for op in ops:
+        kind = op.get("type") if isinstance(op, dict) else None
+        if kind == "strokes":
+            lines = op.get("lines")
+            if not isinstance(lines, list) or not lines:
+                raise ValueError("strokes ops need a non-empty lines list")
+            payload = encode_paint_data({"lines": lines})
+            if payload[:4] != PAINT_STROKES_MAGIC:
+                raise ValueError("lines must be CanvasDraw lines with points, brushColor and brushRadius")
+            parsed.append((kind, payload, len(lines), sum(len(line["points"]) for line in lines)))
+        elif kind == "undo":
+            count = op.get("count")
+            if not isinstance(count, int) or count < 1:
+                raise ValueError("undo ops need a positive count")
+            parsed.append((kind, struct.pack("<I", count), count, 0))
+        elif kind == "clear":
+            parsed.append((kind, b"", 0, 0))
+        else:
+            raise ValueError(f"Unknown op type: {kind}")
+    return parsed
+
+
+def compact_paint_ops(paint: Paint) -> None:
+    """Fold the op log into a fresh snapshot; the revision stays the same."""
+    set_paint_data(paint, get_paint_data(paint), bump_revision=False)
+
+
+_worker_context = None
+_worker_context_lock = threading.Lock()
+
+
+def get_worker_process_context():
+    """multiprocessing context for worker processes (renders, document imports).
+
+    Never fork: this process runs threads, and a forked child inherits their locks in
+    whatever state they were in. forkserver starts each worker from a clean server that
+    has preloaded process_workers; spawn is the (slower to start) fallback.
+    """
+    global _worker_context
+    with _worker_context_lock:
+        if _worker_context is None:
+            import multiprocessing
+            if "forkserver" in multiprocessing.get_all_start_methods():
+                _worker_context = multiprocessing.get_context("forkserver")
+                _worker_context.set_forkserver_preload(["process_workers"])
+            else:
+                _worker_context = multiprocessing.get_context("spawn")
+        return _worker_context
+
+
+_paint_render_slots = threading.BoundedSemaphore(max(PAINT_RENDER_WORKERS, 1))
+
+
+def _render_paint_in_worker(snapshot: bytes, ops: List[Tuple[str, bytes]], size: Tuple[int, int], image_format: str) -> bytes:
+    """Render in a worker process of its own, killed once PAINT_RENDER_TIMEOUT_SECONDS have passed.
+
+    A process per render, rather than a pool, means a render that times out cannot keep
+    holding a worker after its request has given up. Raises concurrent.futures.TimeoutError
+    (also when no render slot frees up in time) and RuntimeError when the worker fails.
+    """
+    from concurrent.futures import TimeoutError as RenderTimeout
+
+    deadline = time.monotonic() + PAINT_RENDER_TIMEOUT_SECONDS
+    if not _paint_render_slots.acquire(timeout=PAINT_RENDER_TIMEOUT_SECONDS):
+        raise RenderTimeout()
+    try:
+        context = get_worker_process_context()
+        receiver, sender = context.Pipe(duplex=False)
+        process = context.Process(target=render_paint_process, args=(snapshot, ops, size, image_format, sender), daemon=True)
+        process.start()
+        sender.close()  # the worker has its own end; EOF here means it died
+        try:
+            if not receiver.poll(max(deadline - time.monotonic(), 0)):
+                raise RenderTimeout()
+            kind, value = receiver.recv()
+        except EOFError:
+            kind, value = "error", "the render worker exited without a result"
+        finally:
+            receiver.close()
+            if process.is_alive():
+                process.kill()
+            process.join(timeout=5)
+    finally:
+        _paint_render_slots.release()
+    if kind != "image":
+        raise RuntimeError(f"Paint render failed: {value}")
+    return value
+
+
+_PAINT_RENDER_NAME_RE = re.compile(r"^r(\d+)_\d+x\d+\.(?:png|webp)$")
+
+
+def get_paint_render_dir(paint_id: int) -> str:
+    return os.path.join(PAINT_RENDER_DIR, f"paint_{paint_id}")
+
+
+def invalidate_paint_renders(paint_id: int) -> None:
+    shutil.rmtree(get_paint_render_dir(paint_id), ignore_errors=True)
+
+
+def get_paint_render(paint: Paint, size: Tuple[int, int], image_format: str) -> bytes:
+    """Rendered image of a painting at its current revision, from the cache or the render pool.
+
+    Raises concurrent.futures.TimeoutError when rendering takes longer than PAINT_RENDER_TIMEOUT_SECONDS.
+    """
+    extension = "webp" if image_format == "WEBP" else "png"
+    cache_path = os.path.join(get_paint_render_dir(paint.id), f"r{paint.state.revision}_{size[0]}x{size[1]}.{extension}")
+    try:
+        with open(cache_path, "rb") as handle:
+            return handle.read()
+    except FileNotFoundError:
+        pass
+
+    image_bytes = _render_paint_in_worker(paint.state.snapshot, _pending_paint_ops(paint.id), size, image_format)
+
+    # A render that raced a save may finish after the invalidation; keep only the newest revision's files
+    render_dir = os.path.dirname(cache_path)
+    os.makedirs(render_dir, exist_ok=True)
+    for name in os.listdir(render_dir):
+        match = _PAINT_RENDER_NAME_RE.match(name)
+        if not match:
+            continue  # another request's temp file
+        if int(match.group(1)) > paint.state.revision:
+            return image_bytes  # this render is already stale, do not cache it
+        if int(match.group(1)) < paint.state.revision:
+            try:
+                os.remove(os.path.join(render_dir, name))
+            except FileNotFoundError:
+                pass
+    temp_path = f"{cache_path}.{uuid.uuid4().hex}.tmp"
+    with open(temp_path, "wb") as handle:
+        handle.write(image_bytes)
+    os.replace(temp_path, cache_path)
+    return image_bytes
+
+
+def _paint_render_response(paint: Paint, size: Tuple[int, int], image_format: str):
+    from concurrent.futures import TimeoutError as RenderTimeout
+
+    if paint.state is None:
+        # Saved before the compact encoding and not yet converted by the migration
+        return jsonify({"error": "This painting is being upgraded. Please try again shortly."}), 503
+
+    etag = f"paint-{paint.id}-r{paint.state.revision}-{size[0]}x{size[1]}-{image_format.lower()}"
+    if etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        try:
+            image_bytes = get_paint_render(paint, size, image_format)
+        except RenderTimeout:
+            return jsonify({"error": "Rendering this painting took too long. Please try again."}), 503
+        except RuntimeError as render_error:
+            logger.error(f"Could not render paint {paint.id}: {render_error}")
+            return jsonify({"error": "Failed to render this painting"}), 500
+        response = Response(image_bytes, mimetype="image/webp" if image_format == "WEBP" else "image/png")
+    response.set_etag(etag)
+    response.headers["Vary"] = "Accept"
+    # The URL carries the revision, so a saved painting gets a new URL
+    response.headers["Cache-Control"] = "private, max-age=31536000, immutable"
+    return response
+
+
+def encode_legacy_paints(batch_size: int = 200) -> int:
+    """Convert paintings still saved as JSON text, committing per batch (an interrupted run resumes)."""
+    converted = 0
+    while True:
+        legacy = (
+            db.session.query(Paint)
+            .filter(~db.session.query(PaintState.paint_id).filter(PaintState.paint_id == Paint.id).exists())
+            .order_by(Paint.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not legacy:
+            return converted
+        for paint in legacy:
+            ensure_paint_encoded(paint)
+        db.session.commit()
+        converted += len(legacy)
+
+
 @app.get("/api/paint")
 @login_required
 def list_paint_docs():
     user = current_user()
-    docs = db.session.query(Paint).filter_by(owner_id=user.id).all()
-    return jsonify({"paintings": [doc.to_dict() for doc in docs]})
+    docs = (
+        db.session.query(Paint)
+        .options(defer(Paint.data), selectinload(Paint.state).defer(PaintState.snapshot))
+        .filter_by(owner_id=user.id)
+        .all()
+    )
+    # Metadata and a thumbnail only; strokes are loaded per painting
+    return jsonify({"paintings": [doc.to_dict(include_data=False) for doc in docs]})
+
+
+@app.get("/api/paint/<int:paint_id>")
+@login_required
+def get_paint_doc(paint_id: int):
+    user = current_user()
+    paint = db.session.get(Paint, paint_id)
+    if not paint or paint.owner_id != user.id:
+        return jsonify({"error": "Paint not found"}), 404
+    return jsonify({"paint": paint.to_dict()})
+
+
+@app.get("/api/paint/<int:paint_id>/thumbnail")
+@login_required
+def get_paint_thumbnail(paint_id: int):
+    user = current_user()
+    paint = db.session.get(Paint, paint_id)
+    if not paint or paint.owner_id != user.id:
+        return jsonify({"error": "Paint not found"}), 404
+    image_format = "WEBP" if "image/webp" in request.headers.get("Accept", "") else "PNG"
+    return _paint_render_response(paint, (200, 150), image_format)
+
+
+@app.get("/api/paint/<int:paint_id>/image")
+@login_required
+def get_paint_image(paint_id: int):
+    """Server-rendered painting: ``w``/``h`` (rounded up to a multiple of 50) and ``format`` png or webp."""
+    user = current_user()
+    paint = db.session.get(Paint, paint_id)
+    if not paint or paint.owner_id != user.id:
+        return jsonify({"error": "Paint not found"}), 404
+
+    def dimension(name: str, default: int) -> int:
+        value = request.args.get(name, default, type=int) or default
+        # Snap sizes so arbitrary requests cannot fill the render cache
+        return min(max(-(-value // 50) * 50, 50), MAX_PAINT_RENDER_SIZE)
+
+    size = (dimension("w", 800), dimension("h", 600))
+    requested = (request.args.get("format") or "").lower()
+    if requested not in ("", "png", "webp"):
+        return jsonify({"error": "format must be png or webp"}), 400
+    if not requested:
+        requested = "webp" if "image/webp" in request.headers.get("Accept", "") else "png"
+    return _paint_render_response(paint, size, requested.upper())
 
 
 @app.post("/api/paint")
@@ -1916,18 +3615,106 @@ def save_paint_doc():
         return jsonify({"error": "Paint data is required"}), 400
 
     paint_id = data.get("id")
+    base_revision = data.get("base_revision")
     if paint_id:
         paint = db.session.get(Paint, paint_id)
         if not paint or paint.owner_id != user.id:
             return jsonify({"error": "Paint not found"}), 404
         paint.name = name
-        paint.data = json.dumps(strokes)
     else:
-        paint = Paint(owner_id=user.id, name=name, data=json.dumps(strokes))
+        paint = Paint(owner_id=user.id, name=name, data="")
         db.session.add(paint)
+        db.session.flush()
+
+    if paint_id and base_revision is not None and paint.state is not None:
+        # Overwrite only the revision the client loaded, claimed atomically like an ops save
+        claimed = db.session.execute(
+            update(PaintState)
+            .where(PaintState.paint_id == paint.id, PaintState.revision == base_revision)
+            .values(revision=PaintState.revision + 1)
+        ).rowcount
+        if not claimed:
+            db.session.rollback()
+            return jsonify({"error": "The painting changed since it was loaded", "revision": paint.state.revision}), 409
+        db.session.refresh(paint.state)
+        set_paint_data(paint, strokes, bump_revision=False)
+    else:
+        set_paint_data(paint, strokes)
 
     db.session.commit()
-    return jsonify({"message": "Paint saved", "paint": paint.to_dict()})
+    invalidate_paint_renders(paint.id)
+    return jsonify({"message": "Paint saved", "paint": paint.to_dict(include_data=False)})
+
+
+@app.post("/api/paint/<int:paint_id>/ops")
+@login_required
+def save_paint_ops(paint_id: int):
+    """Incremental save: append new strokes / undo / clear ops to a painting at ``base_revision``.
+
+    Only the ops are written; every PAINT_COMPACT_OPS ops the log is folded into the
+    snapshot. A stale base revision gets 409; ops that cannot be kept in the log (or a
+    painting stored as JSON) are answered with ``full_save_required`` instead.
+    """
+    user = current_user()
+    paint = db.session.get(Paint, paint_id)
+    if not paint or paint.owner_id != user.id:
+        return jsonify({"error": "Paint not found"}), 404
+    ensure_paint_encoded(paint)
+
+    data = ensure_json_request()
+    try:
+        ops = _parse_paint_ops(data.get("ops"))
+    except ValueError as exc:
+        db.session.rollback()
+        return jsonify({"error": str(exc), "full_save_required": True}), 400
+    name = data.get("name")
+    if name is not None and not isinstance(name, str):
+        db.session.rollback()
+        return jsonify({"error": "name must be a string"}), 400
+
+    state = paint.state
+    base_revision = data.get("base_revision")
+    if base_revision != state.revision:
+        db.session.rollback()
+        return jsonify({"error": "The painting changed since it was loaded", "revision": state.revision}), 409
+    if state.snapshot[:4] != PAINT_STROKES_MAGIC:
+        db.session.rollback()
+        return jsonify({"error": "This painting needs a full save first", "revision": state.revision, "full_save_required": True}), 409
+
+    try:
+        # Claim the revision range atomically; a concurrent save at the same base updates no row
+        claimed = ops and db.session.execute(
+            update(PaintState)
+            .where(PaintState.paint_id == paint.id, PaintState.revision == base_revision)
+            .values(revision=base_revision + len(ops))
+        ).rowcount
+        if ops and not claimed:
+            db.session.rollback()
+            return jsonify({"error": "The painting changed since it was loaded"}), 409
+        db.session.refresh(state)
+
+        for number, (kind, payload, lines, points) in enumerate(ops, start=1):
+            db.session.add(PaintOp(paint_id=paint.id, revision=base_revision + number, kind=kind, payload=payload))
+            if kind == "strokes":
+                state.stroke_count += lines
+                state.point_count += points
+            elif kind == "undo":
+                state.stroke_count = max(state.stroke_count - lines, 0)  # point_count is corrected on compaction
+            else:
+                state.stroke_count = state.point_count = 0
+        if name:
+            paint.name = name.strip()[:120] or paint.name
+        db.session.flush()
+
+        if db.session.query(PaintOp).filter_by(paint_id=paint.id).count() >= PAINT_COMPACT_OPS:
+            compact_paint_ops(paint)
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({"error": "The painting changed since it was loaded"}), 409
+    if ops:
+        invalidate_paint_renders(paint.id)
+    return jsonify({"message": "Paint saved", "paint": paint.to_dict(include_data=False)})
 
 
 @app.delete("/api/paint/<int:paint_id>")
@@ -1937,8 +3724,10 @@ def delete_paint_doc(paint_id: int):
     paint = db.session.get(Paint, paint_id)
     if not paint or paint.owner_id != user.id:
         return jsonify({"error": "Paint not found"}), 404
+    db.session.query(PaintOp).filter_by(paint_id=paint.id).delete(synchronize_session=False)
     db.session.delete(paint)
     db.session.commit()
+    invalidate_paint_renders(paint_id)
     return jsonify({"message": "Paint deleted"})
 
 
@@ -2140,6 +3929,9 @@ def send_ai_message():
             db.session.add(chat)
             db.session.flush()  # assign id before commit
 
+        # Earlier turns: a rolling summary plus the most recent messages verbatim
+        chat_summary, messages_payload = build_ai_chat_memory(chat)
+
         user_msg = AIMessage(chat_id=chat.id, role="user", content=message_content)
         db.session.add(user_msg)
 
@@ -2147,17 +3939,24 @@ def send_ai_message():
         search_snippets = search_external_sources(message_content)
 
         system_prompt = "You are Friendly Friends AI, a warm, concise companion."
-        messages_payload = [
-            {"role": "user", "content": message_content},
-        ]
+        if chat_summary:
+            system_prompt += f"\n\nSummary of the earlier conversation:\n{chat_summary}"
         context_parts = []
         if training_snippets:
             context_parts.append("Training:\n" + "\n".join(training_snippets))
         if search_snippets:
             context_parts.append("Search Results:\n" + "\n".join(search_snippets))
 
+        # Opt-in grounding on the user's own AI docs
+        doc_passages = search_ai_docs(user.id, message_content) if data.get("use_docs") else []
+        if doc_passages:
+            context_parts.append("From your documents:\n" + "\n\n".join(
+                f"[{passage['title']}]\n{passage['text']}" for passage in doc_passages
+            ))
+
         if context_parts:
-            messages_payload.insert(0, {"role": "assistant", "content": "\n\n".join(context_parts)})
+            messages_payload.append({"role": "assistant", "content": "\n\n".join(context_parts)})
+        messages_payload.append({"role": "user", "content": message_content})
 
         try:
             ai_response = call_openai(messages_payload, system_prompt=system_prompt)
@@ -2173,6 +3972,9 @@ def send_ai_message():
         return jsonify({
             "chat": chat.to_dict(),
             "messages": [user_msg.to_dict(), assistant_msg.to_dict()],
+            "sources": [
+                {"doc_id": p["doc_id"], "title": p["title"], "position": p["position"]} for p in doc_passages
+            ],
         })
     except Exception as e:
         logger.exception(f"Error in /api/ai/chat: {e}")
@@ -2184,8 +3986,15 @@ def send_ai_message():
 @login_required
 def list_ai_docs():
     user = current_user()
-    docs = db.session.query(AIDoc).filter_by(owner_id=user.id).order_by(AIDoc.updated_at.desc()).all()
-    return jsonify({"docs": [d.to_dict() for d in docs]})
+    docs = (
+        db.session.query(AIDoc)
+        .options(defer(AIDoc.content), selectinload(AIDoc.info))
+        .filter_by(owner_id=user.id)
+        .order_by(AIDoc.updated_at.desc())
+        .all()
+    )
+    # Titles and excerpts only; the editor loads a doc's text when it is opened
+    return jsonify({"docs": [d.to_dict(include_content=False) for d in docs]})
 
 @app.post("/api/ai/docs")
 @login_required
@@ -2209,10 +4018,12 @@ def generate_ai_doc():
     doc = AIDoc(
         owner_id=user.id,
         title=title,
-        content=doc_text,
+        content="",
         prompt=prompt,
     )
     db.session.add(doc)
+    db.session.flush()
+    set_ai_doc_text(doc, doc_text)
     db.session.commit()
     
     return jsonify({"message": "Document generated", "doc": doc.to_dict()})
@@ -2224,7 +4035,51 @@ def get_ai_doc(doc_id: int):
     doc = db.session.get(AIDoc, doc_id)
     if not doc or doc.owner_id != user.id:
         return jsonify({"error": "Document not found"}), 404
-    return jsonify(doc.to_dict())
+    
+    # Chunk ids/hashes/lengths let the editor send chunk-level PATCHes instead of the full text.
+    # A doc not yet chunked by the migration has none, so the editor saves its full text.
+    rows = ai_doc_chunk_rows(doc.id) if doc.info is not None else []
+    payload = doc.to_dict(include_content=False)
+    payload["content"] = "".join(row.body for row in rows) if doc.info is not None else doc.content
+    payload["chunks"] = [_ai_doc_chunk_meta(row) for row in rows]
+    return jsonify(payload)
+
+@app.get("/api/ai/docs/<int:doc_id>/chunks")
+@login_required
+def get_ai_doc_chunks(doc_id: int):
+    """Load a range of a document's chunks, in order."""
+    user = current_user()
+    doc = db.session.get(AIDoc, doc_id)
+    if not doc or doc.owner_id != user.id:
+        return jsonify({"error": "Document not found"}), 404
+    
+    offset = max(request.args.get("offset", 0, type=int), 0)
+    limit = min(max(request.args.get("limit", 50, type=int), 1), 500)
+    if doc.info is None:
+        # Not chunked by the migration yet: the whole text is one chunk that cannot be edited by id
+        legacy = {"id": None, "hash": hashlib.sha256(doc.content.encode("utf-8")).hexdigest(),
+                  "length": _utf16_length(doc.content), "text": doc.content}
+        return jsonify({"doc_id": doc.id, "offset": offset, "total": 1, "chunks": [legacy][offset:offset + limit]})
+    
+    rows = (
+        db.session.query(AIDocChunk)
+        .filter_by(doc_id=doc.id)
+        .order_by(AIDocChunk.position)
+        .offset(offset)
+        .limit(limit)
+        .all()
+    )
+    return jsonify({
+        "doc_id": doc.id,
+        "offset": offset,
+        "total": doc.info.chunk_count,
+        "chunks": [dict(_ai_doc_chunk_meta(row), text=row.body) for row in rows],
+    })
+
+def _ai_doc_import_in_progress(doc_id: int) -> bool:
+    return db.session.query(AIDocImport.id).filter(
+        AIDocImport.doc_id == doc_id, AIDocImport.status.in_(("queued", "processing"))
+    ).first() is not None
 
 @app.put("/api/ai/docs/<int:doc_id>")
 @login_required
@@ -2234,15 +4089,89 @@ def update_ai_doc(doc_id: int):
     if not doc or doc.owner_id != user.id:
         return jsonify({"error": "Document not found"}), 404
     
+    if _ai_doc_import_in_progress(doc.id):
+        return jsonify({"error": "This document is still being imported. Please wait for it to finish."}), 409
+    
     data = ensure_json_request()
     if "title" in data:
         doc.title = data["title"].strip()
     if "content" in data:
-        doc.content = data["content"]
+        set_ai_doc_text(doc, data["content"])
     
     db.session.commit()
     return jsonify({"message": "Document updated", "doc": doc.to_dict()})
 
+@app.patch("/api/ai/docs/<int:doc_id>")
+@login_required
+def patch_ai_doc(doc_id: int):
+    """Apply chunk-level edits to a document.
+
+    Each edit replaces a run of consecutive chunks (``chunk_ids`` with the ``hashes`` the
+    client last saw) or inserts after chunk ``after`` (null for the start) with ``text``.
+    A stale hash or unknown chunk means the document changed underneath the client: 409.
+    """
+    user = current_user()
+    doc = db.session.get(AIDoc, doc_id)
+    if not doc or doc.owner_id != user.id:
+        return jsonify({"error": "Document not found"}), 404
+    
+    if _ai_doc_import_in_progress(doc.id):
+        return jsonify({"error": "This document is still being imported. Please wait for it to finish."}), 409
+    
+    data = ensure_json_request()
+    edits = data.get("edits") or []
+    if not isinstance(edits, list):
+        return jsonify({"error": "edits must be a list"}), 400
+    
+    try:
+        ensure_ai_doc_chunked(doc)
+        rows = ai_doc_chunk_rows(doc.id, with_body=False)
+        applied = []
+        for edit in edits:
+            chunk_ids = edit.get("chunk_ids") or []
+            text_value = edit.get("text") or ""
+            if not isinstance(chunk_ids, list) or not isinstance(text_value, str):
+                db.session.rollback()
+                return jsonify({"error": "Each edit needs chunk_ids (a list) and text (a string)"}), 400
+            
+            index_of = {row.id: number for number, row in enumerate(rows)}
+            if chunk_ids:
+                if chunk_ids[0] not in index_of:
+                    db.session.rollback()
+                    return jsonify({"error": "The document changed since it was loaded. Please reload it."}), 409
+                start = index_of[chunk_ids[0]]
+                end = start + len(chunk_ids)
+                if [row.id for row in rows[start:end]] != chunk_ids:
+                    db.session.rollback()
+                    return jsonify({"error": "chunk_ids must be consecutive chunks of the document"}), 400
+                if edit.get("hashes") != [row.content_hash for row in rows[start:end]]:
+                    db.session.rollback()
+                    return jsonify({"error": "The document changed since it was loaded. Please reload it."}), 409
+            else:
+                after = edit.get("after")
+                if after is not None and after not in index_of:
+                    db.session.rollback()
+                    return jsonify({"error": "The document changed since it was loaded. Please reload it."}), 409
+                start = end = 0 if after is None else index_of[after] + 1
+            
+            new_rows = replace_ai_doc_chunks(doc, rows, start, end, text_value)
+            applied.append((start, end - start, new_rows))
+        
+        if "title" in data:
+            doc.title = (data.get("title") or "").strip() or doc.title
+        db.session.flush()
+        edits_out = [
+            {"start": start, "removed": removed, "chunks": [_ai_doc_chunk_meta(row) for row in new_rows]}
+            for start, removed, new_rows in applied
+        ]
+        db.session.commit()
+    except Exception as e:
+        logger.exception(f"Error patching AI doc {doc_id}: {e}")
+        db.session.rollback()
+        return jsonify({"error": "Failed to save the document"}), 500
+    
+    return jsonify({"message": "Document updated", "doc": doc.to_dict(include_content=False), "edits": edits_out})
+
 @app.delete("/api/ai/docs/<int:doc_id>")
 @login_required
 def delete_ai_doc(doc_id: int):
@@ -2251,6 +4180,8 @@ def delete_ai_doc(doc_id: int):
     if not doc or doc.owner_id != user.id:
         return jsonify({"error": "Document not found"}), 404
     
+    delete_ai_doc_chunks(doc.id)
+    db.session.query(AIDocImport).filter_by(doc_id=doc.id).update({"doc_id": None}, synchronize_session=False)
     db.session.delete(doc)
     db.session.commit()
     return jsonify({"message": "Document deleted"})
@@ -2258,35 +4189,120 @@ def delete_ai_doc(doc_id: int):
 
 def _extract_text_from_document_bytes(file_bytes: bytes, extension: str) -> str:
     """Extract text content from supported document formats."""
-    extension = extension.lower()
-    if extension == ".pdf":
-        try:
-            from PyPDF2 import PdfReader
-        except ImportError as exc:  # pragma: no cover - dependency missing
-            raise RuntimeError("PDF support is not available on this server.") from exc
-
-        pdf_reader = PdfReader(io.BytesIO(file_bytes))
-        pages = []
-        for page in pdf_reader.pages:
-            page_text = page.extract_text() or ""
-            if page_text:
-                pages.append(page_text)
-        return "\n".join(pages).strip()
-    if extension == ".docx":
-        try:
-            from docx import Document
-        except ImportError as exc:  # pragma: no cover - dependency missing
-            raise RuntimeError("Word document support is not available on this server.") from exc
+    return "\n".join(piece for piece in iter_document_text(file_bytes, extension) if piece).strip()
+
+
+_doc_import_slots = threading.BoundedSemaphore(max(AI_DOC_IMPORT_WORKERS, 1))
+
+
+def _store_imported_pages(doc: AIDoc, pieces: List[str]) -> None:
+    """Append extracted pages to ``doc`` as new chunks and commit them (with the job's progress)."""
+    append_ai_doc_text(doc, "\n".join(pieces))
+    db.session.commit()
+
+
+def _drive_ai_doc_import(job: AIDocImport, doc: AIDoc, path: str, extension: str) -> None:
+    """Run one extraction process and store its pages as they arrive.
+
+    The first page is stored immediately so the doc is readable while the rest is
+    extracted; after that pages are committed in small batches. The process is killed
+    when the whole import or a single page runs past its timeout.
+    """
+    import queue
+
+    job.status = "processing"
+    db.session.commit()
+
+    context = get_worker_process_context()
+    results = context.Queue()
+    process = context.Process(
+        target=document_import_process,
+        args=(path, extension, results, AI_DOC_IMPORT_MEMORY_MB * 1024 * 1024),
+        daemon=True,
+    )
+    process.start()
+
+    deadline = time.monotonic() + AI_DOC_IMPORT_TIMEOUT_SECONDS
+    last_progress = last_flush = time.monotonic()
+    pending: List[str] = []
+    error = None
+    try:
+        while True:
+            now = time.monotonic()
+            if now >= deadline:
+                error = "The import timed out."
+                break
+            if now - last_progress >= AI_DOC_IMPORT_PAGE_TIMEOUT_SECONDS:
+                error = "A page took too long to read."
+                break
+            try:
+                kind, value = results.get(timeout=1)
+            except queue.Empty:
+                if not process.is_alive():
+                    error = "The document could not be processed."
+                    break
+                continue
+
+            last_progress = time.monotonic()
+            if kind == "total":
+                job.pages_total = value
+            elif kind == "page":
+                job.pages_done += 1
+                if value.strip():
+                    pending.append(value)
+                if pending and (not doc.info.size or len(pending) >= 10 or last_progress - last_flush >= 2):
+                    _store_imported_pages(doc, pending)
+                    pending, last_flush = [], time.monotonic()
+            elif kind == "error":
+                error = value
+                break
+            else:
+                break
+    finally:
+        if process.is_alive():
+            process.kill()
+        process.join(timeout=5)
+
+    if pending:
+        _store_imported_pages(doc, pending)
+
+    if not doc.info.size:
+        delete_ai_doc_chunks(doc.id)
+        db.session.delete(doc)
+        job.doc_id = None
+        job.status = "failed"
+        job.error = error or "We couldn't find any readable text in that document."
+    else:
+        job.status = "partial" if error else "done"
+        job.error = f"{error} Only the pages read before that were kept." if error else None
+    db.session.commit()
 
-        document = Document(io.BytesIO(file_bytes))
-        paragraphs = [para.text for para in document.paragraphs]
-        return "\n".join(paragraphs).strip()
 
-    # Plain text-like formats
+def _run_ai_doc_import(job_id: int, path: str, extension: str) -> None:
+    """Background-thread body: wait for a free worker slot, then run the import."""
     try:
-        return file_bytes.decode("utf-8", errors="ignore").strip()
-    except UnicodeDecodeError:
-        return file_bytes.decode("latin-1", errors="ignore").strip()
+        with _doc_import_slots, app.app_context():
+            job = db.session.get(AIDocImport, job_id)
+            doc = db.session.get(AIDoc, job.doc_id) if job and job.doc_id else None
+            if not job or not doc:
+                return
+            try:
+                _drive_ai_doc_import(job, doc, path, extension)
+            except Exception as e:
+                logger.exception(f"Document import {job_id} failed: {e}")
+                db.session.rollback()
+                job = db.session.get(AIDocImport, job_id)
+                if job:
+                    job.status = "partial" if job.pages_done else "failed"
+                    job.error = "Something went wrong while importing this document."
+                    db.session.commit()
+            finally:
+                db.session.remove()
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
 
 
 @app.post("/api/ai/docs/import")
@@ -2318,6 +4334,36 @@ def import_ai_doc():
     if file_size > MAX_DOC_IMPORT_SIZE_BYTES:
         return jsonify({"error": f"File is too large. Max size is {MAX_DOC_IMPORT_SIZE_BYTES // (1024 * 1024)} MB."}), 400
 
+    title = os.path.splitext(filename)[0][:255] or "Imported Document"
+    if extension in DOC_IMPORT_WORKER_EXTENSIONS:
+        # PDF/DOCX parsing can be slow or hang on malformed files: extract in a worker
+        # process and let the client follow progress via /api/ai/docs/imports/<id>
+        upload_path = os.path.join(DOC_IMPORT_DIR, f"{uuid.uuid4().hex}{extension}")
+        try:
+            with open(upload_path, "wb") as handle:
+                handle.write(file_bytes)
+            imported_doc = AIDoc(owner_id=user.id, title=title, content="", prompt=f"Imported from {filename}")
+            db.session.add(imported_doc)
+            db.session.flush()
+            ensure_ai_doc_chunked(imported_doc)
+            job = AIDocImport(owner_id=user.id, doc_id=imported_doc.id, filename=filename, status="queued")
+            db.session.add(job)
+            db.session.commit()
+        except Exception as db_error:
+            logger.exception(f"Failed to queue document import: {db_error}")
+            db.session.rollback()
+            if os.path.exists(upload_path):
+                os.remove(upload_path)
+            return jsonify({"error": "Unable to save the imported document. Please try again."}), 500
+
+        threading.Thread(
+            target=_run_ai_doc_import,
+            args=(job.id, upload_path, extension),
+            name=f"doc-import-{job.id}",
+            daemon=True,
+        ).start()
+        return jsonify({"message": "Import started", "doc": imported_doc.to_dict(include_content=False), "import": job.to_dict()}), 202
+
     try:
         content = _extract_text_from_document_bytes(file_bytes, extension)
     except RuntimeError as runtime_error:
@@ -2330,15 +4376,16 @@ def import_ai_doc():
     if not content:
         return jsonify({"error": "We couldn't find any readable text in that document."}), 422
 
-    title = os.path.splitext(filename)[0][:255] or "Imported Document"
     try:
         imported_doc = AIDoc(
             owner_id=user.id,
             title=title,
-            content=content,
+            content="",
             prompt=f"Imported from {filename}",
         )
         db.session.add(imported_doc)
+        db.session.flush()
+        set_ai_doc_text(imported_doc, content)
         db.session.commit()
     except Exception as db_error:
         logger.exception(f"Failed to save imported document: {db_error}")
@@ -2348,6 +4395,29 @@ def import_ai_doc():
     return jsonify({"message": "Document imported", "doc": imported_doc.to_dict()})
 
 
+@app.get("/api/ai/docs/imports/<int:import_id>")
+@login_required
+def get_ai_doc_import(import_id: int):
+    """Progress of a background document import, with the document text stored so far."""
+    user = current_user()
+    job = db.session.get(AIDocImport, import_id)
+    if not job or job.owner_id != user.id:
+        return jsonify({"error": "Import not found"}), 404
+
+    # A worker restart loses the import thread; report such jobs as finished with what they stored
+    stale_after = {
+        "queued": timedelta(hours=1),
+        "processing": timedelta(seconds=AI_DOC_IMPORT_TIMEOUT_SECONDS + 60),
+    }.get(job.status)
+    if stale_after and datetime.utcnow() - job.updated_at > stale_after:
+        job.status = "partial" if job.pages_done else "failed"
+        job.error = "The import was interrupted."
+        db.session.commit()
+
+    doc = db.session.get(AIDoc, job.doc_id) if job.doc_id else None
+    return jsonify({"import": job.to_dict(), "doc": doc.to_dict(include_content=False) if doc else None})
+
+
 ###############################################################################
 # Bug Reporting                                                               #
 ###############################################################################
@@ -2762,7 +4832,15 @@ def submit_to_research(research_id: int):
                 
                 unique_filename = ensure_unique_filename(RESEARCH_PHOTO_DIR, filename)
                 filepath = os.path.join(RESEARCH_PHOTO_DIR, unique_filename)
-                photo_file.save(filepath)
+                try:
+                    save_user_upload(photo_file.stream, filepath, user.id)
+                except StorageQuotaExceeded as quota_error:
+                    db.session.rollback()
+                    for saved_filename in photo_filenames:
+                        saved_path = os.path.join(RESEARCH_PHOTO_DIR, saved_filename)
+                        if os.path.exists(saved_path):
+                            os.remove(saved_path)
+                    return storage_quota_response(quota_error)
                 
                 photo = ResearchSubmissionPhoto(
                     submission_id=submission.id,
@@ -3055,6 +5133,7 @@ Respond ONLY with the enhanced prompt, nothing else."""
             background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
             img = background
         img.save(filepath, 'JPEG', quality=95)
+        record_storage_change(user.id, os.path.getsize(filepath), enforce_quota=False)
         
         # Save to database (store both original and enhanced prompt)
         ai_image = AIImage(
@@ -3100,9 +5179,7 @@ def delete_ai_image(image_id: int):
         return jsonify({"error": "Image not found"}), 404
     
     # Delete file
-    filepath = os.path.join(AI_IMAGE_DIR, ai_image.filename)
-    if os.path.exists(filepath):
-        os.remove(filepath)
+    release_user_file(os.path.join(AI_IMAGE_DIR, ai_image.filename), ai_image.owner_id)
     
     db.session.delete(ai_image)
     db.session.commit()
@@ -3349,9 +5426,720 @@ def ai_suggest_role_instructions():
 # Cloud PCs Management                                                         #
 ###############################################################################
 
+CLOUD_PC_CATALOG_SORT_COLUMNS = {
+    "name": CloudPCFile.name,
+    "size": CloudPCFile.size,
+    "modified": CloudPCFile.mtime,
+    "type": CloudPCFile.extension,
+}
 
-@app.get("/api/cloud-pcs")
-@login_required
+
+def get_cloud_pc_storage_dir(pc_id: int) -> str:
+    """Return the storage root for a Cloud PC (files live under it)."""
+    return os.path.join(CLOUD_PC_STORAGE_DIR, f"pc_{pc_id}", "storage")
+
+
+def resolve_cloud_pc_path(pc_id: int, path: str) -> Optional[str]:
+    """Map a Cloud PC path to an absolute filesystem path, or None if it escapes storage."""
+    storage_dir = os.path.abspath(get_cloud_pc_storage_dir(pc_id))
+    full_path = os.path.abspath(os.path.join(storage_dir, (path or "").lstrip("/")))
+    if full_path != storage_dir and not full_path.startswith(storage_dir + os.sep):
+        return None
+    return full_path
+
+
+def normalize_cloud_pc_path(path: str) -> str:
+    """Return the canonical catalog form of a Cloud PC path ("/a/b", root is "/")."""
+    parts = [part for part in (path or "").replace("\\", "/").split("/") if part and part != "."]
+    return "/" + "/".join(parts)
+
+
+def _cloud_pc_parent_path(path: str) -> str:
+    parent = path.rsplit("/", 1)[0]
+    return parent or "/"
+
+
+def _hash_file(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _catalog_apply_stat(
+    entry: CloudPCFile,
+    full_path: str,
+    st: os.stat_result,
+    content_hash: Optional[str] = None,
+    rehash: bool = False,
+) -> bool:
+    """Copy filesystem metadata onto a catalog row. Returns True if anything changed."""
+    is_dir = stat.S_ISDIR(st.st_mode)
+    mtime = datetime.fromtimestamp(st.st_mtime)
+    size = 0 if is_dir else st.st_size
+    changed = entry.id is None or entry.is_dir != is_dir or entry.size != size or entry.mtime != mtime
+    entry.is_dir = is_dir
+    entry.size = size
+    entry.mtime = mtime
+    if is_dir:
+        entry.extension = None
+        entry.mime_type = None
+        entry.content_hash = None
+    else:
+        extension = os.path.splitext(entry.name)[1].lower().lstrip(".")
+        entry.extension = extension[:32] or None
+        entry.mime_type = mimetypes.guess_type(entry.name)[0]
+        if content_hash:
+            changed = changed or entry.content_hash != content_hash
+            entry.content_hash = content_hash
+        elif rehash or changed or not entry.content_hash:
+            new_hash = _hash_file(full_path)
+            changed = changed or entry.content_hash != new_hash
+            entry.content_hash = new_hash
+    return changed
+
+
+def _catalog_new_entry(pc_id: int, path: str) -> CloudPCFile:
+    return CloudPCFile(
+        pc_id=pc_id,
+        path=path,
+        parent=_cloud_pc_parent_path(path),
+        name=path.rsplit("/", 1)[-1],
+    )
+
+
+def _catalog_ensure_parents(pc_id: int, path: str) -> None:
+    """Make sure every ancestor directory of `path` has a catalog row."""
+    parent = _cloud_pc_parent_path(path)
+    missing = []
+    while parent != "/":
+        if db.session.query(CloudPCFile.id).filter_by(pc_id=pc_id, path=parent).first():
+            break
+        missing.append(parent)
+        parent = _cloud_pc_parent_path(parent)
+    for directory in reversed(missing):
+        full_path = resolve_cloud_pc_path(pc_id, directory)
+        try:
+            st = os.stat(full_path)
+        except OSError:
+            continue
+        entry = _catalog_new_entry(pc_id, directory)
+        _catalog_apply_stat(entry, full_path, st)
+        db.session.add(entry)
+        log_cloud_pc_change(pc_id, "created", directory)
+
+
+def catalog_record_path(pc_id: int, path: str, content_hash: Optional[str] = None) -> Optional[CloudPCFile]:
+    """Insert or refresh the catalog row for one path after it was written on disk."""
+    rel_path = normalize_cloud_pc_path(path)
+    if rel_path == "/":
+        return None
+    full_path = resolve_cloud_pc_path(pc_id, rel_path)
+    if not full_path:
+        return None
+    try:
+        st = os.stat(full_path)
+    except OSError:
+        catalog_remove_path(pc_id, rel_path)
+        return None
+
+    _catalog_ensure_parents(pc_id, rel_path)
+    entry = db.session.query(CloudPCFile).filter_by(pc_id=pc_id, path=rel_path).first()
+    is_new = entry is None
+    if is_new:
+        entry = _catalog_new_entry(pc_id, rel_path)
+        db.session.add(entry)
+    if _catalog_apply_stat(entry, full_path, st, content_hash=content_hash, rehash=True):
+        log_cloud_pc_change(pc_id, "created" if is_new else "modified", rel_path)
+    if _is_search_indexable(entry):
+        db.session.flush()
+        index_cloud_pc_file_text(entry, full_path)
+    elif entry.id is not None:
+        _drop_cloud_pc_file_text([entry.id])
+    return entry
+
+
+def catalog_record_tree(pc_id: int, path: str) -> None:
+    """Record a path and, if it is a directory, everything below it."""
+    catalog_record_path(pc_id, path)
+    full_path = resolve_cloud_pc_path(pc_id, path)
+    if not full_path or not os.path.isdir(full_path):
+        return
+    storage_dir = get_cloud_pc_storage_dir(pc_id)
+    for root, dirs, files in os.walk(full_path):
+        for item in dirs + files:
+            catalog_record_path(pc_id, os.path.relpath(os.path.join(root, item), storage_dir))
+
+
+def _catalog_subtree_query(pc_id: int, path: str):
+    return db.session.query(CloudPCFile).filter(
+        CloudPCFile.pc_id == pc_id,
+        or_(CloudPCFile.path == path, CloudPCFile.path.startswith(path + "/", autoescape=True)),
+    )
+
+
+def catalog_copy_path(pc_id: int, src_path: str, dest_path: str) -> None:
+    """Duplicate the catalog rows of a copied file or tree without re-hashing."""
+    src_rel = normalize_cloud_pc_path(src_path)
+    dest_rel = normalize_cloud_pc_path(dest_path)
+    rows = _catalog_subtree_query(pc_id, src_rel).all()
+    if not rows:
+        catalog_record_tree(pc_id, dest_rel)
+        return
+    _catalog_ensure_parents(pc_id, dest_rel)
+    copies = []
+    for row in rows:
+        entry = _catalog_new_entry(pc_id, dest_rel + row.path[len(src_rel):])
+        entry.is_dir = row.is_dir
+        entry.size = row.size
+        entry.mtime = row.mtime
+        entry.extension = row.extension
+        entry.mime_type = row.mime_type
+        entry.content_hash = row.content_hash
+        db.session.add(entry)
+        copies.append((row.id, entry))
+    db.session.flush()
+    # Same bytes, so the copies share the originals' extracted text
+    texts = {
+        text_row.file_id: text_row
+        for text_row in db.session.query(CloudPCFileText).filter(
+            CloudPCFileText.file_id.in_([source_id for source_id, _ in copies])
+        )
+    }
+    for source_id, entry in copies:
+        if source_id in texts:
+            source_text = texts[source_id]
+            db.session.add(CloudPCFileText(
+                file_id=entry.id, pc_id=pc_id, content_hash=source_text.content_hash, body=source_text.body,
+            ))
+    log_cloud_pc_change(pc_id, "created", dest_rel)
+
+
+def catalog_subtree_size(pc_id: int, path: str) -> int:
+    """Total bytes of the files at or below `path`."""
+    rel_path = normalize_cloud_pc_path(path)
+    query = db.session.query(db.func.coalesce(db.func.sum(CloudPCFile.size), 0))
+    if rel_path == "/":
+        return int(query.filter(CloudPCFile.pc_id == pc_id).scalar())
+    subtree = _catalog_subtree_query(pc_id, rel_path).with_entities(db.func.coalesce(db.func.sum(CloudPCFile.size), 0))
+    return int(subtree.scalar())
+
+
+def catalog_remove_path(pc_id: int, path: str) -> None:
+    """Drop the catalog rows for a deleted file or directory tree."""
+    rel_path = normalize_cloud_pc_path(path)
+    if rel_path == "/":
+        db.session.query(CloudPCFileText).filter_by(pc_id=pc_id).delete(synchronize_session=False)
+        db.session.query(CloudPCFile).filter_by(pc_id=pc_id).delete(synchronize_session=False)
+        log_cloud_pc_change(pc_id, "reset", "/")
+        return
+    subtree = _catalog_subtree_query(pc_id, rel_path)
+    db.session.query(CloudPCFileText).filter(
+        CloudPCFileText.file_id.in_(subtree.with_entities(CloudPCFile.id))
+    ).delete(synchronize_session=False)
+    subtree.delete(synchronize_session=False)
+    log_cloud_pc_change(pc_id, "deleted", rel_path)
+
+
+def catalog_move_path(pc_id: int, old_path: str, new_path: str) -> None:
+    """Rewrite catalog rows after a file or directory tree was renamed on disk."""
+    old_rel = normalize_cloud_pc_path(old_path)
+    new_rel = normalize_cloud_pc_path(new_path)
+    rows = _catalog_subtree_query(pc_id, old_rel).all()
+    if not rows:
+        catalog_record_tree(pc_id, new_rel)
+        return
+    indexed_ids = {
+        file_id
+        for (file_id,) in db.session.query(CloudPCFileText.file_id).filter(
+            CloudPCFileText.file_id.in_([row.id for row in rows])
+        )
+    }
+    unindexed = []
+    for row in rows:
+        row.path = new_rel + row.path[len(old_rel):]
+        row.parent = _cloud_pc_parent_path(row.path)
+        row.name = row.path.rsplit("/", 1)[-1]
+        if not row.is_dir:
+            extension = os.path.splitext(row.name)[1].lower().lstrip(".")
+            row.extension = extension[:32] or None
+            row.mime_type = mimetypes.guess_type(row.name)[0]
+            # The extension decides indexability, so a rename can add or remove a file from search
+            if not _is_search_indexable(row):
+                if row.id in indexed_ids:
+                    unindexed.append(row.id)
+            elif row.id not in indexed_ids:
+                index_cloud_pc_file_text(row)
+    _drop_cloud_pc_file_text(unindexed)
+    _catalog_ensure_parents(pc_id, new_rel)
+    log_cloud_pc_change(pc_id, "renamed", new_rel, old_path=old_rel)
+
+
+def _ensure_change_counter(pc_id: int) -> None:
+    if db.session.query(CloudPCChangeCounter.pc_id).filter_by(pc_id=pc_id).first():
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.add(CloudPCChangeCounter(pc_id=pc_id, version=0))
+    except IntegrityError:
+        pass  # Another worker created the row first
+
+
+def get_cloud_pc_change_version(pc_id: int) -> int:
+    version = db.session.query(CloudPCChangeCounter.version).filter_by(pc_id=pc_id).scalar()
+    return version or 0
+
+
+def log_cloud_pc_change(pc_id: int, event: str, path: str, old_path: Optional[str] = None) -> None:
+    """Append an event to the PC's change feed inside the caller's transaction.
+
+    The counter UPDATE locks the PC's counter row until commit, so concurrent
+    writers to the same PC commit their versions in order and a `since` cursor
+    never skips an event.
+    """
+    _ensure_change_counter(pc_id)
+    db.session.execute(
+        update(CloudPCChangeCounter)
+        .where(CloudPCChangeCounter.pc_id == pc_id)
+        .values(version=CloudPCChangeCounter.version + 1)
+    )
+    version = get_cloud_pc_change_version(pc_id)
+    db.session.add(CloudPCChange(pc_id=pc_id, version=version, event=event, path=path, old_path=old_path))
+    if version % 100 == 0:
+        db.session.query(CloudPCChange).filter(
+            CloudPCChange.pc_id == pc_id,
+            CloudPCChange.version <= version - CLOUD_PC_CHANGE_RETENTION,
+        ).delete(synchronize_session=False)
+
+
+def get_cloud_pc_changes(pc_id: int, since: int, limit: int = 500) -> dict:
+    """Return feed events after `since`; `reset` tells the client to re-list instead."""
+    current = get_cloud_pc_change_version(pc_id)
+    if since > current or since < current - CLOUD_PC_CHANGE_RETENTION:
+        return {"changes": [], "version": current, "current_version": current, "has_more": False, "reset": True}
+
+    rows = (
+        db.session.query(CloudPCChange)
+        .filter(CloudPCChange.pc_id == pc_id, CloudPCChange.version > since)
+        .order_by(CloudPCChange.version)
+        .limit(limit)
+        .all()
+    )
+    # Attach the current catalog row so clients can apply creates/renames without another request
+    live_paths = {row.path for row in rows if row.event in ("created", "modified", "renamed")}
+    entries = {}
+    if live_paths:
+        entries = {
+            entry.path: entry
+            for entry in db.session.query(CloudPCFile).filter(
+                CloudPCFile.pc_id == pc_id, CloudPCFile.path.in_(live_paths)
+            )
+        }
+    changes = []
+    for row in rows:
+        change = row.to_dict()
+        entry = entries.get(row.path) if row.event in ("created", "modified", "renamed") else None
+        change["entry"] = entry.to_dict() if entry else None
+        changes.append(change)
+    version = rows[-1].version if rows else since
+    return {
+        "changes": changes,
+        "version": version,
+        "current_version": current,
+        "has_more": version < current,
+        "reset": any(row.event == "reset" for row in rows),
+    }
+
+
+def reconcile_cloud_pc_catalog(pc_id: int) -> dict:
+    """Repair drift between the catalog and the files actually on disk.
+
+    Rows are re-hashed only when size or mtime changed, so a clean PC costs one
+    stat per entry.
+    """
+    storage_dir = get_cloud_pc_storage_dir(pc_id)
+    existing = {row.path: row for row in db.session.query(CloudPCFile).filter_by(pc_id=pc_id)}
+    stats = {"added": 0, "updated": 0, "removed": 0}
+    changes = []
+    seen = set()
+
+    if os.path.isdir(storage_dir):
+        for root, dirs, files in os.walk(storage_dir):
+            for item in dirs + files:
+                if TEMP_UPLOAD_SUFFIX_RE.search(item):
+                    continue  # in-flight upload
+                full_path = os.path.join(root, item)
+                rel_path = normalize_cloud_pc_path(os.path.relpath(full_path, storage_dir))
+                try:
+                    st = os.stat(full_path)
+                except OSError:
+                    continue
+                seen.add(rel_path)
+                entry = existing.get(rel_path)
+                if entry is None:
+                    entry = _catalog_new_entry(pc_id, rel_path)
+                    _catalog_apply_stat(entry, full_path, st)
+                    db.session.add(entry)
+                    stats["added"] += 1
+                    changes.append(("created", rel_path))
+                elif _catalog_apply_stat(entry, full_path, st):
+                    stats["updated"] += 1
+                    changes.append(("modified", rel_path))
+
+    for rel_path, entry in existing.items():
+        if rel_path not in seen:
+            db.session.delete(entry)
+            stats["removed"] += 1
+            changes.append(("deleted", rel_path))
+
+    # Large repairs are announced as a reset so clients re-list instead of replaying them
+    if len(changes) > 200:
+        changes = [("reset", "/")]
+    for event, rel_path in changes:
+        log_cloud_pc_change(pc_id, event, rel_path)
+    sync_cloud_pc_search_index(pc_id)
+    db.session.commit()
+    return stats
+
+
+def ensure_cloud_pc_catalog(pc_id: int) -> None:
+    """Build the catalog on first use for PCs whose files predate it."""
+    if db.session.query(CloudPCFile.id).filter_by(pc_id=pc_id).first():
+        return
+    storage_dir = get_cloud_pc_storage_dir(pc_id)
+    if os.path.isdir(storage_dir) and any(os.scandir(storage_dir)):
+        reconcile_cloud_pc_catalog(pc_id)
+
+
+def _stored_file_size(directory: str, filename: Optional[str]) -> int:
+    if not filename:
+        return 0
+    file_path = os.path.join(directory, filename)
+    return os.path.getsize(file_path) if os.path.isfile(file_path) else 0
+
+
+def _set_ledger(scope: str, scope_id: int, bytes_used: int) -> None:
+    _ensure_ledger_row(scope, scope_id)
+    db.session.execute(
+        update(StorageLedger)
+        .where(StorageLedger.scope == scope, StorageLedger.scope_id == scope_id)
+        .values(bytes_used=bytes_used, updated_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+
+
+def reconcile_storage_ledger() -> dict:
+    """Recompute every ledger row from what is actually on disk.
+
+    Meant to run periodically (see the `reconcile-storage` CLI command); writes
+    that land while it runs are corrected on the next pass.
+    """
+    pc_totals = {}
+    pc_count = 0
+    for cloud_pc in db.session.query(CloudPC).all():
+        pc_count += 1
+        reconcile_cloud_pc_catalog(cloud_pc.id)
+        pc_bytes = catalog_subtree_size(cloud_pc.id, "/")
+        pc_totals.setdefault(cloud_pc.owner_id, 0)
+        pc_totals[cloud_pc.owner_id] += pc_bytes
+        _set_ledger("cloud_pc", cloud_pc.id, pc_bytes)
+        cloud_pc.storage_used_mb = pc_bytes // (1024 * 1024)
+
+    user_totals = {user_id: 0 for (user_id,) in db.session.query(User.id).all()}
+    for owner_id, pc_bytes in pc_totals.items():
+        user_totals[owner_id] = user_totals.get(owner_id, 0) + pc_bytes
+    sources = [
+        (db.session.query(Video.owner_id, Video.filename), VIDEO_DIR),
+        (db.session.query(Blog.owner_id, Blog.image_filename), BLOG_IMAGE_DIR),
+        (db.session.query(Message.sender_id, Message.attachment_filename), MESSAGE_ATTACH_DIR),
+        (db.session.query(AIImage.owner_id, AIImage.filename), AI_IMAGE_DIR),
+        (
+            db.session.query(ResearchSubmission.user_id, ResearchSubmissionPhoto.filename)
+            .join(ResearchSubmissionPhoto, ResearchSubmissionPhoto.submission_id == ResearchSubmission.id),
+            RESEARCH_PHOTO_DIR,
+        ),
+    ]
+    for query, directory in sources:
+        for owner_id, filename in query:
+            user_totals[owner_id] = user_totals.get(owner_id, 0) + _stored_file_size(directory, filename)
+
+    for user_id, total in user_totals.items():
+        _set_ledger("user", user_id, total)
+    db.session.commit()
+    return {"users": len(user_totals), "cloud_pcs": pc_count}
+
+
+CLOUD_PC_SEARCH_EXTENSIONS = {
+    "txt", "md", "markdown", "csv", "tsv", "json", "html", "htm", "css", "js", "jsx", "ts", "tsx",
+    "py", "java", "c", "cpp", "h", "hpp", "cs", "go", "rs", "rb", "php", "sh", "sql", "xml",
+    "yml", "yaml", "toml", "ini", "cfg", "conf", "log", "svg", "tex", "rtf",
+}
+SEARCH_MARK_START = "\x02"
+SEARCH_MARK_END = "\x03"
+_cloud_pc_search_backend = None
+
+
+def _is_search_indexable(entry: CloudPCFile) -> bool:
+    if entry.is_dir or entry.size > MAX_SEARCH_INDEX_BYTES:
+        return False
+    return entry.extension in CLOUD_PC_SEARCH_EXTENSIONS or (entry.mime_type or "").startswith("text/")
+
+
+def index_cloud_pc_file_text(entry: CloudPCFile, full_path: Optional[str] = None) -> None:
+    """Store the text of one cataloged file so the full-text index picks it up."""
+    full_path = full_path or resolve_cloud_pc_path(entry.pc_id, entry.path)
+    try:
+        with open(full_path, "rb") as f:
+            raw = f.read(MAX_SEARCH_INDEX_BYTES + 1)
+    except OSError:
+        return
+    body = "" if b"\x00" in raw else raw.decode("utf-8", errors="ignore")
+    text_row = db.session.get(CloudPCFileText, entry.id)
+    if text_row is None:
+        text_row = CloudPCFileText(file_id=entry.id)
+        db.session.add(text_row)
+    text_row.pc_id = entry.pc_id
+    text_row.content_hash = entry.content_hash
+    text_row.body = body
+
+
+def _drop_cloud_pc_file_text(file_ids: List[int]) -> None:
+    if file_ids:
+        db.session.query(CloudPCFileText).filter(CloudPCFileText.file_id.in_(file_ids)).delete(
+            synchronize_session=False
+        )
+
+
+def sync_cloud_pc_search_index(pc_id: int) -> int:
+    """Index files whose text is missing or stale and drop rows for removed files.
+
+    Single writes are indexed as they happen; restores, clones and reconciliation
+    call this for the whole PC, in the caller's transaction; search only reads.
+    Returns the number of files indexed.
+    """
+    db.session.query(CloudPCFileText).filter(
+        CloudPCFileText.pc_id == pc_id,
+        ~CloudPCFileText.file_id.in_(db.session.query(CloudPCFile.id).filter(CloudPCFile.pc_id == pc_id)),
+    ).delete(synchronize_session=False)
+
+    stale = (
+        db.session.query(CloudPCFile)
+        .outerjoin(CloudPCFileText, CloudPCFileText.file_id == CloudPCFile.id)
+        .filter(
+            CloudPCFile.pc_id == pc_id,
+            CloudPCFile.is_dir.is_(False),
+            CloudPCFile.size <= MAX_SEARCH_INDEX_BYTES,
+            or_(
+                CloudPCFileText.file_id.is_(None),
+                CloudPCFileText.pc_id != pc_id,
+                CloudPCFileText.content_hash.is_(None),
+                CloudPCFileText.content_hash != CloudPCFile.content_hash,
+            ),
+        )
+        .all()
+    )
+    indexed = 0
+    for entry in stale:
+        if _is_search_indexable(entry):
+            index_cloud_pc_file_text(entry)
+            indexed += 1
+    return indexed
+
+
+def init_cloud_pc_search_index() -> str:
+    """Create the database-specific full-text structures; returns the backend in use."""
+    global _cloud_pc_search_backend
+    dialect = db.engine.dialect.name
+    try:
+        if dialect == "sqlite":
+            with db.engine.begin() as conn:
+                conn.execute(text(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS cloud_pc_file_text_fts USING fts5("
+                    "body, content='cloud_pc_file_text', content_rowid='file_id', tokenize='unicode61')"
+                ))
+                conn.execute(text(
+                    "CREATE TRIGGER IF NOT EXISTS cloud_pc_file_text_ai AFTER INSERT ON cloud_pc_file_text BEGIN "
+                    "INSERT INTO cloud_pc_file_text_fts(rowid, body) VALUES (new.file_id, new.body); END"
+                ))
+                conn.execute(text(
+                    "CREATE TRIGGER IF NOT EXISTS cloud_pc_file_text_ad AFTER DELETE ON cloud_pc_file_text BEGIN "
+                    "INSERT INTO cloud_pc_file_text_fts(cloud_pc_file_text_fts, rowid, body) "
+                    "VALUES ('delete', old.file_id, old.body); END"
+                ))
+                conn.execute(text(
+                    "CREATE TRIGGER IF NOT EXISTS cloud_pc_file_text_au AFTER UPDATE ON cloud_pc_file_text BEGIN "
+                    "INSERT INTO cloud_pc_file_text_fts(cloud_pc_file_text_fts, rowid, body) "
+                    "VALUES ('delete', old.file_id, old.body); "
+                    "INSERT INTO cloud_pc_file_text_fts(rowid, body) VALUES (new.file_id, new.body); END"
+                ))
+            _cloud_pc_search_backend = "fts5"
+        elif dialect == "postgresql":
+            with db.engine.begin() as conn:
+                conn.execute(text(
+                    "CREATE INDEX IF NOT EXISTS ix_cloud_pc_file_text_tsv ON cloud_pc_file_text "
+                    "USING GIN (to_tsvector('simple', body))"
+                ))
+            _cloud_pc_search_backend = "tsvector"
+        else:
+            _cloud_pc_search_backend = "like"
+    except Exception as e:
+        logger.warning(f"Full-text index unavailable, falling back to LIKE search: {e}")
+        _cloud_pc_search_backend = "like"
+    return _cloud_pc_search_backend
+
+
+def _search_terms(query: str) -> List[str]:
+    return re.findall(r"\w+", query.lower())[:16]
+
+
+def _fallback_snippet(body: str, terms: List[str], width: int = 80) -> str:
+    lowered = body.lower()
+    position = min((lowered.find(term) for term in terms if term in lowered), default=0)
+    start = max(position - width // 2, 0)
+    snippet = body[start:start + width]
+    for term in terms:
+        snippet = re.sub(
+            re.escape(term),
+            lambda match: SEARCH_MARK_START + match.group(0) + SEARCH_MARK_END,
+            snippet,
+            flags=re.IGNORECASE,
+        )
+    return ("…" if start else "") + snippet + ("…" if start + width < len(body) else "")
+
+
+def search_cloud_pc_text(pc_id: int, query: str, path: str = "/", limit: int = 20, offset: int = 0) -> List[dict]:
+    """Run a ranked full-text query over one PC's indexed files."""
+    terms = _search_terms(query)
+    if not terms:
+        return []
+    backend = _cloud_pc_search_backend or init_cloud_pc_search_index()
+    rel_path = normalize_cloud_pc_path(path)
+    params = {"pc_id": pc_id, "limit": limit, "offset": offset, "prefix": rel_path.rstrip("/") + "/%"}
+    path_filter = "" if rel_path == "/" else "AND f.path LIKE :prefix"
+
+    if backend == "fts5":
+        # Quote every term so user input is never parsed as FTS syntax; the last one matches as a prefix
+        params["match"] = " ".join('"%s"' % term for term in terms[:-1]) + ' "%s"*' % terms[-1]
+        params["start"], params["end"] = SEARCH_MARK_START, SEARCH_MARK_END
+        sql = (
+            "SELECT f.id, bm25(cloud_pc_file_text_fts) AS score, "
+            "snippet(cloud_pc_file_text_fts, 0, :start, :end, '…', 16) AS snippet "
+            "FROM cloud_pc_file_text_fts "
+            "JOIN cloud_pc_file_text t ON t.file_id = cloud_pc_file_text_fts.rowid "
+            "JOIN cloud_pc_files f ON f.id = t.file_id "
+            f"WHERE cloud_pc_file_text_fts MATCH :match AND t.pc_id = :pc_id AND f.pc_id = :pc_id {path_filter} "
+            "ORDER BY score LIMIT :limit OFFSET :offset"
+        )
+        rows = [(row.id, -row.score, row.snippet) for row in db.session.execute(text(sql), params)]
+    elif backend == "tsvector":
+        params["query"] = " & ".join(terms[:-1] + [terms[-1] + ":*"])
+        params["options"] = f"StartSel={SEARCH_MARK_START}, StopSel={SEARCH_MARK_END}, MaxWords=24, MinWords=8"
+        sql = (
+            "SELECT f.id, ts_rank(to_tsvector('simple', t.body), q) AS score, "
+            "ts_headline('simple', t.body, q, :options) AS snippet "
+            "FROM cloud_pc_file_text t JOIN cloud_pc_files f ON f.id = t.file_id, "
+            "to_tsquery('simple', :query) q "
+            f"WHERE to_tsvector('simple', t.body) @@ q AND t.pc_id = :pc_id AND f.pc_id = :pc_id {path_filter} "
+            "ORDER BY score DESC LIMIT :limit OFFSET :offset"
+        )
+        rows = [(row.id, float(row.score), row.snippet) for row in db.session.execute(text(sql), params)]
+    else:
+        candidates = db.session.query(CloudPCFile.id, CloudPCFileText.body).join(
+            CloudPCFileText, CloudPCFileText.file_id == CloudPCFile.id
+        ).filter(CloudPCFile.pc_id == pc_id, CloudPCFileText.pc_id == pc_id)
+        if rel_path != "/":
+            candidates = candidates.filter(CloudPCFile.path.startswith(rel_path + "/", autoescape=True))
+        for term in terms:
+            candidates = candidates.filter(CloudPCFileText.body.ilike(f"%{term}%"))
+        scored = []
+        for file_id, body in candidates:
+            lowered = body.lower()
+            scored.append((file_id, float(sum(lowered.count(term) for term in terms)), _fallback_snippet(body, terms)))
+        scored.sort(key=lambda row: -row[1])
+        rows = scored[offset:offset + limit]
+
+    entries = {
+        entry.id: entry
+        for entry in db.session.query(CloudPCFile).filter(CloudPCFile.id.in_([row[0] for row in rows]))
+    }
+    results = []
+    for file_id, score, snippet in rows:
+        entry = entries.get(file_id)
+        if not entry:
+            continue
+        # Escape the file text, then turn the sentinel markers into highlight tags
+        snippet = html.escape(snippet or "").replace(SEARCH_MARK_START, "<mark>").replace(SEARCH_MARK_END, "</mark>")
+        results.append({**entry.to_dict(), "score": round(score, 4), "snippet": snippet})
+    return results
+
+
+def _catalog_listing_response(query, key: str = "files"):
+    """Apply ?sort=&order=&page=&per_page= to a catalog query and serialize it."""
+    sort = request.args.get("sort", "name")
+    column = CLOUD_PC_CATALOG_SORT_COLUMNS.get(sort, CloudPCFile.name)
+    descending = request.args.get("order", "asc").lower() == "desc"
+    query = query.order_by(
+        CloudPCFile.is_dir.desc(),
+        column.desc() if descending else column.asc(),
+        CloudPCFile.name.asc(),
+    )
+
+    payload = {}
+    if "page" in request.args or "per_page" in request.args:
+        page = max(request.args.get("page", 1, type=int), 1)
+        per_page = min(max(request.args.get("per_page", 100, type=int), 1), 500)
+        total = query.count()
+        query = query.offset((page - 1) * per_page).limit(per_page)
+        payload["pagination"] = {
+            "page": page,
+            "per_page": per_page,
+            "total": total,
+            "pages": (total + per_page - 1) // per_page,
+        }
+    payload[key] = [entry.to_dict() for entry in query.all()]
+    return payload
+
+
+
+@app.get("/api/storage/usage")
+@login_required
+def get_storage_usage():
+    """Return the current user's byte-exact storage usage and quotas."""
+    try:
+        user = current_user()
+        if not user:
+            return jsonify({"error": "Authentication required"}), 401
+        
+        pc_ids = [pc_id for (pc_id,) in db.session.query(CloudPC.id).filter_by(owner_id=user.id).all()]
+        pc_rows = {}
+        if pc_ids:
+            pc_rows = {
+                row.scope_id: row.bytes_used
+                for row in db.session.query(StorageLedger).filter(
+                    StorageLedger.scope == "cloud_pc", StorageLedger.scope_id.in_(pc_ids)
+                )
+            }
+        
+        return jsonify({
+            "bytes_used": get_storage_used("user", user.id),
+            "quota_bytes": USER_STORAGE_QUOTA_BYTES or None,
+            "cloud_pcs": [
+                {
+                    "id": pc_id,
+                    "bytes_used": pc_rows.get(pc_id, 0),
+                    "quota_bytes": CLOUD_PC_STORAGE_QUOTA_BYTES or None,
+                }
+                for pc_id in pc_ids
+            ],
+        })
+    except Exception as e:
+        logger.exception(f"Error loading storage usage: {e}")
+        return jsonify({"error": "Failed to load storage usage"}), 500
+
+
+@app.get("/api/cloud-pcs")
+@login_required
 def list_cloud_pcs():
     """Get all cloud PCs for the current user."""
     try:
@@ -3503,31 +6291,159 @@ def list_cloud_pc_files(pc_id: int):
         
         path = request.args.get("path", "/")
         # All data is stored in VM-specific directory linked to account
-        storage_dir = os.path.join(UPLOAD_ROOT, "cloud_pcs", f"pc_{pc_id}", "storage")
-        full_path = os.path.join(storage_dir, path.lstrip("/"))
+        full_path = resolve_cloud_pc_path(pc_id, path)
         
         # Security: ensure path is within VM's storage directory (linked to account)
-        if not os.path.abspath(full_path).startswith(os.path.abspath(storage_dir)):
+        if not full_path:
             return jsonify({"error": "Invalid path"}), 400
         
         os.makedirs(full_path, exist_ok=True)
         
-        files = []
-        for item in os.listdir(full_path):
-            item_path = os.path.join(full_path, item)
-            files.append({
-                "name": item,
-                "type": "directory" if os.path.isdir(item_path) else "file",
-                "size": os.path.getsize(item_path) if os.path.isfile(item_path) else 0,
-                "modified": datetime.fromtimestamp(os.path.getmtime(item_path)).isoformat()
-            })
+        # Listings are served from the catalog instead of listdir + stat per entry
+        ensure_cloud_pc_catalog(pc_id)
+        # Read the feed version first so changes racing with this listing are replayed, not lost
+        version = get_cloud_pc_change_version(pc_id)
+        rel_path = normalize_cloud_pc_path(path)
+        if rel_path != "/" and not db.session.query(CloudPCFile.id).filter_by(pc_id=pc_id, path=rel_path).first():
+            catalog_record_path(pc_id, rel_path)
+            db.session.commit()
         
-        return jsonify({"files": files, "path": path})
+        query = db.session.query(CloudPCFile).filter_by(pc_id=pc_id, parent=rel_path)
+        payload = _catalog_listing_response(query)
+        payload["path"] = path
+        payload["version"] = version
+        return jsonify(payload)
     except Exception as e:
         logger.exception(f"Error listing files: {e}")
+        db.session.rollback()
         return jsonify({"error": "Failed to list files"}), 500
 
 
+@app.get("/api/cloud-pcs/<int:pc_id>/files/find")
+@login_required
+def find_cloud_pc_files(pc_id: int):
+    """Recursively search a cloud PC's files by name and/or extension."""
+    try:
+        user = current_user()
+        if not user:
+            return jsonify({"error": "Authentication required"}), 401
+        
+        cloud_pc = db.session.query(CloudPC).filter_by(id=pc_id, owner_id=user.id).first()
+        if not cloud_pc:
+            return jsonify({"error": "Cloud PC not found"}), 404
+        
+        path = request.args.get("path", "/")
+        if not resolve_cloud_pc_path(pc_id, path):
+            return jsonify({"error": "Invalid path"}), 400
+        
+        name = request.args.get("name", "").strip()
+        extension = request.args.get("ext", "").strip().lower().lstrip(".")
+        file_type = request.args.get("type", "").strip()
+        
+        ensure_cloud_pc_catalog(pc_id)
+        query = db.session.query(CloudPCFile).filter(CloudPCFile.pc_id == pc_id)
+        rel_path = normalize_cloud_pc_path(path)
+        if rel_path != "/":
+            query = query.filter(CloudPCFile.path.startswith(rel_path + "/", autoescape=True))
+        if name:
+            query = query.filter(CloudPCFile.name.contains(name, autoescape=True))
+        if extension:
+            query = query.filter(CloudPCFile.extension == extension)
+        if file_type in ("file", "directory"):
+            query = query.filter(CloudPCFile.is_dir.is_(file_type == "directory"))
+        
+        payload = _catalog_listing_response(query, key="results")
+        payload["path"] = path
+        return jsonify(payload)
+    except Exception as e:
+        logger.exception(f"Error searching files: {e}")
+        db.session.rollback()
+        return jsonify({"error": "Failed to search files"}), 500
+
+
+@app.get("/api/cloud-pcs/<int:pc_id>/files/search")
+@login_required
+def search_cloud_pc_file_contents(pc_id: int):
+    """Full-text search inside a cloud PC's text files, ranked with highlighted snippets."""
+    try:
+        user = current_user()
+        if not user:
+            return jsonify({"error": "Authentication required"}), 401
+        
+        cloud_pc = db.session.query(CloudPC).filter_by(id=pc_id, owner_id=user.id).first()
+        if not cloud_pc:
+            return jsonify({"error": "Cloud PC not found"}), 404
+        
+        query = request.args.get("q", "").strip()
+        if not query:
+            return jsonify({"error": "Search query is required"}), 400
+        
+        path = request.args.get("path", "/")
+        if not resolve_cloud_pc_path(pc_id, path):
+            return jsonify({"error": "Invalid path"}), 400
+        
+        try:
+            page = max(int(request.args.get("page", 1)), 1)
+            per_page = min(max(int(request.args.get("per_page", 20)), 1), 100)
+        except ValueError:
+            return jsonify({"error": "Invalid pagination parameters"}), 400
+        
+        ensure_cloud_pc_catalog(pc_id)
+        results = search_cloud_pc_text(pc_id, query, path=path, limit=per_page, offset=(page - 1) * per_page)
+        return jsonify({"results": results, "query": query, "page": page, "per_page": per_page})
+    except Exception as e:
+        logger.exception(f"Error searching file contents: {e}")
+        db.session.rollback()
+        return jsonify({"error": "Failed to search files"}), 500
+
+
+@app.get("/api/cloud-pcs/<int:pc_id>/changes")
+@login_required
+def list_cloud_pc_changes(pc_id: int):
+    """Return storage changes after `since` so file managers can update incrementally."""
+    try:
+        user = current_user()
+        if not user:
+            return jsonify({"error": "Authentication required"}), 401
+        
+        cloud_pc = db.session.query(CloudPC).filter_by(id=pc_id, owner_id=user.id).first()
+        if not cloud_pc:
+            return jsonify({"error": "Cloud PC not found"}), 404
+        
+        try:
+            since = int(request.args.get("since", 0))
+            limit = min(max(int(request.args.get("limit", 500)), 1), 1000)
+        except ValueError:
+            return jsonify({"error": "Invalid since or limit"}), 400
+        
+        return jsonify(get_cloud_pc_changes(pc_id, since, limit=limit))
+    except Exception as e:
+        logger.exception(f"Error listing cloud PC changes: {e}")
+        return jsonify({"error": "Failed to load changes"}), 500
+
+
+@app.post("/api/cloud-pcs/<int:pc_id>/files/reconcile")
+@login_required
+def reconcile_cloud_pc_files(pc_id: int):
+    """Re-sync the file catalog of a cloud PC with its storage directory."""
+    try:
+        user = current_user()
+        if not user:
+            return jsonify({"error": "Authentication required"}), 401
+        
+        cloud_pc = db.session.query(CloudPC).filter_by(id=pc_id, owner_id=user.id).first()
+        if not cloud_pc:
+            return jsonify({"error": "Cloud PC not found"}), 404
+        
+        stats = reconcile_cloud_pc_catalog(pc_id)
+        logger.info(f"Reconciled file catalog for cloud PC {pc_id}: {stats}")
+        return jsonify({"message": "File catalog reconciled", "stats": stats})
+    except Exception as e:
+        logger.exception(f"Error reconciling file catalog: {e}")
+        db.session.rollback()
+        return jsonify({"error": "Failed to reconcile files"}), 500
+
+
 @app.post("/api/cloud-pcs/<int:pc_id>/files/upload")
 @login_required
 def upload_cloud_pc_file(pc_id: int):
@@ -3559,14 +6475,16 @@ def upload_cloud_pc_file(pc_id: int):
         
         filename = file.filename
         file_path = os.path.join(full_path, filename)
-        file.save(file_path)
         
-        # Update storage used
-        file_size_mb = os.path.getsize(file_path) / (1024 * 1024)
-        cloud_pc.storage_used_mb += int(file_size_mb)
+        # Stream to disk under quota; storage used is charged byte-exact
+        _, content_hash = save_user_upload(file.stream, file_path, user.id, pc_id=pc_id)
+        catalog_record_path(pc_id, os.path.relpath(file_path, storage_dir), content_hash=content_hash)
         db.session.commit()
         
         return jsonify({"message": "File uploaded successfully"})
+    except StorageQuotaExceeded as quota_error:
+        db.session.rollback()
+        return storage_quota_response(quota_error)
     except Exception as e:
         logger.exception(f"Error uploading file: {e}")
         return jsonify({"error": "Failed to upload file"}), 500
@@ -3601,17 +6519,19 @@ def create_cloud_pc_file(pc_id: int):
         
         item_path = os.path.join(full_path, name)
         
+        content_hash = None
         if type == "directory":
             os.makedirs(item_path, exist_ok=True)
         else:
-            with open(item_path, 'w', encoding='utf-8') as f:
-                f.write(content)
-            
-            file_size_mb = os.path.getsize(item_path) / (1024 * 1024)
-            cloud_pc.storage_used_mb += int(file_size_mb)
-            db.session.commit()
+            content_hash = write_user_bytes(item_path, content.encode('utf-8'), user.id, pc_id=pc_id)
+        
+        catalog_record_path(pc_id, os.path.relpath(item_path, storage_dir), content_hash=content_hash)
+        db.session.commit()
         
         return jsonify({"message": f"{type.capitalize()} created successfully"})
+    except StorageQuotaExceeded as quota_error:
+        db.session.rollback()
+        return storage_quota_response(quota_error)
     except Exception as e:
         logger.exception(f"Error creating file: {e}")
         return jsonify({"error": "Failed to create file"}), 500
@@ -3645,22 +6565,28 @@ def read_cloud_pc_file(pc_id: int):
         mime_type, _ = mimetypes.guess_type(file_path)
         is_binary = mime_type and mime_type.startswith(('image/', 'video/', 'audio/', 'application/'))
         
+        # The ETag is the sha256 of the bytes on disk; patch writes must name it as their base
+        etag = _hash_file(file_path)
+        
         if is_binary:
             # For binary files, return as base64
             import base64
             with open(file_path, 'rb') as f:
                 file_bytes = f.read()
                 content = base64.b64encode(file_bytes).decode('utf-8')
-            return jsonify({
+            response = jsonify({
                 "content": content,
                 "is_binary": True,
                 "mime_type": mime_type,
-                "filename": os.path.basename(file_path)
+                "filename": os.path.basename(file_path),
+                "etag": etag,
             })
+            response.headers["ETag"] = f'"{etag}"'
+            return response
         else:
             # Read text file
             try:
-                with open(file_path, 'r', encoding='utf-8') as f:
+                with open(file_path, 'r', encoding='utf-8', newline='') as f:
                     content = f.read()
             except UnicodeDecodeError:
                 # Try with different encoding or return as binary
@@ -3672,15 +6598,204 @@ def read_cloud_pc_file(pc_id: int):
                     "content": content,
                     "is_binary": True,
                     "mime_type": "application/octet-stream",
-                    "filename": os.path.basename(file_path)
+                    "filename": os.path.basename(file_path),
+                    "etag": etag,
                 })
             
-            return jsonify({"content": content, "is_binary": False})
+            response = jsonify({"content": content, "is_binary": False, "etag": etag})
+            response.headers["ETag"] = f'"{etag}"'
+            return response
     except Exception as e:
         logger.exception(f"Error reading file: {e}")
         return jsonify({"error": "Failed to read file"}), 500
 
 
+class PatchConflict(Exception):
+    """Raised when a patch does not apply to the current file content."""
+
+
+def lock_cloud_pc_for_write(pc_id: int) -> None:
+    """Serialize read-modify-write cycles on one PC until the transaction ends.
+
+    A no-op UPDATE of the change counter takes its row lock (Postgres) or the
+    database write lock (SQLite), so a concurrent writer cannot slip in between
+    the ETag check and the write.
+    """
+    _ensure_change_counter(pc_id)
+    db.session.execute(
+        update(CloudPCChangeCounter)
+        .where(CloudPCChangeCounter.pc_id == pc_id)
+        .values(version=CloudPCChangeCounter.version)
+    )
+
+
+def _request_base_etag(data: dict) -> Optional[str]:
+    etag = data.get("base_etag") or request.headers.get("If-Match")
+    return etag.strip().strip('"') if etag else None
+
+
+def apply_line_edits(content: str, edits: list) -> str:
+    """Apply [{"start", "end", "text"}] replacements of 1-based inclusive line ranges.
+
+    `end = start - 1` inserts before `start`. Ranges are resolved against the
+    original content, so edits must not overlap.
+    """
+    lines = content.splitlines(keepends=True)
+    parsed = []
+    for edit in edits:
+        if not isinstance(edit, dict):
+            raise PatchConflict("Each edit must be an object")
+        try:
+            start = int(edit["start"])
+            end = int(edit.get("end", start))
+        except (KeyError, TypeError, ValueError):
+            raise PatchConflict("Each edit needs integer 'start' and 'end' lines")
+        replacement = edit.get("text", "")
+        if not isinstance(replacement, str):
+            raise PatchConflict("Edit 'text' must be a string")
+        if start < 1 or end < start - 1 or end > len(lines) or start > len(lines) + 1:
+            raise PatchConflict(f"Edit range {start}-{end} is outside the file ({len(lines)} lines)")
+        parsed.append((start, end, replacement))
+
+    parsed.sort(key=lambda item: (item[0], item[1]))
+    for previous, current in zip(parsed, parsed[1:]):
+        if current[0] <= previous[1]:
+            raise PatchConflict("Edits overlap")
+    for start, end, replacement in reversed(parsed):
+        lines[start - 1:end] = [replacement] if replacement else []
+    return "".join(lines)
+
+
+_HUNK_HEADER_RE = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+
+
+def apply_unified_diff(content: str, diff: str) -> str:
+    """Apply a unified diff strictly (no fuzz); context lines must match exactly."""
+    lines = content.splitlines(keepends=True)
+    diff_lines = diff.splitlines()
+    result = []
+    cursor = 0  # index into `lines` of the next unconsumed original line
+    index = 0
+    saw_hunk = False
+    while index < len(diff_lines):
+        match = _HUNK_HEADER_RE.match(diff_lines[index])
+        if not match:
+            index += 1  # file headers and anything outside hunks
+            continue
+        saw_hunk = True
+        old_start, old_count = int(match.group(1)), int(match.group(2) or 1)
+        new_count = int(match.group(4) or 1)
+        hunk_start = old_start if old_count == 0 else old_start - 1
+        if hunk_start < cursor or hunk_start > len(lines):
+            raise PatchConflict(f"Hunk at line {old_start} is out of order or outside the file")
+        result.extend(lines[cursor:hunk_start])
+        cursor = hunk_start
+        index += 1
+        while old_count > 0 or new_count > 0:
+            if index >= len(diff_lines):
+                raise PatchConflict("Diff hunk is truncated")
+            line = diff_lines[index]
+            # Some tools strip the leading space from empty context lines
+            marker, body = (line[:1], line[1:]) if line else (" ", "")
+            no_newline = index + 1 < len(diff_lines) and diff_lines[index + 1].startswith("\\")
+            if marker in (" ", "-"):
+                if cursor >= len(lines) or lines[cursor].rstrip("\r\n") != body:
+                    raise PatchConflict(f"Patch does not apply at line {cursor + 1}")
+                if marker == " ":
+                    result.append(lines[cursor])
+                    new_count -= 1
+                cursor += 1
+                old_count -= 1
+            elif marker == "+":
+                result.append(body if no_newline else body + "\n")
+                new_count -= 1
+            elif marker != "\\":
+                raise PatchConflict(f"Malformed diff line: {line[:40]}")
+            index += 1
+    if not saw_hunk:
+        raise PatchConflict("Diff contains no hunks")
+    result.extend(lines[cursor:])
+    return "".join(result)
+
+
+@app.patch("/api/cloud-pcs/<int:pc_id>/files")
+@login_required
+def patch_cloud_pc_file(pc_id: int):
+    """Apply line edits or a unified diff to a text file, guarded by its ETag."""
+    try:
+        user = current_user()
+        if not user:
+            return jsonify({"error": "Authentication required"}), 401
+        
+        cloud_pc = db.session.query(CloudPC).filter_by(id=pc_id, owner_id=user.id).first()
+        if not cloud_pc:
+            return jsonify({"error": "Cloud PC not found"}), 404
+        
+        data = ensure_json_request()
+        path = data.get("path", "")
+        base_etag = _request_base_etag(data)
+        edits = data.get("edits")
+        diff = data.get("diff")
+        if not base_etag:
+            return jsonify({"error": "base_etag (or an If-Match header) is required"}), 428
+        if (edits is None) == (diff is None):
+            return jsonify({"error": "Provide exactly one of 'edits' or 'diff'"}), 400
+        if edits is not None and not isinstance(edits, list):
+            return jsonify({"error": "'edits' must be a list"}), 400
+        if diff is not None and not isinstance(diff, str):
+            return jsonify({"error": "'diff' must be a string"}), 400
+        
+        file_path = resolve_cloud_pc_path(pc_id, path)
+        if not file_path:
+            return jsonify({"error": "Invalid path"}), 400
+        
+        lock_cloud_pc_for_write(pc_id)
+        if not os.path.isfile(file_path):
+            db.session.rollback()
+            return jsonify({"error": "File not found"}), 404
+        
+        with open(file_path, "rb") as f:
+            original = f.read()
+        current_etag = hashlib.sha256(original).hexdigest()
+        if current_etag != base_etag:
+            db.session.rollback()
+            return jsonify({"error": "File was changed by someone else", "etag": current_etag}), 412
+        
+        try:
+            text_content = original.decode("utf-8")
+        except UnicodeDecodeError:
+            db.session.rollback()
+            return jsonify({"error": "Only UTF-8 text files can be patched"}), 415
+        
+        try:
+            if edits is not None:
+                patched = apply_line_edits(text_content, edits)
+            else:
+                patched = apply_unified_diff(text_content, diff)
+        except PatchConflict as conflict:
+            db.session.rollback()
+            return jsonify({"error": str(conflict), "etag": current_etag}), 409
+        
+        content_hash = write_user_bytes(file_path, patched.encode("utf-8"), user.id, pc_id=pc_id)
+        entry = catalog_record_path(pc_id, path, content_hash=content_hash)
+        db.session.commit()
+        
+        response = jsonify({
+            "message": "File updated successfully",
+            "etag": content_hash,
+            "size": entry.size if entry else len(patched.encode("utf-8")),
+        })
+        response.headers["ETag"] = f'"{content_hash}"'
+        return response
+    except StorageQuotaExceeded as quota_error:
+        db.session.rollback()
+        return storage_quota_response(quota_error)
+    except Exception as e:
+        logger.exception(f"Error patching file: {e}")
+        db.session.rollback()
+        return jsonify({"error": "Failed to update file"}), 500
+
+
 @app.put("/api/cloud-pcs/<int:pc_id>/files")
 @login_required
 def update_cloud_pc_file(pc_id: int):
@@ -3707,12 +6822,28 @@ def update_cloud_pc_file(pc_id: int):
         if not os.path.exists(file_path) or os.path.isdir(file_path):
             return jsonify({"error": "File not found"}), 404
         
-        with open(file_path, 'w', encoding='utf-8') as f:
-            f.write(content)
+        # Optional optimistic concurrency: reject the save if the file changed since it was read
+        base_etag = _request_base_etag(data)
+        if base_etag:
+            lock_cloud_pc_for_write(pc_id)
+            current_etag = _hash_file(file_path)
+            if current_etag != base_etag:
+                db.session.rollback()
+                return jsonify({"error": "File was changed by someone else", "etag": current_etag}), 412
+        
+        content_hash = write_user_bytes(file_path, content.encode('utf-8'), user.id, pc_id=pc_id)
+        catalog_record_path(pc_id, path, content_hash=content_hash)
+        db.session.commit()
         
-        return jsonify({"message": "File updated successfully"})
+        response = jsonify({"message": "File updated successfully", "etag": content_hash})
+        response.headers["ETag"] = f'"{content_hash}"'
+        return response
+    except StorageQuotaExceeded as quota_error:
+        db.session.rollback()
+        return storage_quota_response(quota_error)
     except Exception as e:
         logger.exception(f"Error updating file: {e}")
+        db.session.rollback()
         return jsonify({"error": "Failed to update file"}), 500
 
 
@@ -3753,11 +6884,14 @@ def rename_cloud_pc_file(pc_id: int):
         
         # Rename file or directory
         os.rename(old_file_path, new_file_path)
+        catalog_move_path(pc_id, old_path, new_path)
+        db.session.commit()
         
         logger.info(f"User {user.id} renamed {old_path} to {new_path} in cloud PC {pc_id}")
         return jsonify({"message": "File renamed successfully"})
     except Exception as e:
         logger.exception(f"Error renaming file: {e}")
+        db.session.rollback()
         return jsonify({"error": "Failed to rename file"}), 500
 
 
@@ -3790,15 +6924,9 @@ def delete_cloud_pc_file(pc_id: int):
         if not os.path.exists(full_path):
             return jsonify({"error": "File or directory not found"}), 404
         
-        # Calculate size before deletion for storage update
-        file_size_mb = 0
-        if os.path.isfile(full_path):
-            file_size_mb = os.path.getsize(full_path) / (1024 * 1024)
-        elif os.path.isdir(full_path):
-            import shutil
-            for root, dirs, files in os.walk(full_path):
-                for f in files:
-                    file_size_mb += os.path.getsize(os.path.join(root, f)) / (1024 * 1024)
+        # Size comes from the catalog instead of walking the tree
+        ensure_cloud_pc_catalog(pc_id)
+        freed_bytes = catalog_subtree_size(pc_id, path)
         
         # Delete file or directory
         if os.path.isfile(full_path):
@@ -3807,22 +6935,711 @@ def delete_cloud_pc_file(pc_id: int):
             import shutil
             shutil.rmtree(full_path)
         
-        # Update storage used
-        cloud_pc.storage_used_mb = max(0, cloud_pc.storage_used_mb - int(file_size_mb))
+        # Update storage used
+        record_storage_change(user.id, -freed_bytes, pc_id=pc_id)
+        catalog_remove_path(pc_id, path)
+        db.session.commit()
+        
+        logger.info(f"User {user.id} deleted {path} from cloud PC {pc_id}")
+        return jsonify({"message": "File deleted successfully"})
+    except Exception as e:
+        logger.exception(f"Error deleting file: {e}")
+        db.session.rollback()
+        return jsonify({"error": "Failed to delete file"}), 500
+
+
+TEMP_UPLOAD_SUFFIX_RE = re.compile(r"\.[0-9a-f]{32}\.part$")
+
+
+def link_tree(src_dir: str, dest_dir: str) -> None:
+    """Mirror `src_dir` into `dest_dir` with hard links.
+
+    Every write path replaces files via a temp file + os.replace, which breaks
+    the link, so linked trees behave copy-on-write: unchanged bytes are shared
+    and a modified file gets a fresh inode. Falls back to copying where the
+    filesystem cannot link.
+    """
+    for root, dirs, files in os.walk(src_dir):
+        rel_root = os.path.relpath(root, src_dir)
+        target_root = dest_dir if rel_root == "." else os.path.join(dest_dir, rel_root)
+        os.makedirs(target_root, exist_ok=True)
+        for filename in files:
+            if TEMP_UPLOAD_SUFFIX_RE.search(filename):
+                continue  # in-flight upload
+            src_path = os.path.join(root, filename)
+            dest_path = os.path.join(target_root, filename)
+            try:
+                os.link(src_path, dest_path)
+            except OSError:
+                shutil.copy2(src_path, dest_path)
+
+
+def get_cloud_pc_snapshot_dir(pc_id: int, snapshot_id: int) -> str:
+    return os.path.join(CLOUD_PC_STORAGE_DIR, f"pc_{pc_id}", "snapshots", str(snapshot_id))
+
+
+def _catalog_manifest(pc_id: int) -> List[dict]:
+    """Serialize the catalog rows of a PC so they can be replayed without re-hashing."""
+    return [
+        {
+            "path": row.path,
+            "is_dir": row.is_dir,
+            "size": row.size,
+            "mtime": row.mtime.isoformat(),
+            "mime_type": row.mime_type,
+            "content_hash": row.content_hash,
+        }
+        for row in db.session.query(CloudPCFile).filter_by(pc_id=pc_id).order_by(CloudPCFile.path)
+    ]
+
+
+def _catalog_load_manifest(pc_id: int, manifest: List[dict]) -> None:
+    """Replace a PC's catalog with the rows of a manifest."""
+    catalog_remove_path(pc_id, "/")
+    for item in manifest:
+        entry = _catalog_new_entry(pc_id, item["path"])
+        entry.is_dir = item["is_dir"]
+        entry.size = item["size"]
+        entry.mtime = datetime.fromisoformat(item["mtime"])
+        entry.mime_type = item["mime_type"]
+        entry.content_hash = item["content_hash"]
+        if not entry.is_dir:
+            extension = os.path.splitext(entry.name)[1].lower().lstrip(".")
+            entry.extension = extension[:32] or None
+        db.session.add(entry)
+    sync_cloud_pc_search_index(pc_id)
+
+
+def _read_snapshot_manifest(pc_id: int, snapshot_id: int) -> List[dict]:
+    with open(os.path.join(get_cloud_pc_snapshot_dir(pc_id, snapshot_id), "manifest.json"), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def create_cloud_pc_snapshot(cloud_pc: CloudPC, name: str) -> CloudPCSnapshot:
+    """Capture the PC's storage as a hard-linked tree plus a catalog manifest."""
+    ensure_cloud_pc_catalog(cloud_pc.id)
+    manifest = _catalog_manifest(cloud_pc.id)
+    snapshot = CloudPCSnapshot(
+        pc_id=cloud_pc.id,
+        name=name,
+        file_count=sum(1 for item in manifest if not item["is_dir"]),
+        total_bytes=sum(item["size"] for item in manifest),
+    )
+    db.session.add(snapshot)
+    db.session.flush()
+
+    snapshot_dir = get_cloud_pc_snapshot_dir(cloud_pc.id, snapshot.id)
+    try:
+        link_tree(get_cloud_pc_storage_dir(cloud_pc.id), os.path.join(snapshot_dir, "files"))
+        with open(os.path.join(snapshot_dir, "manifest.json"), "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+    except Exception:
+        shutil.rmtree(snapshot_dir, ignore_errors=True)
+        raise
+    return snapshot
+
+
+def delete_cloud_pc_snapshot(snapshot: CloudPCSnapshot) -> None:
+    shutil.rmtree(get_cloud_pc_snapshot_dir(snapshot.pc_id, snapshot.id), ignore_errors=True)
+    db.session.delete(snapshot)
+
+
+class _ZipStreamBuffer(io.RawIOBase):
+    """Write-only sink that lets zipfile emit an archive chunk by chunk."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def iter_zip_stream(root_path: str, arc_root: str = ""):
+    """Yield a ZIP archive of `root_path` as it is built (no temp file, bounded memory)."""
+    buffer = _ZipStreamBuffer()
+    with zipfile.ZipFile(buffer, mode="w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for root, dirs, files in os.walk(root_path):
+            dirs.sort()
+            rel_root = os.path.relpath(root, root_path)
+            arc_dir = "/".join(part for part in [arc_root] + ([] if rel_root == "." else rel_root.split(os.sep)) if part)
+            if arc_dir and not files and not dirs:
+                archive.writestr(zipfile.ZipInfo(arc_dir + "/"), b"")
+            for filename in sorted(files):
+                if TEMP_UPLOAD_SUFFIX_RE.search(filename):
+                    continue  # in-flight upload
+                file_path = os.path.join(root, filename)
+                try:
+                    st = os.stat(file_path)
+                except OSError:
+                    continue
+                info = zipfile.ZipInfo(
+                    f"{arc_dir}/{filename}" if arc_dir else filename,
+                    date_time=datetime.fromtimestamp(max(st.st_mtime, 315532800)).timetuple()[:6],
+                )
+                info.external_attr = (st.st_mode & 0xFFFF) << 16
+                if os.path.splitext(filename)[1].lower() in ZIP_STORED_EXTENSIONS:
+                    info.compress_type = zipfile.ZIP_STORED
+                else:
+                    info.compress_type = zipfile.ZIP_DEFLATED
+                with open(file_path, "rb") as src, archive.open(info, "w", force_zip64=st.st_size >= 2 ** 31) as dest:
+                    while True:
+                        chunk = src.read(1024 * 1024)
+                        if not chunk:
+                            break
+                        dest.write(chunk)
+                        data = buffer.drain()
+                        if data:
+                            yield data
+                data = buffer.drain()
+                if data:
+                    yield data
+    yield buffer.drain()
+
+
+def _zip_member_path(name: str) -> Optional[str]:
+    """Return a safe relative path for a ZIP member, or None if it must be skipped."""
+    name = name.replace("\\", "/")
+    if name.startswith("/") or re.match(r"^[A-Za-z]:", name):
+        return None
+    parts = [part for part in name.split("/") if part and part != "."]
+    if not parts or any(part == ".." for part in parts):
+        return None
+    if parts[0] == "__MACOSX" or parts[-1] == ".DS_Store":
+        return None
+    return "/".join(parts)
+
+
+def _zip_import_conflict(pc_id: int, file_paths, dir_paths) -> Optional[str]:
+    """Return a path an archive import needs as both a file and a folder, or None."""
+    folders = set(dir_paths)
+    for rel_path in [*file_paths, *dir_paths]:
+        parent = _cloud_pc_parent_path(rel_path)
+        while parent != "/" and parent not in folders:
+            folders.add(parent)
+            parent = _cloud_pc_parent_path(parent)
+    for rel_path in file_paths:
+        if rel_path in folders:
+            return rel_path
+    for folder in sorted(folders):
+        dest_path = resolve_cloud_pc_path(pc_id, folder)
+        if dest_path and os.path.isfile(dest_path):
+            return folder
+    return None
+
+
+@app.get("/api/cloud-pcs/<int:pc_id>/files/export")
+@login_required
+def export_cloud_pc_folder(pc_id: int):
+    """Stream a folder (or the whole cloud PC) as a ZIP archive."""
+    try:
+        user = current_user()
+        if not user:
+            return jsonify({"error": "Authentication required"}), 401
+        
+        cloud_pc = db.session.query(CloudPC).filter_by(id=pc_id, owner_id=user.id).first()
+        if not cloud_pc:
+            return jsonify({"error": "Cloud PC not found"}), 404
+        
+        path = request.args.get("path", "/")
+        full_path = resolve_cloud_pc_path(pc_id, path)
+        if not full_path:
+            return jsonify({"error": "Invalid path"}), 400
+        if not os.path.isdir(full_path):
+            return jsonify({"error": "Folder not found"}), 404
+        
+        rel_path = normalize_cloud_pc_path(path)
+        folder_name = rel_path.rsplit("/", 1)[-1] or secure_filename(cloud_pc.name) or f"cloud_pc_{pc_id}"
+        download_name = secure_filename(f"{folder_name}.zip") or "export.zip"
+        
+        logger.info(f"User {user.id} exporting {rel_path} from cloud PC {pc_id}")
+        response = Response(stream_with_context(iter_zip_stream(full_path, arc_root=folder_name)), mimetype="application/zip")
+        response.headers["Content-Disposition"] = f'attachment; filename="{download_name}"'
+        response.headers["Cache-Control"] = "no-store"
+        return response
+    except Exception as e:
+        logger.exception(f"Error exporting folder: {e}")
+        return jsonify({"error": "Failed to export folder"}), 500
+
+
+@app.post("/api/cloud-pcs/<int:pc_id>/files/import")
+@login_required
+def import_cloud_pc_archive(pc_id: int):
+    """Extract an uploaded ZIP archive into a cloud PC folder."""
+    staging_dir = None
+    try:
+        user = current_user()
+        if not user:
+            return jsonify({"error": "Authentication required"}), 401
+        
+        cloud_pc = db.session.query(CloudPC).filter_by(id=pc_id, owner_id=user.id).first()
+        if not cloud_pc:
+            return jsonify({"error": "Cloud PC not found"}), 404
+        
+        path = request.form.get("path", "/")
+        overwrite = request.form.get("overwrite", "false").lower() == "true"
+        if not resolve_cloud_pc_path(pc_id, path):
+            return jsonify({"error": "Invalid path"}), 400
+        
+        archive_file = request.files.get("file")
+        if not archive_file or archive_file.filename == "":
+            return jsonify({"error": "No archive provided"}), 400
+        
+        try:
+            archive = zipfile.ZipFile(archive_file.stream)
+        except zipfile.BadZipFile:
+            return jsonify({"error": "The uploaded file is not a valid ZIP archive"}), 400
+        
+        members = archive.infolist()
+        if len(members) > MAX_ZIP_IMPORT_ENTRIES:
+            return jsonify({"error": f"Archive has too many entries (max {MAX_ZIP_IMPORT_ENTRIES})"}), 400
+        
+        # Validate every member up front so nothing is written for a bad archive
+        remaining = remaining_storage_bytes(user.id, pc_id)
+        budget = MAX_ZIP_IMPORT_BYTES if remaining is None else min(remaining, MAX_ZIP_IMPORT_BYTES)
+        rel_target = normalize_cloud_pc_path(path)
+        # A name repeated in the archive is written once, from its last entry
+        planned_files, planned_dirs, skipped = {}, [], []
+        for member in members:
+            member_path = _zip_member_path(member.filename)
+            is_symlink = stat.S_ISLNK(member.external_attr >> 16)
+            if not member_path or is_symlink:
+                skipped.append({"name": member.filename, "reason": "unsafe path"})
+                continue
+            rel_path = normalize_cloud_pc_path(f"{rel_target}/{member_path}")
+            dest_path = resolve_cloud_pc_path(pc_id, rel_path)
+            if not dest_path:
+                skipped.append({"name": member.filename, "reason": "unsafe path"})
+                continue
+            if member.is_dir():
+                planned_dirs.append(rel_path)
+            elif os.path.isdir(dest_path):
+                skipped.append({"name": member.filename, "reason": "a folder with that name exists"})
+            elif os.path.exists(dest_path) and not overwrite:
+                skipped.append({"name": member.filename, "reason": "file exists"})
+            else:
+                planned_files.pop(rel_path, None)
+                planned_files[rel_path] = (member, dest_path)
+        
+        conflict = _zip_import_conflict(pc_id, planned_files, planned_dirs)
+        if conflict:
+            return jsonify({"error": f"Archive needs '{conflict}' to be both a file and a folder"}), 400
+        
+        previous_sizes = {rel: (os.path.getsize(dest) if os.path.isfile(dest) else 0) for rel, (_, dest) in planned_files.items()}
+        declared_growth = sum(member.file_size for member, _ in planned_files.values()) - sum(previous_sizes.values())
+        if declared_growth > budget:
+            return storage_quota_response(StorageQuotaExceeded("Archive contents exceed your remaining storage space."))
+        
+        # Extract into a staging area first; declared sizes are not trusted, so
+        # each member is also capped while it streams out of the archive
+        staging_dir = os.path.join(CLOUD_PC_STORAGE_DIR, f"pc_{pc_id}", ".staging", uuid.uuid4().hex)
+        os.makedirs(staging_dir)
+        staged = []
+        budget += sum(previous_sizes.values())
+        for index, (rel_path, (member, dest_path)) in enumerate(planned_files.items()):
+            with archive.open(member) as src:
+                tmp_path, size, content_hash = stream_to_temp_file(
+                    src, os.path.join(staging_dir, str(index)), max_bytes=budget
+                )
+            budget -= size
+            staged.append((tmp_path, rel_path, dest_path, size, content_hash))
+        
+        total_delta = sum(size for _, _, _, size, _ in staged) - sum(previous_sizes.values())
+        record_storage_change(user.id, total_delta, pc_id=pc_id)
+        
+        for rel_path in planned_dirs:
+            os.makedirs(resolve_cloud_pc_path(pc_id, rel_path), exist_ok=True)
+            catalog_record_path(pc_id, rel_path)
+        for tmp_path, rel_path, dest_path, size, content_hash in staged:
+            os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+            os.replace(tmp_path, dest_path)
+            catalog_record_path(pc_id, rel_path, content_hash=content_hash)
+        db.session.commit()
+        
+        logger.info(f"User {user.id} imported {len(staged)} files into {rel_target} on cloud PC {pc_id}")
+        return jsonify({
+            "message": "Archive imported successfully",
+            "files": len(staged),
+            "directories": len(planned_dirs),
+            "bytes": sum(size for _, _, _, size, _ in staged),
+            "skipped": skipped,
+        })
+    except StorageQuotaExceeded as quota_error:
+        db.session.rollback()
+        return storage_quota_response(quota_error)
+    except (zipfile.BadZipFile, zipfile.LargeZipFile, NotImplementedError) as zip_error:
+        db.session.rollback()
+        return jsonify({"error": f"Could not extract archive: {zip_error}"}), 400
+    except Exception as e:
+        logger.exception(f"Error importing archive: {e}")
+        db.session.rollback()
+        return jsonify({"error": "Failed to import archive"}), 500
+    finally:
+        if staging_dir and os.path.isdir(staging_dir):
+            shutil.rmtree(staging_dir, ignore_errors=True)
+
+
+@app.get("/api/cloud-pcs/<int:pc_id>/snapshots")
+@login_required
+def list_cloud_pc_snapshots(pc_id: int):
+    """List snapshots of a cloud PC."""
+    try:
+        user = current_user()
+        if not user:
+            return jsonify({"error": "Authentication required"}), 401
+        
+        cloud_pc = db.session.query(CloudPC).filter_by(id=pc_id, owner_id=user.id).first()
+        if not cloud_pc:
+            return jsonify({"error": "Cloud PC not found"}), 404
+        
+        snapshots = db.session.query(CloudPCSnapshot).filter_by(pc_id=pc_id).order_by(CloudPCSnapshot.created_at.desc()).all()
+        return jsonify({"snapshots": [snapshot.to_dict() for snapshot in snapshots]})
+    except Exception as e:
+        logger.exception(f"Error listing snapshots: {e}")
+        return jsonify({"error": "Failed to load snapshots"}), 500
+
+
+@app.post("/api/cloud-pcs/<int:pc_id>/snapshots")
+@login_required
+def snapshot_cloud_pc(pc_id: int):
+    """Take a snapshot of a cloud PC's files (unchanged bytes are shared on disk)."""
+    try:
+        user = current_user()
+        if not user:
+            return jsonify({"error": "Authentication required"}), 401
+        
+        cloud_pc = db.session.query(CloudPC).filter_by(id=pc_id, owner_id=user.id).first()
+        if not cloud_pc:
+            return jsonify({"error": "Cloud PC not found"}), 404
+        
+        data = request.get_json(silent=True) or {}
+        name = (data.get("name") or "").strip() or f"Snapshot {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')}"
+        
+        existing = db.session.query(CloudPCSnapshot).filter_by(pc_id=pc_id).count()
+        if existing >= MAX_CLOUD_PC_SNAPSHOTS:
+            return jsonify({"error": f"Snapshot limit reached ({MAX_CLOUD_PC_SNAPSHOTS}). Delete an old snapshot first."}), 400
+        
+        snapshot = create_cloud_pc_snapshot(cloud_pc, name[:255])
+        db.session.commit()
+        
+        logger.info(f"User {user.id} created snapshot {snapshot.id} of cloud PC {pc_id}")
+        return jsonify({"message": "Snapshot created", "snapshot": snapshot.to_dict()})
+    except Exception as e:
+        logger.exception(f"Error creating snapshot: {e}")
+        db.session.rollback()
+        return jsonify({"error": "Failed to create snapshot"}), 500
+
+
+@app.post("/api/cloud-pcs/<int:pc_id>/snapshots/<int:snapshot_id>/restore")
+@login_required
+def restore_cloud_pc_snapshot(pc_id: int, snapshot_id: int):
+    """Roll a cloud PC's files back to a snapshot."""
+    try:
+        user = current_user()
+        if not user:
+            return jsonify({"error": "Authentication required"}), 401
+        
+        cloud_pc = db.session.query(CloudPC).filter_by(id=pc_id, owner_id=user.id).first()
+        if not cloud_pc:
+            return jsonify({"error": "Cloud PC not found"}), 404
+        
+        snapshot = db.session.query(CloudPCSnapshot).filter_by(id=snapshot_id, pc_id=pc_id).first()
+        if not snapshot:
+            return jsonify({"error": "Snapshot not found"}), 404
+        
+        manifest = _read_snapshot_manifest(pc_id, snapshot_id)
+        storage_dir = get_cloud_pc_storage_dir(pc_id)
+        token = uuid.uuid4().hex
+        restored_dir = f"{storage_dir}.restore-{token}"
+        previous_dir = f"{storage_dir}.old-{token}"
+        
+        # Build the restored tree beside the live one, then swap the two
+        link_tree(os.path.join(get_cloud_pc_snapshot_dir(pc_id, snapshot_id), "files"), restored_dir)
+        if os.path.isdir(storage_dir):
+            os.rename(storage_dir, previous_dir)
+        os.rename(restored_dir, storage_dir)
+        shutil.rmtree(previous_dir, ignore_errors=True)
+        
+        _catalog_load_manifest(pc_id, manifest)
+        restored_bytes = sum(item["size"] for item in manifest)
+        record_storage_change(user.id, restored_bytes - get_storage_used("cloud_pc", pc_id), pc_id=pc_id, enforce_quota=False)
+        db.session.commit()
+        
+        logger.info(f"User {user.id} restored cloud PC {pc_id} to snapshot {snapshot_id}")
+        return jsonify({"message": "Snapshot restored", "snapshot": snapshot.to_dict()})
+    except Exception as e:
+        logger.exception(f"Error restoring snapshot: {e}")
+        db.session.rollback()
+        return jsonify({"error": "Failed to restore snapshot"}), 500
+
+
+@app.delete("/api/cloud-pcs/<int:pc_id>/snapshots/<int:snapshot_id>")
+@login_required
+def remove_cloud_pc_snapshot(pc_id: int, snapshot_id: int):
+    """Delete a snapshot of a cloud PC."""
+    try:
+        user = current_user()
+        if not user:
+            return jsonify({"error": "Authentication required"}), 401
+        
+        cloud_pc = db.session.query(CloudPC).filter_by(id=pc_id, owner_id=user.id).first()
+        if not cloud_pc:
+            return jsonify({"error": "Cloud PC not found"}), 404
+        
+        snapshot = db.session.query(CloudPCSnapshot).filter_by(id=snapshot_id, pc_id=pc_id).first()
+        if not snapshot:
+            return jsonify({"error": "Snapshot not found"}), 404
+        
+        delete_cloud_pc_snapshot(snapshot)
+        db.session.commit()
+        return jsonify({"message": "Snapshot deleted"})
+    except Exception as e:
+        logger.exception(f"Error deleting snapshot: {e}")
+        db.session.rollback()
+        return jsonify({"error": "Failed to delete snapshot"}), 500
+
+
+@app.post("/api/cloud-pcs/<int:pc_id>/clone")
+@login_required
+def clone_cloud_pc(pc_id: int):
+    """Create a new cloud PC from the current state (or a snapshot) of another."""
+    new_storage_root = None
+    try:
+        user = current_user()
+        if not user:
+            return jsonify({"error": "Authentication required"}), 401
+        
+        cloud_pc = db.session.query(CloudPC).filter_by(id=pc_id, owner_id=user.id).first()
+        if not cloud_pc:
+            return jsonify({"error": "Cloud PC not found"}), 404
+        
+        data = request.get_json(silent=True) or {}
+        name = (data.get("name") or "").strip() or f"{cloud_pc.name} (copy)"
+        snapshot_id = data.get("snapshot_id")
+        
+        if snapshot_id:
+            snapshot = db.session.query(CloudPCSnapshot).filter_by(id=snapshot_id, pc_id=pc_id).first()
+            if not snapshot:
+                return jsonify({"error": "Snapshot not found"}), 404
+            source_dir = os.path.join(get_cloud_pc_snapshot_dir(pc_id, snapshot.id), "files")
+            manifest = _read_snapshot_manifest(pc_id, snapshot.id)
+        else:
+            ensure_cloud_pc_catalog(pc_id)
+            source_dir = get_cloud_pc_storage_dir(pc_id)
+            manifest = _catalog_manifest(pc_id)
+        
+        clone = CloudPC(
+            owner_id=user.id,
+            name=name[:255],
+            os_version=cloud_pc.os_version,
+            status="created",
+            storage_used_mb=0,
+            open_apps=cloud_pc.open_apps,
+        )
+        db.session.add(clone)
+        db.session.flush()
+        
+        new_storage_root = os.path.join(CLOUD_PC_STORAGE_DIR, f"pc_{clone.id}")
+        new_storage_dir = get_cloud_pc_storage_dir(clone.id)
+        os.makedirs(new_storage_dir, exist_ok=True)
+        if os.path.isdir(source_dir):
+            link_tree(source_dir, new_storage_dir)
+        
+        _catalog_load_manifest(clone.id, manifest)
+        record_storage_change(user.id, sum(item["size"] for item in manifest), pc_id=clone.id)
+        db.session.commit()
+        db.session.refresh(clone)
+        
+        logger.info(f"User {user.id} cloned cloud PC {pc_id} into {clone.id}")
+        return jsonify({"message": "Cloud PC cloned successfully", "cloud_pc": clone.to_dict()})
+    except StorageQuotaExceeded as quota_error:
+        db.session.rollback()
+        if new_storage_root:
+            shutil.rmtree(new_storage_root, ignore_errors=True)
+        return storage_quota_response(quota_error)
+    except Exception as e:
+        logger.exception(f"Error cloning cloud PC: {e}")
+        db.session.rollback()
+        if new_storage_root:
+            shutil.rmtree(new_storage_root, ignore_errors=True)
+        return jsonify({"error": "Failed to clone cloud PC"}), 500
+
+
+BATCH_FILE_OPERATIONS = {
+    "mkdir": ("path",),
+    "write": ("path",),
+    "delete": ("path",),
+    "move": ("from", "to"),
+    "copy": ("from", "to"),
+}
+
+
+def _validate_batch_operation(pc_id: int, operation) -> Optional[str]:
+    """Return an error message for a malformed batch operation, or None."""
+    if not isinstance(operation, dict):
+        return "Operation must be an object"
+    op = operation.get("op")
+    if op not in BATCH_FILE_OPERATIONS:
+        return f"Unknown operation '{op}'"
+    for field in BATCH_FILE_OPERATIONS[op]:
+        value = operation.get(field)
+        if not isinstance(value, str) or not value.strip():
+            return f"'{field}' is required"
+        if not resolve_cloud_pc_path(pc_id, value):
+            return f"Invalid path in '{field}'"
+        if normalize_cloud_pc_path(value) == "/" and op != "mkdir":
+            return "The root folder cannot be modified"
+    if op in ("move", "copy"):
+        src = normalize_cloud_pc_path(operation["from"])
+        dest = normalize_cloud_pc_path(operation["to"])
+        if dest == src or dest.startswith(src + "/"):
+            return "Cannot move or copy a folder into itself"
+    if op == "write":
+        content = operation.get("content", "")
+        if not isinstance(content, str):
+            return "'content' must be a string"
+        if operation.get("encoding", "utf-8") not in ("utf-8", "base64"):
+            return "'encoding' must be 'utf-8' or 'base64'"
+    return None
+
+
+def _run_batch_operation(pc_id: int, user_id: int, operation: dict) -> None:
+    """Execute one validated batch operation; raises ValueError for expected failures."""
+    op = operation["op"]
+    if op == "mkdir":
+        full_path = resolve_cloud_pc_path(pc_id, operation["path"])
+        if os.path.isfile(full_path):
+            raise ValueError("A file with that name already exists")
+        os.makedirs(full_path, exist_ok=True)
+        catalog_record_path(pc_id, operation["path"])
+    elif op == "write":
+        full_path = resolve_cloud_pc_path(pc_id, operation["path"])
+        if os.path.isdir(full_path):
+            raise ValueError("A folder with that name already exists")
+        content = operation.get("content", "")
+        if operation.get("encoding", "utf-8") == "base64":
+            import base64
+            data = base64.b64decode(content)
+        else:
+            data = content.encode("utf-8")
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        content_hash = write_user_bytes(full_path, data, user_id, pc_id=pc_id)
+        catalog_record_path(pc_id, operation["path"], content_hash=content_hash)
+    elif op == "delete":
+        full_path = resolve_cloud_pc_path(pc_id, operation["path"])
+        if not os.path.exists(full_path):
+            raise ValueError("File or directory not found")
+        freed_bytes = catalog_subtree_size(pc_id, operation["path"])
+        if os.path.isdir(full_path):
+            shutil.rmtree(full_path)
+        else:
+            os.remove(full_path)
+        record_storage_change(user_id, -freed_bytes, pc_id=pc_id)
+        catalog_remove_path(pc_id, operation["path"])
+    else:
+        src_path = resolve_cloud_pc_path(pc_id, operation["from"])
+        dest_path = resolve_cloud_pc_path(pc_id, operation["to"])
+        if not os.path.exists(src_path):
+            raise ValueError("Source not found")
+        if os.path.exists(dest_path):
+            raise ValueError("Destination already exists")
+        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+        if op == "move":
+            os.rename(src_path, dest_path)
+            catalog_move_path(pc_id, operation["from"], operation["to"])
+        else:
+            # Copies are hard-linked, so they share bytes until either side is rewritten
+            record_storage_change(user_id, catalog_subtree_size(pc_id, operation["from"]), pc_id=pc_id)
+            if os.path.isdir(src_path):
+                link_tree(src_path, dest_path)
+            else:
+                try:
+                    os.link(src_path, dest_path)
+                except OSError:
+                    shutil.copy2(src_path, dest_path)
+            catalog_copy_path(pc_id, operation["from"], operation["to"])
+
+
+@app.post("/api/cloud-pcs/<int:pc_id>/files/batch")
+@login_required
+def batch_cloud_pc_files(pc_id: int):
+    """Run several file operations (mkdir, write, delete, move, copy) in one request."""
+    try:
+        user = current_user()
+        if not user:
+            return jsonify({"error": "Authentication required"}), 401
+        
+        cloud_pc = db.session.query(CloudPC).filter_by(id=pc_id, owner_id=user.id).first()
+        if not cloud_pc:
+            return jsonify({"error": "Cloud PC not found"}), 404
+        
+        data = ensure_json_request()
+        operations = data.get("operations")
+        stop_on_error = bool(data.get("stop_on_error", False))
+        if not isinstance(operations, list) or not operations:
+            return jsonify({"error": "A list of operations is required"}), 400
+        if len(operations) > MAX_BATCH_FILE_OPERATIONS:
+            return jsonify({"error": f"Too many operations (max {MAX_BATCH_FILE_OPERATIONS})"}), 400
+        
+        # Validate everything before touching the filesystem
+        errors = []
+        for index, operation in enumerate(operations):
+            error = _validate_batch_operation(pc_id, operation)
+            if error:
+                errors.append({"index": index, "error": error})
+        if errors:
+            return jsonify({"error": "Invalid operations", "details": errors}), 400
+        
+        ensure_cloud_pc_catalog(pc_id)
+        results = []
+        failed = False
+        for index, operation in enumerate(operations):
+            result = {"index": index, "op": operation["op"]}
+            if failed and stop_on_error:
+                result.update(ok=False, error="Skipped after an earlier failure")
+                results.append(result)
+                continue
+            try:
+                # Savepoint per operation so a failure only undoes its own accounting
+                with db.session.begin_nested():
+                    _run_batch_operation(pc_id, user.id, operation)
+                result["ok"] = True
+            except (ValueError, StorageQuotaExceeded, OSError) as op_error:
+                failed = True
+                result.update(ok=False, error=str(op_error))
+            results.append(result)
+        
+        # One commit covers the catalog and storage accounting for the whole batch
         db.session.commit()
         
-        logger.info(f"User {user.id} deleted {path} from cloud PC {pc_id}")
-        return jsonify({"message": "File deleted successfully"})
+        succeeded = sum(1 for result in results if result["ok"])
+        logger.info(f"User {user.id} ran {len(operations)} batch file operations on cloud PC {pc_id} ({succeeded} succeeded)")
+        return jsonify({
+            "results": results,
+            "succeeded": succeeded,
+            "failed": len(results) - succeeded,
+        })
     except Exception as e:
-        logger.exception(f"Error deleting file: {e}")
+        logger.exception(f"Error running batch file operations: {e}")
         db.session.rollback()
-        return jsonify({"error": "Failed to delete file"}), 500
+        return jsonify({"error": "Failed to run file operations"}), 500
 
 
 @app.post("/api/cloud-pcs/<int:pc_id>/files/drawing")
 @login_required
 def save_cloud_pc_drawing(pc_id: int):
     """Save drawing as PNG to cloud PC."""
+    from concurrent.futures import TimeoutError as RenderTimeout
+
     try:
         user = current_user()
         if not user:
@@ -3836,6 +7653,14 @@ def save_cloud_pc_drawing(pc_id: int):
         path = data.get("path", "/")
         filename = data.get("filename", "drawing.png")
         image_data = data.get("image_data", "")  # Base64 encoded image
+        paint_id = data.get("paint_id")  # or one of the user's paintings, rendered here
+        
+        paint = None
+        if paint_id:
+            paint = db.session.get(Paint, paint_id)
+            if not paint or paint.owner_id != user.id:
+                return jsonify({"error": "Paint not found"}), 404
+            ensure_paint_encoded(paint)
         
         storage_dir = os.path.join(UPLOAD_ROOT, "cloud_pcs", f"pc_{pc_id}", "storage")
         full_path = os.path.join(storage_dir, path.lstrip("/"))
@@ -3845,23 +7670,32 @@ def save_cloud_pc_drawing(pc_id: int):
         
         os.makedirs(full_path, exist_ok=True)
         
-        # Decode base64 image
-        import base64
-        if image_data.startswith('data:image'):
-            image_data = image_data.split(',')[1]
-        
-        image_bytes = base64.b64decode(image_data)
+        if paint is not None:
+            size = (paint.state.width or 800, paint.state.height or 600)
+            image_format = "WEBP" if filename.lower().endswith(".webp") else "PNG"
+            try:
+                image_bytes = get_paint_render(paint, (min(size[0], MAX_PAINT_RENDER_SIZE), min(size[1], MAX_PAINT_RENDER_SIZE)), image_format)
+            except RenderTimeout:
+                db.session.rollback()
+                return jsonify({"error": "Rendering this painting took too long. Please try again."}), 503
+        else:
+            # Decode base64 image
+            import base64
+            if image_data.startswith('data:image'):
+                image_data = image_data.split(',')[1]
+            
+            image_bytes = base64.b64decode(image_data)
         file_path = os.path.join(full_path, filename)
         
-        with open(file_path, 'wb') as f:
-            f.write(image_bytes)
-        
         # Update storage used
-        file_size_mb = len(image_bytes) / (1024 * 1024)
-        cloud_pc.storage_used_mb += int(file_size_mb)
+        content_hash = write_user_bytes(file_path, image_bytes, user.id, pc_id=pc_id)
+        catalog_record_path(pc_id, os.path.relpath(file_path, storage_dir), content_hash=content_hash)
         db.session.commit()
         
         return jsonify({"message": "Drawing saved successfully"})
+    except StorageQuotaExceeded as quota_error:
+        db.session.rollback()
+        return storage_quota_response(quota_error)
     except Exception as e:
         logger.exception(f"Error saving drawing: {e}")
         return jsonify({"error": "Failed to save drawing"}), 500
@@ -3889,6 +7723,13 @@ def delete_cloud_pc(pc_id: int):
             except Exception as e:
                 logger.warning(f"Failed to delete storage directory: {e}")
         
+        record_storage_change(user.id, -get_storage_used("cloud_pc", pc_id))
+        db.session.query(StorageLedger).filter_by(scope="cloud_pc", scope_id=pc_id).delete(synchronize_session=False)
+        catalog_remove_path(pc_id, "/")
+        db.session.query(CloudPCSnapshot).filter_by(pc_id=pc_id).delete(synchronize_session=False)
+        db.session.query(CloudPCFileText).filter_by(pc_id=pc_id).delete(synchronize_session=False)
+        db.session.query(CloudPCChange).filter_by(pc_id=pc_id).delete(synchronize_session=False)
+        db.session.query(CloudPCChangeCounter).filter_by(pc_id=pc_id).delete(synchronize_session=False)
         db.session.delete(cloud_pc)
         db.session.commit()
         
@@ -3905,6 +7746,261 @@ def delete_cloud_pc(pc_id: int):
 ###############################################################################
 
 
+def get_ai_app_asset_dir(app_id: int, code_hash: str) -> str:
+    return os.path.join(AI_APP_ASSET_DIR, f"app_{app_id}", code_hash[:16])
+
+
+def publish_ai_app_asset(ai_app: AIApp) -> Optional[AIAppAsset]:
+    """Write the app's code as an immutable asset keyed by its hash, plus gzip/brotli variants.
+
+    Compression happens once per code version here, never per request.
+    """
+    asset = db.session.get(AIAppAsset, ai_app.id)
+    if not ai_app.code:
+        if asset:
+            shutil.rmtree(os.path.join(AI_APP_ASSET_DIR, f"app_{ai_app.id}"), ignore_errors=True)
+            db.session.delete(asset)
+        return None
+
+    data = ai_app.code.encode("utf-8")
+    code_hash = hashlib.sha256(data).hexdigest()
+    asset_dir = get_ai_app_asset_dir(ai_app.id, code_hash)
+    if asset and asset.code_hash == code_hash and os.path.isfile(os.path.join(asset_dir, "index.html")):
+        return asset
+
+    variants = {"index.html": data, "index.html.gz": gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants["index.html.br"] = brotli.compress(data, quality=11)
+    os.makedirs(asset_dir, exist_ok=True)
+    for filename, body in variants.items():
+        target = os.path.join(asset_dir, filename)
+        tmp_path = f"{target}.{uuid.uuid4().hex}.part"
+        with open(tmp_path, "wb") as f:
+            f.write(body)
+        os.replace(tmp_path, target)
+
+    # Older builds are dropped; their URLs redirect to the current one
+    app_dir = os.path.join(AI_APP_ASSET_DIR, f"app_{ai_app.id}")
+    for entry in os.scandir(app_dir):
+        if entry.is_dir() and entry.name != code_hash[:16]:
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+    if not asset:
+        asset = AIAppAsset(app_id=ai_app.id)
+        db.session.add(asset)
+    asset.code_hash = code_hash
+    asset.size = len(data)
+    asset.gzip_size = len(variants["index.html.gz"])
+    asset.brotli_size = len(variants["index.html.br"]) if "index.html.br" in variants else None
+    return asset
+
+
+def _encode_code_delta(base: str, target: str) -> bytes:
+    """Line-level delta: ["c", start, end] copies base lines, a string inserts text."""
+    import difflib
+    base_lines = base.splitlines(keepends=True)
+    target_lines = target.splitlines(keepends=True)
+    ops = []
+    matcher = difflib.SequenceMatcher(None, base_lines, target_lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            ops.append(["c", i1, i2])
+        elif j2 > j1:
+            ops.append("".join(target_lines[j1:j2]))
+    return zlib.compress(json.dumps(ops, separators=(",", ":")).encode("utf-8"), 9)
+
+
+def _decode_code_delta(base: str, data: bytes) -> str:
+    base_lines = base.splitlines(keepends=True)
+    parts = []
+    for op in json.loads(zlib.decompress(data)):
+        if isinstance(op, str):
+            parts.append(op)
+        else:
+            parts.extend(base_lines[op[1]:op[2]])
+    return "".join(parts)
+
+
+def load_ai_app_revision_code(revision: AIAppRevision) -> str:
+    """Rebuild a revision's code: one decompress for snapshots, plus one delta for the rest."""
+    if revision.kind == "full":
+        return zlib.decompress(revision.data).decode("utf-8")
+    base = db.session.query(AIAppRevision).filter_by(app_id=revision.app_id, revision=revision.base_revision).first()
+    if not base:
+        raise ValueError(f"Snapshot {revision.base_revision} for revision {revision.revision} is missing")
+    return _decode_code_delta(zlib.decompress(base.data).decode("utf-8"), revision.data)
+
+
+def ensure_ai_app_history(ai_app: AIApp) -> None:
+    """Record code written before revisions existed, so the first overwrite can be undone."""
+    if ai_app.code and not db.session.query(AIAppRevision.id).filter_by(app_id=ai_app.id).first():
+        record_ai_app_revision(ai_app, "initial")
+
+
+def _build_ai_app_revision(
+    ai_app: AIApp, code: str, code_hash: str, latest: Optional[AIAppRevision], source: str
+) -> AIAppRevision:
+    revision = AIAppRevision(
+        app_id=ai_app.id,
+        revision=(latest.revision + 1) if latest else 1,
+        code_hash=code_hash,
+        size=len(code.encode("utf-8")),
+        source=source,
+    )
+    full_data = zlib.compress(code.encode("utf-8"), 9)
+    base_revision = latest.revision if latest and latest.kind == "full" else (latest.base_revision if latest else None)
+    if base_revision is not None and revision.revision - base_revision < AI_APP_REVISION_SNAPSHOT_INTERVAL:
+        base = latest if latest.kind == "full" else db.session.query(AIAppRevision).filter_by(
+            app_id=ai_app.id, revision=base_revision
+        ).first()
+        delta = _encode_code_delta(zlib.decompress(base.data).decode("utf-8"), code) if base else None
+        # A delta that is not clearly smaller than a snapshot starts a new snapshot instead
+        if delta is not None and len(delta) < len(full_data) // 2:
+            revision.kind = "delta"
+            revision.base_revision = base_revision
+            revision.data = delta
+    if revision.data is None:
+        revision.kind = "full"
+        revision.data = full_data
+    return revision
+
+
+def record_ai_app_revision(ai_app: AIApp, source: str) -> Optional[AIAppRevision]:
+    """Append the app's current code to its history (no-op if it matches the latest revision).
+
+    Two saves of the same app can pick the same next number; the loser's insert fails
+    inside a savepoint and it retries against the new latest revision.
+    """
+    code = ai_app.code or ""
+    code_hash = hashlib.sha256(code.encode("utf-8")).hexdigest()
+    for attempt in range(3):
+        latest = (
+            db.session.query(AIAppRevision)
+            .filter_by(app_id=ai_app.id)
+            .order_by(AIAppRevision.revision.desc())
+            .first()
+        )
+        if latest and latest.code_hash == code_hash:
+            return None
+        revision = _build_ai_app_revision(ai_app, code, code_hash, latest, source)
+        try:
+            with db.session.begin_nested():
+                db.session.add(revision)
+            break
+        except IntegrityError:
+            if attempt == 2:
+                raise
+
+    # Prune whole snapshot groups so no delta outlives its base
+    if revision.revision > MAX_AI_APP_REVISIONS:
+        cutoff = (
+            db.session.query(db.func.min(AIAppRevision.revision))
+            .filter(
+                AIAppRevision.app_id == ai_app.id,
+                AIAppRevision.kind == "full",
+                AIAppRevision.revision > revision.revision - MAX_AI_APP_REVISIONS,
+            )
+            .scalar()
+        )
+        if cutoff:
+            db.session.query(AIAppRevision).filter(
+                AIAppRevision.app_id == ai_app.id, AIAppRevision.revision < cutoff
+            ).delete(synchronize_session=False)
+    return revision
+
+
+def publish_missing_ai_app_assets(batch_size: int = 100) -> int:
+    """Publish assets for apps saved before assets existed, committing per batch.
+
+    Apps without code never get an asset, so they are left out rather than retried.
+    """
+    published = 0
+    while True:
+        apps = (
+            db.session.query(AIApp)
+            .filter(
+                AIApp.code.isnot(None),
+                AIApp.code != "",
+                ~db.session.query(AIAppAsset.app_id).filter(AIAppAsset.app_id == AIApp.id).exists(),
+            )
+            .order_by(AIApp.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not apps:
+            return published
+        for ai_app in apps:
+            publish_ai_app_asset(ai_app)
+        db.session.commit()
+        published += len(apps)
+
+
+def ai_app_listing_dicts(apps: List[AIApp]) -> List[dict]:
+    """Serialize apps for listings: metadata plus the URL of the code asset instead of the code."""
+    app_ids = [ai_app.id for ai_app in apps]
+    assets = {
+        asset.app_id: asset
+        for asset in db.session.query(AIAppAsset).filter(AIAppAsset.app_id.in_(app_ids))
+    } if app_ids else {}
+
+    results = []
+    for ai_app in apps:
+        app_dict = ai_app.to_dict(include_code=False)
+        asset = assets.get(ai_app.id)
+        app_dict["code_url"] = asset.url if asset else None
+        app_dict["code_hash"] = asset.code_hash if asset else None
+        app_dict["code_size"] = asset.size if asset else 0
+        results.append(app_dict)
+    return results
+
+
+@app.get("/apps/<int:app_id>/v/<version>/index.html")
+@login_required
+def get_ai_app_asset(app_id: int, version: str):
+    """Serve an app's code with immutable caching and the best precompressed variant."""
+    user = current_user()
+    if not user:
+        return jsonify({"error": "Authentication required"}), 401
+    
+    ai_app = db.session.query(AIApp).options(defer(AIApp.code)).filter_by(id=app_id).first()
+    if not ai_app or (not ai_app.is_live and ai_app.developer_id != user.id):
+        return jsonify({"error": "AI app not found"}), 404
+    
+    asset = db.session.get(AIAppAsset, app_id)
+    if not asset:
+        return jsonify({"error": "AI app has no code yet"}), 404
+    if version != asset.code_hash[:16]:
+        # Stale link to an older build: point at the current one without caching the redirect
+        response = make_response("", 302)
+        response.headers["Location"] = asset.url
+        response.headers["Cache-Control"] = "no-store"
+        return response
+    
+    if asset.code_hash in request.headers.get("If-None-Match", ""):
+        response = make_response("", 304)
+    else:
+        asset_dir = get_ai_app_asset_dir(app_id, asset.code_hash)
+        accepted = request.headers.get("Accept-Encoding", "").lower()
+        encoding, filename = None, "index.html"
+        if "br" in accepted and os.path.isfile(os.path.join(asset_dir, "index.html.br")):
+            encoding, filename = "br", "index.html.br"
+        elif "gzip" in accepted and os.path.isfile(os.path.join(asset_dir, "index.html.gz")):
+            encoding, filename = "gzip", "index.html.gz"
+        file_path = os.path.join(asset_dir, filename)
+        if not os.path.isfile(file_path):
+            return jsonify({"error": "AI app code not found"}), 404
+        response = send_file(file_path, mimetype="text/html", conditional=False, etag=False)
+        if encoding:
+            response.headers["Content-Encoding"] = encoding
+    
+    variant = response.headers.get("Content-Encoding", "identity")
+    response.headers["ETag"] = f'"{asset.code_hash}-{variant}"'
+    response.headers["Cache-Control"] = "private, max-age=31536000, immutable"
+    response.headers["Vary"] = "Accept-Encoding"
+    response.headers["X-Content-Type-Options"] = "nosniff"
+    return response
+
+
 @app.post("/api/ai-apps")
 @login_required
 def create_ai_app():
@@ -3953,15 +8049,15 @@ def list_ai_apps():
         if not user:
             return jsonify({"error": "Authentication required"}), 401
         
-        # Get developer's own apps (including non-live)
-        my_apps = db.session.query(AIApp).filter_by(developer_id=user.id).order_by(AIApp.created_at.desc()).all()
+        # Get developer's own apps (including non-live); code is served separately as an asset
+        my_apps = db.session.query(AIApp).options(defer(AIApp.code)).filter_by(developer_id=user.id).order_by(AIApp.created_at.desc()).all()
         
         # Get all live apps (visible to community)
-        live_apps = db.session.query(AIApp).filter_by(is_live=True).order_by(AIApp.live_at.desc()).all()
+        live_apps = db.session.query(AIApp).options(defer(AIApp.code)).filter_by(is_live=True).order_by(AIApp.live_at.desc()).all()
         
         return jsonify({
-            "my_apps": [app.to_dict() for app in my_apps],
-            "live_apps": [app.to_dict() for app in live_apps]
+            "my_apps": ai_app_listing_dicts(my_apps),
+            "live_apps": ai_app_listing_dicts(live_apps)
         })
     except Exception as e:
         logger.exception(f"Error listing AI apps: {e}")
@@ -4011,7 +8107,10 @@ def update_ai_app(app_id: int):
         if "description" in data:
             ai_app.description = data.get("description", "").strip()
         if "code" in data:
+            ensure_ai_app_history(ai_app)
             ai_app.code = data["code"]
+            publish_ai_app_asset(ai_app)
+            record_ai_app_revision(ai_app, "edit")
         
         db.session.commit()
         
@@ -4150,7 +8249,10 @@ window.CLOUD_PC_ID = {pc_id};
                 generated_code = pc_id_injection + generated_code
         
         # Update app code
+        ensure_ai_app_history(ai_app)
         ai_app.code = generated_code
+        publish_ai_app_asset(ai_app)
+        record_ai_app_revision(ai_app, "generate")
         db.session.commit()
         
         logger.info(f"User {user.id} generated code for AI app {app_id}")
@@ -4166,6 +8268,130 @@ window.CLOUD_PC_ID = {pc_id};
         return jsonify({"error": "Failed to generate code"}), 500
 
 
+@app.get("/api/ai-apps/<int:app_id>/revisions")
+@login_required
+def list_ai_app_revisions(app_id: int):
+    """List the saved code revisions of an AI app, newest first."""
+    try:
+        user = current_user()
+        if not user:
+            return jsonify({"error": "Authentication required"}), 401
+        
+        ai_app = db.session.query(AIApp).options(defer(AIApp.code)).filter_by(id=app_id, developer_id=user.id).first()
+        if not ai_app:
+            return jsonify({"error": "AI app not found"}), 404
+        
+        revisions = (
+            db.session.query(AIAppRevision)
+            .filter_by(app_id=app_id)
+            .order_by(AIAppRevision.revision.desc())
+            .all()
+        )
+        return jsonify({"revisions": [revision.to_dict() for revision in revisions]})
+    except Exception as e:
+        logger.exception(f"Error listing AI app revisions: {e}")
+        return jsonify({"error": "Failed to load revisions"}), 500
+
+
+@app.get("/api/ai-apps/<int:app_id>/revisions/<int:revision_number>")
+@login_required
+def get_ai_app_revision(app_id: int, revision_number: int):
+    """Get the code of one revision."""
+    try:
+        user = current_user()
+        if not user:
+            return jsonify({"error": "Authentication required"}), 401
+        
+        ai_app = db.session.query(AIApp).options(defer(AIApp.code)).filter_by(id=app_id, developer_id=user.id).first()
+        if not ai_app:
+            return jsonify({"error": "AI app not found"}), 404
+        
+        revision = db.session.query(AIAppRevision).filter_by(app_id=app_id, revision=revision_number).first()
+        if not revision:
+            return jsonify({"error": "Revision not found"}), 404
+        
+        return jsonify({"revision": revision.to_dict(), "code": load_ai_app_revision_code(revision)})
+    except Exception as e:
+        logger.exception(f"Error getting AI app revision: {e}")
+        return jsonify({"error": "Failed to load revision"}), 500
+
+
+@app.get("/api/ai-apps/<int:app_id>/revisions/<int:revision_number>/diff")
+@login_required
+def diff_ai_app_revision(app_id: int, revision_number: int):
+    """Unified diff from a revision to another one (?against=<revision>) or to the current code."""
+    try:
+        user = current_user()
+        if not user:
+            return jsonify({"error": "Authentication required"}), 401
+        
+        ai_app = db.session.query(AIApp).filter_by(id=app_id, developer_id=user.id).first()
+        if not ai_app:
+            return jsonify({"error": "AI app not found"}), 404
+        
+        revision = db.session.query(AIAppRevision).filter_by(app_id=app_id, revision=revision_number).first()
+        if not revision:
+            return jsonify({"error": "Revision not found"}), 404
+        
+        against = request.args.get("against", "current")
+        if against == "current":
+            other_code, other_label = ai_app.code or "", "current"
+        else:
+            try:
+                other = db.session.query(AIAppRevision).filter_by(app_id=app_id, revision=int(against)).first()
+            except ValueError:
+                return jsonify({"error": "Invalid revision to compare against"}), 400
+            if not other:
+                return jsonify({"error": "Revision to compare against not found"}), 404
+            other_code, other_label = load_ai_app_revision_code(other), f"revision {other.revision}"
+        
+        import difflib
+        diff = "".join(difflib.unified_diff(
+            load_ai_app_revision_code(revision).splitlines(keepends=True),
+            other_code.splitlines(keepends=True),
+            fromfile=f"revision {revision.revision}",
+            tofile=other_label,
+        ))
+        return jsonify({"diff": diff, "from": revision.revision, "to": against})
+    except Exception as e:
+        logger.exception(f"Error diffing AI app revision: {e}")
+        return jsonify({"error": "Failed to diff revision"}), 500
+
+
+@app.post("/api/ai-apps/<int:app_id>/revisions/<int:revision_number>/restore")
+@login_required
+def restore_ai_app_revision(app_id: int, revision_number: int):
+    """Make an old revision the current code (recorded as a new revision)."""
+    try:
+        user = current_user()
+        if not user:
+            return jsonify({"error": "Authentication required"}), 401
+        
+        ai_app = db.session.query(AIApp).filter_by(id=app_id, developer_id=user.id).first()
+        if not ai_app:
+            return jsonify({"error": "AI app not found"}), 404
+        
+        revision = db.session.query(AIAppRevision).filter_by(app_id=app_id, revision=revision_number).first()
+        if not revision:
+            return jsonify({"error": "Revision not found"}), 404
+        
+        ai_app.code = load_ai_app_revision_code(revision)
+        publish_ai_app_asset(ai_app)
+        record_ai_app_revision(ai_app, "restore")
+        db.session.commit()
+        
+        logger.info(f"User {user.id} restored AI app {app_id} to revision {revision_number}")
+        
+        return jsonify({
+            "message": f"Restored revision {revision_number}",
+            "app": ai_app.to_dict()
+        })
+    except Exception as e:
+        logger.exception(f"Error restoring AI app revision: {e}")
+        db.session.rollback()
+        return jsonify({"error": "Failed to restore revision"}), 500
+
+
 @app.post("/api/ai-apps/<int:app_id>/go-live")
 @login_required
 def make_ai_app_live(app_id: int):
@@ -4184,6 +8410,8 @@ def make_ai_app_live(app_id: int):
         
         ai_app.is_live = True
         ai_app.live_at = datetime.utcnow()
+        # Compress once here so the store serves the precomputed variants
+        publish_ai_app_asset(ai_app)
         db.session.commit()
         
         logger.info(f"User {user.id} made AI app {app_id} live")
@@ -4214,6 +8442,9 @@ def delete_ai_app(app_id: int):
         # Delete all chat messages for this app
         db.session.query(AIAppChat).filter_by(app_id=app_id).delete()
         
+        db.session.query(AIAppAsset).filter_by(app_id=app_id).delete()
+        db.session.query(AIAppRevision).filter_by(app_id=app_id).delete()
+        shutil.rmtree(os.path.join(AI_APP_ASSET_DIR, f"app_{app_id}"), ignore_errors=True)
         db.session.delete(ai_app)
         db.session.commit()
         
@@ -4257,6 +8488,301 @@ def get_ai_app_chat(app_id: int):
         return jsonify({"error": "Failed to load chat"}), 500
 
 
+_OUTLINE_PATTERNS = [
+    (re.compile(r"<(head|body|style|script|header|nav|main|section|article|aside|footer|form|dialog|template|canvas|table)\b[^>]*>", re.I), "html"),
+    (re.compile(r"<\w+[^>]*\bid=[\"']([^\"']+)[\"'][^>]*>", re.I), "html"),
+    (re.compile(r"^\s*(@media[^{]*|[.#a-zA-Z*:\[][^{};/]*?)\s*\{\s*$"), "css"),
+    (re.compile(r"\b(?:async\s+)?function\s*\*?\s*(\w+)\s*\("), "js"),
+    (re.compile(r"\b(?:const|let|var)\s+(\w+)\s*=\s*(?:async\s*)?(?:function\b|\([^)]*\)\s*=>|\w+\s*=>)"), "js"),
+    (re.compile(r"\bclass\s+(\w+)"), "js"),
+    (re.compile(r"addEventListener\(\s*[\"'](\w+)[\"']"), "js"),
+]
+
+
+def build_ai_app_outline(code: str, max_entries: int = 150) -> str:
+    """Line-numbered map of an app's landmarks: sections, ids, CSS rules, JS functions."""
+    entries = []
+    for number, line in enumerate(code.splitlines(), start=1):
+        for pattern, _kind in _OUTLINE_PATTERNS:
+            if pattern.search(line):
+                entries.append(f"{number:>5}: {line.strip()[:100]}")
+                break
+    if len(entries) > max_entries:
+        step = len(entries) / max_entries
+        entries = [entries[int(i * step)] for i in range(max_entries)] + ["  ... (outline thinned)"]
+    return "\n".join(entries)
+
+
+_VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr"}
+# Document-level wrappers do not count as nesting, so their children become sections
+_TRANSPARENT_TAGS = {"html", "head", "body", "!doctype"}
+_TAG_RE = re.compile(r"<(/?)([a-zA-Z][\w-]*)[^>]*?(/?)>")
+_CODE_TOKEN_RE = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+")
+_CODE_STOPWORDS = {
+    "the", "and", "for", "with", "this", "that", "to", "of", "in", "on", "is", "it", "a", "an", "be",
+    "var", "let", "const", "function", "return", "div", "px", "class", "id", "please", "make", "can",
+}
+_ai_app_parse_cache = OrderedDict()
+
+
+def _code_tokens(text_value: str) -> List[str]:
+    """Split identifiers (camelCase, kebab-case, snake_case) into lowercase terms."""
+    tokens = []
+    for token in _CODE_TOKEN_RE.findall(text_value):
+        token = token.lower()
+        if len(token) < 2 or token in _CODE_STOPWORDS:
+            continue
+        tokens.append(token[:-1] if len(token) > 3 and token.endswith("s") else token)
+    return tokens
+
+
+def _brace_delta(line: str) -> int:
+    return line.count("{") - line.count("}")
+
+
+def _tag_delta(line: str) -> int:
+    delta = 0
+    for closing, tag, self_closing in _TAG_RE.findall(line):
+        if tag.lower() in _VOID_TAGS or tag.lower() in _TRANSPARENT_TAGS or self_closing:
+            continue
+        delta += -1 if closing else 1
+    return delta
+
+
+def chunk_ai_app_code(code: str, max_lines: int = 60) -> List[dict]:
+    """Split an app into addressable sections: markup elements, CSS rules and JS statements.
+
+    Sections are runs of lines that return to the nesting depth they started at
+    (braces for CSS/JS, tags for markup); oversized runs are cut into windows.
+    """
+    lines = code.splitlines(keepends=True)
+    chunks = []
+    region = "html"
+    current = None
+    depth = 0
+
+    def close(end_index):
+        nonlocal current
+        if current is None:
+            return
+        start = current["start"]
+        for window_start in range(start, end_index + 1, max_lines):
+            window_end = min(window_start + max_lines - 1, end_index)
+            body = "".join(lines[window_start:window_end + 1])
+            if not body.strip():
+                continue
+            chunks.append({
+                "kind": current["kind"],
+                "start_line": window_start + 1,
+                "end_line": window_end + 1,
+                "label": lines[window_start].strip()[:80],
+                "text": body,
+            })
+        current = None
+
+    for index, line in enumerate(lines):
+        lowered = line.lower()
+        # Region switches always start a new section
+        if region == "html" and ("<style" in lowered or "<script" in lowered):
+            close(index - 1)
+            region = "css" if "<style" in lowered else "js"
+            depth = 0
+            if "</style>" in lowered or "</script>" in lowered:
+                current = {"kind": region, "start": index}
+                close(index)
+                region = "html"
+            continue
+        if region != "html" and ("</style>" in lowered or "</script>" in lowered):
+            close(index - 1)
+            region = "html"
+            depth = 0
+            continue
+        if current is None:
+            if not line.strip():
+                continue
+            current = {"kind": region, "start": index}
+        depth += _tag_delta(line) if region == "html" else _brace_delta(line)
+        if depth <= 0:
+            depth = 0
+            # Merge very small statements with the next ones so sections stay meaningful
+            if index - current["start"] >= 2 or region == "html" and index - current["start"] >= 1:
+                close(index)
+    close(len(lines) - 1)
+
+    for number, chunk in enumerate(chunks):
+        chunk["id"] = number
+    return chunks
+
+
+class _AppCodeIndex:
+    """BM25 index over the sections of one code revision."""
+
+    def __init__(self, chunks: List[dict]):
+        self.chunks = chunks
+        self.term_counts = [Counter(_code_tokens(chunk["label"] + " " + chunk["text"])) for chunk in chunks]
+        self.lengths = [sum(counts.values()) or 1 for counts in self.term_counts]
+        self.average_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 1
+        self.document_frequency = Counter()
+        for counts in self.term_counts:
+            self.document_frequency.update(counts.keys())
+
+    def score(self, query: str) -> List[float]:
+        import math
+        terms = set(_code_tokens(query))
+        total = len(self.chunks)
+        scores = []
+        for counts, length in zip(self.term_counts, self.lengths):
+            score = 0.0
+            for term in terms:
+                frequency = counts.get(term)
+                if not frequency:
+                    continue
+                idf = math.log(1 + (total - self.document_frequency[term] + 0.5) / (self.document_frequency[term] + 0.5))
+                score += idf * frequency * 2.2 / (frequency + 1.2 * (0.25 + 0.75 * length / self.average_length))
+            scores.append(score)
+        return scores
+
+
+def get_ai_app_code_index(code: str) -> _AppCodeIndex:
+    """Parse + index a code revision once; keyed by content hash so every revision is cached separately."""
+    key = hashlib.sha256(code.encode("utf-8")).hexdigest()
+    index = _ai_app_parse_cache.get(key)
+    if index is None:
+        index = _AppCodeIndex(chunk_ai_app_code(code))
+        _ai_app_parse_cache[key] = index
+        while len(_ai_app_parse_cache) > 64:
+            _ai_app_parse_cache.popitem(last=False)
+    else:
+        _ai_app_parse_cache.move_to_end(key)
+    return index
+
+
+def select_ai_app_context(code: str, message: str, token_budget: Optional[int] = None) -> str:
+    """Return the app code, or the sections most relevant to `message` when it exceeds the budget."""
+    budget_chars = (token_budget or AI_APP_CONTEXT_TOKEN_BUDGET) * 4
+    if len(code) <= budget_chars:
+        return code
+
+    index = get_ai_app_code_index(code)
+    scores = index.score(message)
+    ranked = sorted((number for number in range(len(index.chunks)) if scores[number] > 0), key=lambda number: -scores[number])
+    if not ranked:
+        ranked = list(range(len(index.chunks)))  # nothing matched: show the app from the top
+
+    selected, used = [], 0
+    for number in ranked:
+        chunk = index.chunks[number]
+        cost = len(chunk["text"]) + 40
+        if used + cost > budget_chars:
+            continue
+        selected.append(chunk)
+        used += cost
+
+    parts = []
+    for chunk in sorted(selected, key=lambda item: item["start_line"]):
+        parts.append(f"<!-- … lines {chunk['start_line']}-{chunk['end_line']} ({chunk['kind']}) -->\n{chunk['text']}")
+    return "".join(parts) + "<!-- … other sections omitted; see the outline -->"
+
+
+def build_ai_app_patch_prompt(ai_app: AIApp, message: str, cloud_pc_context: str = "") -> str:
+    """System prompt for edit mode: outline + code context, answer with patches only."""
+    code = ai_app.code or ""
+    return f"""You are an AI app builder editing an existing single-file HTML/CSS/JS app.
+
+App Name: {ai_app.name}
+App Description: {ai_app.description or 'No description provided'}
+{cloud_pc_context}
+
+Outline of the current code (line number: landmark):
+{build_ai_app_outline(code)}
+
+Current code (when the app is large only the sections relevant to the request are shown;
+lines like "<!-- … lines 10-42 (js) -->" are section markers, not part of the code):
+```html
+{select_ai_app_context(code, message)}
+```
+
+Make the change the user asks for by replying with one or more SEARCH/REPLACE blocks, exactly like this:
+
+<<<<<<< SEARCH
+(lines copied exactly from the current code, enough to be unique)
+=======
+(the new lines that replace them)
+>>>>>>> REPLACE
+
+Rules:
+- SEARCH text must match the current code exactly, including indentation, and must occur only once.
+- Keep each block as small as possible; never resend the whole app.
+- To add code, SEARCH for a nearby anchor line and repeat it in REPLACE together with the new lines.
+- File operations must use the Cloud PC APIs, not local file system APIs.
+- Before the blocks, say in one or two sentences what you changed."""
+
+
+_SEARCH_REPLACE_RE = re.compile(
+    r"<{5,9} ?SEARCH[^\n]*\n(.*?)\n?={5,9}[^\n]*\n(.*?)\n?>{5,9} ?REPLACE",
+    re.S,
+)
+_DIFF_BLOCK_RE = re.compile(r"```(?:diff|patch)\s*\n(.*?)```", re.S)
+
+
+def parse_ai_app_patches(response: str) -> List[tuple]:
+    """Extract (search, replace) pairs from SEARCH/REPLACE blocks or ```diff hunks."""
+    patches = [(search, replace) for search, replace in _SEARCH_REPLACE_RE.findall(response)]
+    for diff in _DIFF_BLOCK_RE.findall(response):
+        old_lines, new_lines = [], []
+        for line in diff.splitlines() + ["@@"]:
+            if line.startswith("@@"):
+                if old_lines or new_lines:
+                    patches.append(("\n".join(old_lines), "\n".join(new_lines)))
+                old_lines, new_lines = [], []
+            elif line.startswith(("---", "+++", "\\")):
+                continue
+            elif line.startswith("-"):
+                old_lines.append(line[1:])
+            elif line.startswith("+"):
+                new_lines.append(line[1:])
+            else:
+                context = line[1:] if line.startswith(" ") else line
+                old_lines.append(context)
+                new_lines.append(context)
+    return patches
+
+
+def apply_ai_app_patches(code: str, patches: List[tuple]) -> str:
+    """Apply search/replace patches all-or-nothing.
+
+    Each search must match once, exactly or (failing that) line by line ignoring
+    surrounding whitespace. Raises PatchConflict otherwise.
+    """
+    for number, (search, replace) in enumerate(patches, start=1):
+        if not search.strip():
+            raise PatchConflict(f"Patch {number} has an empty SEARCH section")
+        occurrences = code.count(search)
+        if occurrences == 1:
+            code = code.replace(search, replace, 1)
+            continue
+        if occurrences > 1:
+            raise PatchConflict(f"Patch {number} matches {occurrences} places; it needs more context")
+
+        lines = code.splitlines(keepends=True)
+        wanted = [line.strip() for line in search.strip("\n").splitlines()]
+        matches = [
+            start for start in range(len(lines) - len(wanted) + 1)
+            if all(lines[start + offset].strip() == wanted[offset] for offset in range(len(wanted)))
+        ]
+        if len(matches) != 1:
+            raise PatchConflict(
+                f"Patch {number} does not match the current code" if not matches
+                else f"Patch {number} matches {len(matches)} places; it needs more context"
+            )
+        start = matches[0]
+        end = start + len(wanted)
+        trailing = "\n" if lines[end - 1].endswith("\n") and replace and not replace.endswith("\n") else ""
+        lines[start:end] = [replace + trailing] if replace else []
+        code = "".join(lines)
+    return code
+
+
 @app.post("/api/ai-apps/<int:app_id>/chat")
 @login_required
 def send_ai_app_chat_message(app_id: int):
@@ -4340,7 +8866,7 @@ App Description: {ai_app.description or 'No description provided'}
 
 Current App Code:
 ```html
-{ai_app.code[:2000] if ai_app.code else 'No code yet'}
+{ai_app.code or 'No code yet'}
 ```
 
 CRITICAL INSTRUCTIONS - YOU ARE THE BUILDER:
@@ -4390,6 +8916,21 @@ ALWAYS wrap your code in ```html code blocks like this:
 
 Remember: YOU are the developer. The user describes, YOU build."""
         
+        # Edit mode: the model sees an outline and returns patches, so cost scales with the change.
+        # Full mode replaces the whole app with the reply, so it must see all of the code: apps
+        # over the context budget are always edited with patches.
+        over_budget = len(ai_app.code or "") > AI_APP_CONTEXT_TOKEN_BUDGET * 4
+        edit_mode = (
+            (data.get("mode") == "patch" or over_budget) and ai_app.developer_id == user.id and bool(ai_app.code)
+        )
+        if edit_mode:
+            system_prompt = build_ai_app_patch_prompt(ai_app, message, cloud_pc_context)
+            # Earlier replies may hold whole copies of the app; keep only their gist
+            chat_history = [
+                {**turn, "content": turn["content"][:AI_APP_EDIT_HISTORY_CHARS]} if turn["role"] == "assistant" else turn
+                for turn in chat_history
+            ]
+        
         # Get AI response
         try:
             ai_response = call_openai(chat_history, system_prompt=system_prompt)
@@ -4397,6 +8938,21 @@ Remember: YOU are the developer. The user describes, YOU build."""
             logger.error(f"OpenAI error in chat: {e}")
             ai_response = "I'm having trouble connecting to the AI service. Please try again."
         
+        code_updated = False
+        patch_error = None
+        patches = parse_ai_app_patches(ai_response) if edit_mode else []
+        if patches:
+            try:
+                new_code = apply_ai_app_patches(ai_app.code, patches)
+                ensure_ai_app_history(ai_app)
+                ai_app.code = new_code
+                publish_ai_app_asset(ai_app)
+                record_ai_app_revision(ai_app, "chat-patch")
+                code_updated = True
+            except PatchConflict as conflict:
+                patch_error = str(conflict)
+                logger.info(f"AI patch for app {app_id} did not apply: {conflict}")
+        
         # Save AI response
         ai_chat = AIAppChat(
             app_id=app_id,
@@ -4410,11 +8966,19 @@ Remember: YOU are the developer. The user describes, YOU build."""
         
         logger.info(f"User {user.id} sent chat message for app {app_id}")
         
-        return jsonify({
+        response_data = {
             "message": "Message sent successfully",
             "user_message": user_chat.to_dict(),
-            "ai_response": ai_chat.to_dict()
-        })
+            "ai_response": ai_chat.to_dict(),
+            "code_updated": code_updated,
+            "mode": "patch" if edit_mode else "full",
+        }
+        if edit_mode:
+            response_data["patches_applied"] = len(patches) if code_updated else 0
+            response_data["patch_error"] = patch_error
+        if code_updated:
+            response_data["code"] = ai_app.code
+        return jsonify(response_data)
     except Exception as e:
         logger.exception(f"Error sending chat message: {e}")
         db.session.rollback()
@@ -4436,7 +9000,7 @@ def get_app_store():
             return jsonify({"error": "Authentication required"}), 401
         
         # Get all live apps
-        live_apps = db.session.query(AIApp).filter_by(is_live=True).order_by(AIApp.live_at.desc()).all()
+        live_apps = db.session.query(AIApp).options(defer(AIApp.code)).filter_by(is_live=True).order_by(AIApp.live_at.desc()).all()
         
         # Get user's downloaded app IDs
         downloaded_app_ids = {
@@ -4446,9 +9010,8 @@ def get_app_store():
         
         # Get developer info for each app
         apps_with_developer = []
-        for app in live_apps:
+        for app, app_dict in zip(live_apps, ai_app_listing_dicts(live_apps)):
             developer = db.session.query(User).filter_by(id=app.developer_id).first()
-            app_dict = app.to_dict()
             app_dict["developer"] = developer.username if developer else "Unknown"
             app_dict["is_downloaded"] = app.id in downloaded_app_ids
             apps_with_developer.append(app_dict)
@@ -4519,10 +9082,10 @@ def get_my_downloads():
         # Get app details for each download
         downloaded_apps = []
         for download in downloads:
-            app = db.session.query(AIApp).filter_by(id=download.app_id).first()
+            app = db.session.query(AIApp).options(defer(AIApp.code)).filter_by(id=download.app_id).first()
             if app:
                 developer = db.session.query(User).filter_by(id=app.developer_id).first()
-                app_dict = app.to_dict()
+                app_dict = ai_app_listing_dicts([app])[0]
                 app_dict["developer"] = developer.username if developer else "Unknown"
                 app_dict["downloaded_at"] = download.created_at.isoformat() if download.created_at else None
                 downloaded_apps.append(app_dict)
@@ -4564,6 +9127,308 @@ def remove_download(app_id: int):
         return jsonify({"error": "Failed to remove download"}), 500
 
 
+###############################################################################
+# Search                                                                       #
+###############################################################################
+
+
+SEARCH_RESULT_TYPES = ("blog", "doc", "todo", "message", "chat")
+_search_backend = None
+
+
+def init_search_index() -> str:
+    """Create the full-text structures over search_documents; returns the backend in use."""
+    global _search_backend
+    dialect = db.engine.dialect.name
+    try:
+        if dialect == "sqlite":
+            with db.engine.begin() as conn:
+                conn.execute(text(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS search_documents_fts USING fts5("
+                    "title, body, content='search_documents', content_rowid='id', tokenize='unicode61')"
+                ))
+                conn.execute(text(
+                    "CREATE TRIGGER IF NOT EXISTS search_documents_ai AFTER INSERT ON search_documents BEGIN "
+                    "INSERT INTO search_documents_fts(rowid, title, body) VALUES (new.id, new.title, new.body); END"
+                ))
+                conn.execute(text(
+                    "CREATE TRIGGER IF NOT EXISTS search_documents_ad AFTER DELETE ON search_documents BEGIN "
+                    "INSERT INTO search_documents_fts(search_documents_fts, rowid, title, body) "
+                    "VALUES ('delete', old.id, old.title, old.body); END"
+                ))
+                conn.execute(text(
+                    "CREATE TRIGGER IF NOT EXISTS search_documents_au AFTER UPDATE ON search_documents BEGIN "
+                    "INSERT INTO search_documents_fts(search_documents_fts, rowid, title, body) "
+                    "VALUES ('delete', old.id, old.title, old.body); "
+                    "INSERT INTO search_documents_fts(rowid, title, body) VALUES (new.id, new.title, new.body); END"
+                ))
+            _search_backend = "fts5"
+        elif dialect == "postgresql":
+            with db.engine.begin() as conn:
+                conn.execute(text(
+                    "CREATE INDEX IF NOT EXISTS ix_search_documents_tsv ON search_documents "
+                    "USING GIN (to_tsvector('simple', title || ' ' || body))"
+                ))
+            _search_backend = "tsvector"
+        else:
+            _search_backend = "like"
+    except Exception as e:
+        logger.warning(f"Full-text search index unavailable, falling back to LIKE search: {e}")
+        _search_backend = "like"
+    return _search_backend
+
+
+# Each indexed model maps to (source name, attributes whose change triggers re-indexing,
+# builder returning the search_documents values for an instance).
+def _ai_message_owner(connection, message) -> Optional[int]:
+    """Owner of the message's chat, read from the ``chat`` relationship when it is already loaded."""
+    chat = db.inspect(message).dict.get("chat")
+    if chat is not None:
+        return chat.owner_id
+    return connection.execute(select(AIChat.owner_id).where(AIChat.id == message.chat_id)).scalar()
+
+
+_SEARCH_SOURCES = {
+    Blog: ("blog", ("owner_id", "title", "body"), lambda blog, connection: {
+        "result_type": "blog", "result_id": blog.id, "owner_id": blog.owner_id, "is_public": True,
+        "title": blog.title, "body": blog.body,
+    }),
+    Todo: ("todo", ("owner_id", "title"), lambda todo, connection: {
+        "result_type": "todo", "result_id": todo.id, "owner_id": todo.owner_id, "title": todo.title,
+    }),
+    Message: ("message", ("body", "attachment_filename"), lambda message, connection: {
+        "result_type": "message", "result_id": message.id, "owner_id": message.sender_id,
+        "viewer_id": message.recipient_id, "title": message.attachment_filename or "", "body": message.body or "",
+    }),
+    AIDoc: ("ai_doc", ("owner_id", "title", "content"), lambda doc, connection: {
+        "result_type": "doc", "result_id": doc.id, "owner_id": doc.owner_id,
+        "title": doc.title, "body": doc.content or "",
+    }),
+    AIDocChunk: ("ai_doc_chunk", ("body",), lambda chunk, connection: {
+        "result_type": "doc", "result_id": chunk.doc_id, "owner_id": chunk.owner_id, "body": chunk.body,
+    }),
+    AIChat: ("ai_chat", ("owner_id", "title"), lambda chat, connection: {
+        "result_type": "chat", "result_id": chat.id, "owner_id": chat.owner_id, "title": chat.title,
+    }),
+    AIMessage: ("ai_message", ("content",), lambda message, connection: {
+        "result_type": "chat", "result_id": message.chat_id,
+        "owner_id": _ai_message_owner(connection, message), "body": message.content,
+    }),
+}
+
+
+def _write_search_document(connection, target) -> None:
+    source, _, build = _SEARCH_SOURCES[type(target)]
+    table = SearchDocument.__table__
+    connection.execute(table.delete().where(table.c.source == source, table.c.source_id == target.id))
+    values = build(target, connection)
+    if values["owner_id"] is not None:
+        connection.execute(table.insert().values(source=source, source_id=target.id, **values))
+
+
+def _on_search_source_insert(mapper, connection, target):
+    _write_search_document(connection, target)
+
+
+def _on_search_source_update(mapper, connection, target):
+    _, watched, _ = _SEARCH_SOURCES[type(target)]
+    state = db.inspect(target)
+    if any(state.attrs[name].history.has_changes() for name in watched):
+        _write_search_document(connection, target)
+
+
+def _on_search_source_delete(mapper, connection, target):
+    source, _, build = _SEARCH_SOURCES[type(target)]
+    table = SearchDocument.__table__
+    connection.execute(table.delete().where(table.c.source == source, table.c.source_id == target.id))
+    if isinstance(target, (AIDoc, AIChat)):
+        # Chunks are removed with bulk deletes, which skip ORM events
+        result_type = "doc" if isinstance(target, AIDoc) else "chat"
+        connection.execute(table.delete().where(table.c.result_type == result_type, table.c.result_id == target.id))
+
+
+for _search_model in _SEARCH_SOURCES:
+    event.listen(_search_model, "after_insert", _on_search_source_insert)
+    event.listen(_search_model, "after_update", _on_search_source_update)
+    event.listen(_search_model, "after_delete", _on_search_source_delete)
+
+
+def backfill_search_documents(batch_size: int = 500) -> int:
+    """Index rows that have no search document yet, committing every ``batch_size``; returns rows indexed.
+
+    Only unindexed rows are picked up, so an interrupted backfill resumes where it stopped.
+    """
+    indexed = 0
+    for model, (source, _, _) in _SEARCH_SOURCES.items():
+        query = db.session.query(model).outerjoin(
+            SearchDocument, (SearchDocument.source == source) & (SearchDocument.source_id == model.id)
+        ).filter(SearchDocument.id.is_(None))
+        if model is AIMessage:
+            query = query.options(selectinload(AIMessage.chat))  # owners in one query per batch
+        last_id = 0
+        while True:
+            batch = query.filter(model.id > last_id).order_by(model.id).limit(batch_size).all()
+            if not batch:
+                break
+            connection = db.session.connection()
+            for target in batch:
+                _write_search_document(connection, target)
+            db.session.commit()
+            indexed += len(batch)
+            last_id = batch[-1].id
+    return indexed
+
+
+def _search_result_details(hits: List[Tuple[str, int]]) -> dict:
+    """Current display fields for each (result_type, result_id), looked up per type in one query."""
+    ids = {}
+    for result_type, result_id in hits:
+        ids.setdefault(result_type, set()).add(result_id)
+    details = {}
+    if "blog" in ids:
+        for blog_id, title in db.session.query(Blog.id, Blog.title).filter(Blog.id.in_(ids["blog"])):
+            details[("blog", blog_id)] = {"title": title}
+    if "doc" in ids:
+        for doc_id, title in db.session.query(AIDoc.id, AIDoc.title).filter(AIDoc.id.in_(ids["doc"])):
+            details[("doc", doc_id)] = {"title": title}
+    if "todo" in ids:
+        rows = db.session.query(Todo.id, Todo.title, Todo.is_completed).filter(Todo.id.in_(ids["todo"]))
+        for todo_id, title, is_completed in rows:
+            details[("todo", todo_id)] = {"title": title, "is_completed": is_completed}
+    if "chat" in ids:
+        for chat_id, title in db.session.query(AIChat.id, AIChat.title).filter(AIChat.id.in_(ids["chat"])):
+            details[("chat", chat_id)] = {"title": title}
+    if "message" in ids:
+        rows = db.session.query(Message.id, Message.sender_id, Message.recipient_id).filter(Message.id.in_(ids["message"]))
+        messages = {row.id: row for row in rows}
+        usernames = dict(
+            db.session.query(User.id, User.username).filter(
+                User.id.in_({row.sender_id for row in messages.values()} | {row.recipient_id for row in messages.values()})
+            )
+        )
+        for message_id, row in messages.items():
+            details[("message", message_id)] = {
+                "sender": usernames.get(row.sender_id),
+                "recipient": usernames.get(row.recipient_id),
+            }
+    return details
+
+
+def search_content(user_id: Optional[int], query: str, types=SEARCH_RESULT_TYPES, limit: int = 20, offset: int = 0) -> List[dict]:
+    """Ranked full-text search over what ``user_id`` may see (public rows only when None).
+
+    A result is one blog, doc, todo, message or chat; when several indexed rows point at it
+    (a doc's chunks, a chat's messages) only the best-scoring one counts.
+    """
+    terms = _search_terms(query)
+    if not terms or not types:
+        return []
+    backend = _search_backend or init_search_index()
+    params = {"user_id": user_id if user_id is not None else -1, "types": list(types), "limit": limit, "offset": offset}
+    visible = "(d.owner_id = :user_id OR d.viewer_id = :user_id OR d.is_public) AND d.result_type IN :types"
+
+    if backend == "fts5":
+        # Quote every term so user input is never parsed as FTS syntax; the last one matches as a prefix
+        params["match"] = " ".join('"%s"' % term for term in terms[:-1]) + ' "%s"*' % terms[-1]
+        params["start"], params["end"] = SEARCH_MARK_START, SEARCH_MARK_END
+        sql = (
+            "SELECT result_type, result_id, score, snippet FROM ("
+            "SELECT *, ROW_NUMBER() OVER (PARTITION BY result_type, result_id ORDER BY score) AS hit_rank FROM ("
+            "SELECT d.result_type, d.result_id, bm25(search_documents_fts, 4.0, 1.0) AS score, "
+            "snippet(search_documents_fts, -1, :start, :end, '…', 16) AS snippet "
+            "FROM search_documents_fts JOIN search_documents d ON d.id = search_documents_fts.rowid "
+            f"WHERE search_documents_fts MATCH :match AND {visible}) scored) hits "
+            "WHERE hit_rank = 1 ORDER BY score LIMIT :limit OFFSET :offset"
+        )
+        statement = text(sql).bindparams(bindparam("types", expanding=True))
+        rows = [(row.result_type, row.result_id, -row.score, row.snippet) for row in db.session.execute(statement, params)]
+    elif backend == "tsvector":
+        params["query"] = " & ".join(terms[:-1] + [terms[-1] + ":*"])
+        params["options"] = f"StartSel={SEARCH_MARK_START}, StopSel={SEARCH_MARK_END}, MaxWords=24, MinWords=8"
+        # Headlines are costly, so they are built only for the page of hits that is returned
+        sql = (
+            "SELECT hits.result_type, hits.result_id, hits.score, "
+            "ts_headline('simple', d.title || ' ' || d.body, to_tsquery('simple', :query), :options) AS snippet "
+            "FROM (SELECT d.id, d.result_type, d.result_id, ts_rank(to_tsvector('simple', d.title || ' ' || d.body), q) AS score, "
+            "ROW_NUMBER() OVER (PARTITION BY d.result_type, d.result_id "
+            "ORDER BY ts_rank(to_tsvector('simple', d.title || ' ' || d.body), q) DESC) AS hit_rank "
+            "FROM search_documents d, to_tsquery('simple', :query) q "
+            f"WHERE to_tsvector('simple', d.title || ' ' || d.body) @@ q AND {visible}) hits "
+            "JOIN search_documents d ON d.id = hits.id "
+            "WHERE hits.hit_rank = 1 ORDER BY hits.score DESC LIMIT :limit OFFSET :offset"
+        )
+        statement = text(sql).bindparams(bindparam("types", expanding=True))
+        rows = [(row.result_type, row.result_id, float(row.score), row.snippet) for row in db.session.execute(statement, params)]
+    else:
+        candidates = db.session.query(SearchDocument).filter(
+            or_(
+                SearchDocument.owner_id == params["user_id"],
+                SearchDocument.viewer_id == params["user_id"],
+                SearchDocument.is_public.is_(True),
+            ),
+            SearchDocument.result_type.in_(params["types"]),
+        )
+        for term in terms:
+            candidates = candidates.filter(or_(SearchDocument.title.ilike(f"%{term}%"), SearchDocument.body.ilike(f"%{term}%")))
+        best = {}
+        for document in candidates:
+            combined = f"{document.title} {document.body}".strip()
+            lowered = combined.lower()
+            score = float(sum(lowered.count(term) for term in terms))
+            key = (document.result_type, document.result_id)
+            if key not in best or score > best[key][2]:
+                best[key] = (*key, score, _fallback_snippet(combined, terms))
+        rows = sorted(best.values(), key=lambda row: -row[2])[offset:offset + limit]
+
+    details = _search_result_details([(row[0], row[1]) for row in rows])
+    results = []
+    for result_type, result_id, score, snippet in rows:
+        if (result_type, result_id) not in details:
+            continue
+        # Escape the indexed text, then turn the sentinel markers into highlight tags
+        snippet = html.escape(snippet or "").replace(SEARCH_MARK_START, "<mark>").replace(SEARCH_MARK_END, "</mark>")
+        results.append({
+            "type": result_type,
+            "id": result_id,
+            **details[(result_type, result_id)],
+            "score": round(score, 4),
+            "snippet": snippet,
+        })
+    return results
+
+
+@app.get("/api/search")
+@login_required
+def search_everything():
+    """Search the caller's todos, docs, messages and AI chats plus all blogs.
+
+    ``types`` is a comma-separated subset of blog, doc, todo, message and chat.
+    """
+    user = current_user()
+    query = request.args.get("q", "").strip()
+    if not query:
+        return jsonify({"error": "Search query is required"}), 400
+
+    types = [name.strip() for name in request.args.get("types", "").split(",") if name.strip()]
+    unknown = sorted(set(types) - set(SEARCH_RESULT_TYPES))
+    if unknown:
+        return jsonify({"error": f"Unknown search types: {', '.join(unknown)}"}), 400
+
+    try:
+        page = max(int(request.args.get("page", 1)), 1)
+        per_page = min(max(int(request.args.get("per_page", 20)), 1), 100)
+    except ValueError:
+        return jsonify({"error": "Invalid pagination parameters"}), 400
+
+    try:
+        results = search_content(user.id, query, types or SEARCH_RESULT_TYPES, limit=per_page, offset=(page - 1) * per_page)
+    except Exception as e:
+        logger.exception(f"Error running search: {e}")
+        db.session.rollback()
+        return jsonify({"error": "Search failed"}), 500
+    return jsonify({"results": results, "query": query, "types": types or list(SEARCH_RESULT_TYPES), "page": page, "per_page": per_page})
+
+
 ###############################################################################
 # Error handling                                                               #
 ###############################################################################
@@ -4667,6 +9532,164 @@ def apply_cors_headers(response):
         return response
 
 
+###############################################################################
+# Schema migrations                                                            #
+###############################################################################
+
+
+# db.create_all() only creates missing tables. Changes to existing tables (new columns,
+# new indexes) go here as numbered steps; run_migrations() applies each one once and
+# records it in schema_migrations. Steps must be safe to re-run: a step interrupted
+# half-way (say, by a deploy) is simply run again.
+MIGRATION_LOCK_KEY = 7_315_001  # pg_advisory_lock key held while migrating
+
+
+def _add_column_if_missing(conn, table: str, column: str, ddl: str) -> None:
+    inspector = db.inspect(conn)
+    if table not in inspector.get_table_names():
+        return  # create_all() will create it with the column
+    if column not in {existing["name"] for existing in inspector.get_columns(table)}:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+
+
+def _create_index(conn, name: str, table: str, columns: List[str]) -> None:
+    """Create an index, online on Postgres (CONCURRENTLY, so writes are not blocked)."""
+    column_list = ", ".join(columns)
+    if conn.dialect.name == "postgresql":
+        # A failed concurrent build leaves an INVALID index that IF NOT EXISTS would keep
+        valid = conn.execute(
+            text("SELECT i.indisvalid FROM pg_class c JOIN pg_index i ON i.indexrelid = c.oid WHERE c.relname = :name"),
+            {"name": name},
+        ).scalar()
+        if valid is False:
+            conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+        conn.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} ({column_list})"))
+    else:
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({column_list})"))
+
+
+def _migrate_cloud_pc_open_apps(conn) -> None:
+    _add_column_if_missing(conn, "cloud_pcs", "open_apps", "TEXT")
+
+
+def _migrate_conversation_read_marks(conn) -> None:
+    _add_column_if_missing(conn, "conversations", "last_read_low_id", "INTEGER")
+    _add_column_if_missing(conn, "conversations", "last_read_high_id", "INTEGER")
+
+
+def _migrate_foreign_key_indexes(conn) -> None:
+    # Same names as the models' __table_args__, so new databases (create_all) already have them
+    _create_index(conn, "ix_messages_sender_recipient", "messages", ["sender_id", "recipient_id", "id"])
+    _create_index(conn, "ix_messages_recipient_sender", "messages", ["recipient_id", "sender_id", "id"])
+    _create_index(conn, "ix_todos_owner_created", "todos", ["owner_id", "created_at"])
+    _create_index(conn, "ix_reminders_user_time", "reminders", ["user_id", "reminder_time"])
+    _create_index(conn, "ix_ai_messages_chat", "ai_messages", ["chat_id", "id"])
+    _create_index(conn, "ix_ai_app_chats_app_user", "ai_app_chats", ["app_id", "user_id", "created_at"])
+    _create_index(conn, "ix_research_submissions_research", "research_submissions", ["research_id", "created_at"])
+
+
+def _migrate_search_documents(conn) -> None:
+    # Commits through the session in batches; this AUTOCOMMIT connection only holds the lock
+    init_search_index()
+    indexed = backfill_search_documents()
+    logger.info(f"Indexed {indexed} existing rows for search")
+
+
+def _migrate_cloud_pc_file_text(conn) -> None:
+    # Search used to index PCs lazily; it only reads now, so index every PC once
+    for (pc_id,) in db.session.query(CloudPC.id).order_by(CloudPC.id).all():
+        sync_cloud_pc_search_index(pc_id)
+        db.session.commit()
+
+
+def _migrate_conversations(conn) -> None:
+    created = backfill_conversations()
+    logger.info(f"Built {created} conversation summaries from message history")
+
+
+def _migrate_ai_doc_chunks(conn) -> None:
+    # Reads used to chunk legacy docs on first access; they only read now
+    converted = chunk_legacy_ai_docs()
+    logger.info(f"Chunked {converted} AI docs stored before chunked storage")
+
+
+def _migrate_paint_encoding(conn) -> None:
+    converted = encode_legacy_paints()
+    logger.info(f"Re-encoded {converted} paintings saved as JSON text")
+
+
+def _migrate_ai_app_assets(conn) -> None:
+    # Listings used to publish these on first view; they only read now
+    published = publish_missing_ai_app_assets()
+    logger.info(f"Published code assets for {published} AI apps")
+
+
+SCHEMA_MIGRATIONS = [
+    (1, "Add cloud_pcs.open_apps", _migrate_cloud_pc_open_apps),
+    (2, "Add conversation read marks", _migrate_conversation_read_marks),
+    (3, "Index hot foreign keys", _migrate_foreign_key_indexes),
+    (4, "Backfill search documents", _migrate_search_documents),
+    (5, "Backfill conversations", _migrate_conversations),
+    (6, "Index Cloud PC file text", _migrate_cloud_pc_file_text),
+    (7, "Chunk legacy AI docs", _migrate_ai_doc_chunks),
+    (8, "Encode legacy paintings", _migrate_paint_encoding),
+    (9, "Publish AI app code assets", _migrate_ai_app_assets),
+]
+
+
+class _MigrationLock:
+    """Keeps gunicorn workers that start together from migrating at the same time."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.handle = None
+
+    def __enter__(self):
+        if self.conn.dialect.name == "postgresql":
+            self.conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+        elif self.conn.dialect.name == "sqlite" and DATABASE_PATH:
+            try:
+                import fcntl
+            except ImportError:  # Windows: single-process development server
+                return self
+            self.handle = open(f"{DATABASE_PATH}.migrate.lock", "w")
+            fcntl.flock(self.handle, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.conn.dialect.name == "postgresql":
+            self.conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": MIGRATION_LOCK_KEY})
+        elif self.handle is not None:
+            self.handle.close()  # closing releases the flock
+        return False
+
+
+def pending_migrations() -> List[Tuple[int, str]]:
+    """SCHEMA_MIGRATIONS entries not yet recorded in schema_migrations."""
+    if not db.inspect(db.engine).has_table(SchemaMigration.__tablename__):
+        return [(version, name) for version, name, _ in SCHEMA_MIGRATIONS]
+    done = {version for (version,) in db.session.query(SchemaMigration.version)}
+    return [(version, name) for version, name, _ in SCHEMA_MIGRATIONS if version not in done]
+
+
+def run_migrations() -> List[int]:
+    """Apply pending SCHEMA_MIGRATIONS in version order; returns the versions applied."""
+    SchemaMigration.__table__.create(db.engine, checkfirst=True)
+    table = SchemaMigration.__table__
+    applied = []
+    # Autocommit: CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+    with db.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn, _MigrationLock(conn):
+        done = set(conn.execute(select(table.c.version)).scalars())
+        for version, name, migrate in SCHEMA_MIGRATIONS:
+            if version in done:
+                continue
+            logger.info(f"Applying migration {version}: {name}")
+            migrate(conn)
+            conn.execute(table.insert().values(version=version, name=name, applied_at=datetime.utcnow()))
+            applied.append(version)
+    return applied
+
+
 ###############################################################################
 # Database initialization (runs on app startup for Gunicorn/production)      #
 ###############################################################################
@@ -4677,6 +9700,14 @@ def init_database():
         logger.info("Initializing database tables...")
         db.create_all()
         logger.info("Database tables created/verified")
+        # Migrations run once per release (`flask migrate`), never from the serving workers
+        pending = pending_migrations()
+        if pending:
+            logger.warning(
+                f"Pending schema migrations {[version for version, _ in pending]}; run `flask migrate` to apply them"
+            )
+        logger.info(f"Cloud PC search backend: {init_cloud_pc_search_index()}")
+        logger.info(f"Search backend: {init_search_index()}")
         
         # Ensure admin user exists
         admin = db.session.query(User).filter_by(username='admin').first()
@@ -4710,6 +9741,7 @@ def init_db_command():
     try:
         logger.info(f"Initializing database at: {DATABASE_PATH}")
         db.create_all()
+        run_migrations()
         
         # Ensure admin user exists
         admin = db.session.query(User).filter_by(username='admin').first()
@@ -4734,25 +9766,55 @@ def init_db_command():
         raise
 
 
+@app.cli.command("migrate")
+def migrate_command():
+    """Apply pending schema migrations and list what has been applied."""
+    try:
+        applied = run_migrations()
+    except Exception as e:
+        logger.exception(f"Error applying migrations: {e}")
+        print(f"ERROR: Failed to apply migrations: {e}")
+        raise
+    for version, name, applied_at in db.session.query(
+        SchemaMigration.version, SchemaMigration.name, SchemaMigration.applied_at
+    ).order_by(SchemaMigration.version):
+        marker = "applied now" if version in applied else applied_at.isoformat()
+        print(f"✓ {version:>3} {name} ({marker})")
+
+
+@app.cli.command("reconcile-cloud-pcs")
+def reconcile_cloud_pcs_command():
+    """Repair drift between every Cloud PC's file catalog and its storage."""
+    for (pc_id,) in db.session.query(CloudPC.id).order_by(CloudPC.id).all():
+        try:
+            stats = reconcile_cloud_pc_catalog(pc_id)
+            print(f"✓ Cloud PC {pc_id}: {stats['added']} added, {stats['updated']} updated, {stats['removed']} removed")
+        except Exception as e:
+            db.session.rollback()
+            logger.exception(f"Error reconciling cloud PC {pc_id}: {e}")
+            print(f"ERROR: Failed to reconcile cloud PC {pc_id}: {e}")
+
+
+@app.cli.command("reconcile-storage")
+def reconcile_storage_command():
+    """Recompute the storage ledger from disk (run nightly from cron; see README.md)."""
+    try:
+        stats = reconcile_storage_ledger()
+        print(f"✓ Storage ledger reconciled for {stats['users']} users and {stats['cloud_pcs']} cloud PCs")
+    except Exception as e:
+        db.session.rollback()
+        logger.exception(f"Error reconciling storage ledger: {e}")
+        print(f"ERROR: Failed to reconcile storage ledger: {e}")
+        raise
+
+
 if __name__ == "__main__":
     with app.app_context():
         try:
             logger.info(f"Initializing database at: {DATABASE_PATH}")
             db.create_all()
             logger.info("Database tables created/verified")
-            
-            # Migration: Ensure open_apps column exists in cloud_pcs table
-            try:
-                from sqlalchemy import inspect, text
-                inspector = inspect(db.engine)
-                if 'cloud_pcs' in inspector.get_table_names():
-                    columns = [col['name'] for col in inspector.get_columns('cloud_pcs')]
-                    if 'open_apps' not in columns:
-                        db.session.execute(text('ALTER TABLE cloud_pcs ADD COLUMN open_apps TEXT'))
-                        db.session.commit()
-                        logger.info("Added open_apps column to cloud_pcs table")
-            except Exception as e:
-                logger.warning(f"Could not check/add open_apps column: {e}")
+            run_migrations()
             
             # Ensure admin user exists
             admin = db.session.query(User).filter_by(username='admin').first()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""Benchmark SQLite write throughput: the old engine settings vs. the tuned profile.
+
+Each writer process stands in for a gunicorn worker committing small transactions
+(one todo per commit) while reader processes keep listing todos. Both profiles run
+against fresh throwaway databases with the app's real schema.
+
+Usage:
+    python benchmark_sqlite.py [--writers 2] [--readers 2] [--transactions 300]
+"""
+
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+WORK_DIR = tempfile.mkdtemp(prefix="ff_sqlite_bench_")
+# Point the app at a scratch database and uploads folder before importing it
+os.environ["DATABASE_PATH"] = os.path.join(WORK_DIR, "app.db")
+os.environ["UPLOAD_ROOT"] = os.path.join(WORK_DIR, "uploads")
+os.environ.pop("DATABASE_URL", None)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import create_engine, event, insert, select  # noqa: E402
+from sqlalchemy.exc import OperationalError  # noqa: E402
+
+import app as ff  # noqa: E402
+
+# What app.py used for SQLite before the tuned profile
+BASELINE_ENGINE_OPTIONS = {"pool_size": 5, "max_overflow": 10, "pool_pre_ping": True, "pool_recycle": 3600}
+
+
+def make_engine(profile: str, path: str):
+    if profile == "baseline":
+        return create_engine(f"sqlite:///{path}", **BASELINE_ENGINE_OPTIONS)
+    engine = create_engine(f"sqlite:///{path}", **ff.SQLITE_ENGINE_OPTIONS)
+    event.listen(engine, "connect", ff.apply_sqlite_pragmas)
+    return engine
+
+
+def writer(profile: str, path: str, worker: int, transactions: int, start, results) -> None:
+    engine = make_engine(profile, path)
+    todos = ff.Todo.__table__
+    committed = locked = 0
+    start.wait()
+    began = time.perf_counter()
+    for number in range(transactions):
+        now = datetime.utcnow()
+        try:
+            with engine.begin() as conn:
+                conn.execute(insert(todos).values(
+                    owner_id=worker + 1, title=f"todo {worker}-{number}", is_completed=False,
+                    created_at=now, updated_at=now,
+                ))
+            committed += 1
+        except OperationalError as e:
+            if "locked" not in str(e):
+                raise
+            locked += 1
+    results.put(("writer", committed, locked, time.perf_counter() - began))
+    engine.dispose()
+
+
+def reader(profile: str, path: str, worker: int, start, stop, results) -> None:
+    engine = make_engine(profile, path)
+    todos = ff.Todo.__table__
+    reads = locked = 0
+    query = select(todos).where(todos.c.owner_id == worker % 2 + 1).order_by(todos.c.created_at.desc()).limit(50)
+    start.wait()
+    while not stop.is_set():
+        try:
+            with engine.connect() as conn:
+                conn.execute(query).fetchall()
+            reads += 1
+        except OperationalError as e:
+            if "locked" not in str(e):
+                raise
+            locked += 1
+    results.put(("reader", reads, locked, 0.0))
+    engine.dispose()
+
+
+def run_profile(profile: str, writers: int, readers: int, transactions: int) -> dict:
+    path = os.path.join(WORK_DIR, f"{profile}.db")
+    setup = make_engine(profile, path)
+    ff.db.metadata.create_all(setup)
+    setup.dispose()
+
+    context = multiprocessing.get_context("fork")
+    start, stop, results = context.Event(), context.Event(), context.Queue()
+    writer_processes = [
+        context.Process(target=writer, args=(profile, path, number, transactions, start, results))
+        for number in range(writers)
+    ]
+    reader_processes = [
+        context.Process(target=reader, args=(profile, path, number, start, stop, results))
+        for number in range(readers)
+    ]
+    for process in writer_processes + reader_processes:
+        process.start()
+
+    began = time.perf_counter()
+    start.set()
+    for process in writer_processes:
+        process.join()
+    elapsed = time.perf_counter() - began
+    stop.set()
+    for process in reader_processes:
+        process.join()
+
+    totals = {"commits": 0, "write_errors": 0, "reads": 0, "read_errors": 0}
+    for _ in range(writers + readers):
+        role, done, locked, _ = results.get()
+        if role == "writer":
+            totals["commits"] += done
+            totals["write_errors"] += locked
+        else:
+            totals["reads"] += done
+            totals["read_errors"] += locked
+    totals["seconds"] = elapsed
+    return totals
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--writers", type=int, default=2, help="concurrent writer processes (gunicorn workers)")
+    parser.add_argument("--readers", type=int, default=2, help="concurrent reader processes")
+    parser.add_argument("--transactions", type=int, default=300, help="commits per writer")
+    args = parser.parse_args()
+
+    print(f"{args.writers} writers x {args.transactions} commits, {args.readers} readers\n")
+    print(f"{'profile':<10} {'commits/s':>10} {'locked':>8} {'reads/s':>10} {'locked':>8} {'seconds':>8}")
+    try:
+        for profile in ("baseline", "tuned"):
+            stats = run_profile(profile, args.writers, args.readers, args.transactions)
+            print(
+                f"{profile:<10} {stats['commits'] / stats['seconds']:>10.0f} {stats['write_errors']:>8} "
+                f"{stats['reads'] / stats['seconds']:>10.0f} {stats['read_errors']:>8} {stats['seconds']:>8.2f}"
+            )
+    finally:
+        shutil.rmtree(WORK_DIR, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+"""Work that runs in child processes: painting rasterization and document text extraction.
+
+Worker processes are started with forkserver or spawn, so they import this module rather
+than app.py: it must stay free of Flask, the database and anything else with start-up cost.
+app.py imports the shared helpers (the paint encoding, document readers) from here.
+"""
+
+import io
+import json
+import os
+import struct
+import sys
+import zlib
+from array import array
+from itertools import accumulate
+from typing import List, Tuple
+
+
+# Compact paint encoding: CanvasDraw save data ({"lines": [{"points": [{"x", "y"}], "brushColor",
+# "brushRadius"}], "width", "height"}) becomes a colour table plus one int32 array holding, per
+# line, [colour index, radius, point count, x0, y0, dx1, dy1, ...] with coordinates quantized to
+# 1/PAINT_COORD_SCALE px. Small deltas leave most bytes zero, so zlib shrinks it a lot further.
+# Data that is not in that shape is kept as compressed JSON.
+PAINT_STROKES_MAGIC = b"FFP1"
+PAINT_JSON_MAGIC = b"FFJ1"
+PAINT_COORD_SCALE = 10
+
+
+def _pack_paint_lines(lines) -> Tuple[array, List[str]]:
+    values = array("i")
+    colors, color_index = [], {}
+    for line in lines:
+        if set(line) != {"points", "brushColor", "brushRadius"}:
+            raise ValueError("unexpected line fields")
+        color = line["brushColor"]
+        if not isinstance(color, str):
+            raise ValueError("brushColor must be a string")
+        if color not in color_index:
+            color_index[color] = len(colors)
+            colors.append(color)
+        points = line["points"]
+        values.extend((color_index[color], round(line["brushRadius"] * PAINT_COORD_SCALE), len(points)))
+        previous_x = previous_y = 0
+        for point in points:
+            x = round(point["x"] * PAINT_COORD_SCALE)
+            y = round(point["y"] * PAINT_COORD_SCALE)
+            values.append(x - previous_x)
+            values.append(y - previous_y)
+            previous_x, previous_y = x, y
+    return values, colors
+
+
+def _unpack_paint_lines(values: array, colors: List[str], line_count: int) -> List[dict]:
+    lines, position = [], 0
+    for _ in range(line_count):
+        color, radius, count = values[position:position + 3]
+        position += 3
+        xs = accumulate(values[position:position + 2 * count:2])
+        ys = accumulate(values[position + 1:position + 2 * count:2])
+        position += 2 * count
+        lines.append({
+            "points": [{"x": x / PAINT_COORD_SCALE, "y": y / PAINT_COORD_SCALE} for x, y in zip(xs, ys)],
+            "brushColor": colors[color],
+            "brushRadius": radius / PAINT_COORD_SCALE,
+        })
+    return lines
+
+
+def encode_paint_data(data) -> bytes:
+    """Encode paint save data into the compact binary form."""
+    try:
+        if not isinstance(data, dict) or not isinstance(data.get("lines"), list):
+            raise ValueError("not CanvasDraw save data")
+        values, colors = _pack_paint_lines(data["lines"])
+    except (ValueError, TypeError, KeyError, OverflowError):
+        return PAINT_JSON_MAGIC + zlib.compress(json.dumps(data, separators=(",", ":")).encode("utf-8"))
+
+    meta = {key: value for key, value in data.items() if key != "lines"}
+    meta["colors"] = colors
+    meta_bytes = json.dumps(meta, separators=(",", ":")).encode("utf-8")
+    if sys.byteorder == "big":
+        values.byteswap()
+    body = struct.pack("<II", len(meta_bytes), len(data["lines"])) + meta_bytes + values.tobytes()
+    return PAINT_STROKES_MAGIC + zlib.compress(body)
+
+
+def decode_paint_data(blob: bytes):
+    """Inverse of encode_paint_data (coordinates come back at the quantized precision)."""
+    magic, body = blob[:4], zlib.decompress(blob[4:])
+    if magic == PAINT_JSON_MAGIC:
+        return json.loads(body)
+    meta_length, line_count = struct.unpack_from("<II", body)
+    meta = json.loads(body[8:8 + meta_length])
+    values = array("i")
+    values.frombytes(body[8 + meta_length:])
+    if sys.byteorder == "big":
+        values.byteswap()
+    colors = meta.pop("colors")
+    return {"lines": _unpack_paint_lines(values, colors, line_count), **meta}
+
+
+def replay_paint_ops(data, ops: List[Tuple[str, bytes]]):
+    """Apply ``(kind, payload)`` op-log entries to decoded paint data, in order."""
+    for kind, payload in ops:
+        if kind == "strokes":
+            data["lines"].extend(decode_paint_data(payload)["lines"])
+        elif kind == "undo":
+            (count,) = struct.unpack("<I", payload)
+            del data["lines"][max(len(data["lines"]) - count, 0):]
+        elif kind == "clear":
+            data["lines"] = []
+    return data
+
+
+def render_paint_image(data, size: Tuple[int, int], image_format: str = "PNG") -> bytes:
+    """Rasterize paint data with Pillow, scaled to fit ``size`` on a white background."""
+    from PIL import Image, ImageColor, ImageDraw
+
+    lines = data.get("lines") if isinstance(data, dict) else data
+    lines = [line for line in (lines or []) if isinstance(line, dict) and line.get("points")]
+    source_width = (data.get("width") if isinstance(data, dict) else None) or 400
+    source_height = (data.get("height") if isinstance(data, dict) else None) or 400
+
+    # Draw at 2x and downsample for smooth edges
+    width, height = size
+    scale = min(width / source_width, height / source_height) * 2
+    image = Image.new("RGB", (width * 2, height * 2), "white")
+    draw = ImageDraw.Draw(image)
+    offset_x = (width * 2 - source_width * scale) / 2
+    offset_y = (height * 2 - source_height * scale) / 2
+    for line in lines:
+        try:
+            color = ImageColor.getrgb(line.get("brushColor") or "#000")[:3]
+        except ValueError:
+            color = (0, 0, 0)
+        radius = max(float(line.get("brushRadius") or 1) * scale, 0.5)
+        points = [(offset_x + point["x"] * scale, offset_y + point["y"] * scale) for point in line["points"]]
+        if len(points) > 1:
+            draw.line(points, fill=color, width=max(int(radius * 2), 1), joint="curve")
+        for x, y in (points[0], points[-1]):
+            draw.ellipse((x - radius, y - radius, x + radius, y + radius), fill=color)
+    image = image.resize((width, height), Image.LANCZOS)
+
+    output = io.BytesIO()
+    image.save(output, format=image_format, optimize=True)
+    return output.getvalue()
+
+
+def render_paint_process(snapshot: bytes, ops: List[Tuple[str, bytes]], size: Tuple[int, int], image_format: str, conn) -> None:
+    """Render-process entry point: sends ``("image", bytes)`` or ``("error", message)`` over ``conn``."""
+    try:
+        image_bytes = render_paint_image(replay_paint_ops(decode_paint_data(snapshot), ops), size, image_format)
+        conn.send(("image", image_bytes))
+    except Exception as exc:  # noqa: BLE001
+        conn.send(("error", f"{type(exc).__name__}: {exc}"))
+    finally:
+        conn.close()
+
+
+def iter_document_text(file_bytes: bytes, extension: str, on_total=None):
+    """Yield the text of a document piece by piece: one PDF page or a batch of DOCX paragraphs at a time.
+
+    ``on_total`` is called with the page count once it is known. Pieces may be empty
+    (e.g. scanned pages without a text layer).
+    """
+    extension = extension.lower()
+    if extension == ".pdf":
+        try:
+            from PyPDF2 import PdfReader
+        except ImportError as exc:  # pragma: no cover - dependency missing
+            raise RuntimeError("PDF support is not available on this server.") from exc
+
+        pdf_reader = PdfReader(io.BytesIO(file_bytes))
+        if on_total:
+            on_total(len(pdf_reader.pages))
+        for page in pdf_reader.pages:
+            yield page.extract_text() or ""
+        return
+    if extension == ".docx":
+        try:
+            from docx import Document
+        except ImportError as exc:  # pragma: no cover - dependency missing
+            raise RuntimeError("Word document support is not available on this server.") from exc
+
+        document = Document(io.BytesIO(file_bytes))
+        paragraphs = [para.text for para in document.paragraphs]
+        if on_total:
+            on_total((len(paragraphs) + 49) // 50)
+        for start in range(0, len(paragraphs), 50):
+            yield "\n".join(paragraphs[start:start + 50])
+        return
+
+    # Plain text-like formats
+    if on_total:
+        on_total(1)
+    try:
+        yield file_bytes.decode("utf-8", errors="ignore")
+    except UnicodeDecodeError:
+        yield file_bytes.decode("latin-1", errors="ignore")
+
+
+def document_import_process(path: str, extension: str, results, memory_limit_bytes: int) -> None:
+    """Worker-process entry point: extract a document page by page, sending each page over ``results``."""
+    try:
+        import resource
+        # The limit is on top of what the process already maps (the interpreter and this module)
+        with open("/proc/self/statm") as statm:
+            current = int(statm.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+        limit = current + memory_limit_bytes
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    except (ImportError, OSError, ValueError):
+        pass  # not enforceable on this platform; the timeouts still apply
+
+    try:
+        with open(path, "rb") as handle:
+            file_bytes = handle.read()
+        for piece in iter_document_text(file_bytes, extension, on_total=lambda total: results.put(("total", total))):
+            results.put(("page", piece))
+        results.put(("done", None))
+    except MemoryError:
+        results.put(("error", "This document needs more memory than imports are allowed to use."))
+    except RuntimeError as runtime_error:
+        results.put(("error", str(runtime_error)))
+    except Exception:  # noqa: BLE001
+        results.put(("error", "We couldn't read that document. Please make sure it's not password protected and try again."))
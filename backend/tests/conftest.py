@@ -0,0 +1,53 @@
+"""Shared fixtures: the app module bound to a throwaway SQLite database and uploads folder."""
+
+import os
+import shutil
+import sys
+import tempfile
+import uuid
+
+import pytest
+
+_DB_DIR = tempfile.mkdtemp(prefix="ff_tests_")
+# Must be set before app.py is imported: it picks its database and upload paths at import time
+os.environ["DATABASE_PATH"] = os.path.join(_DB_DIR, "test.db")
+os.environ["UPLOAD_ROOT"] = os.path.join(_DB_DIR, "uploads")
+os.environ.pop("DATABASE_URL", None)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as ff  # noqa: E402
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(_DB_DIR, ignore_errors=True)
+
+
+@pytest.fixture()
+def app_module():
+    return ff
+
+
+@pytest.fixture()
+def app_context():
+    with ff.app.app_context():
+        yield
+        ff.db.session.rollback()
+
+
+@pytest.fixture()
+def make_client():
+    """Return a factory for test clients logged in as a new user; each has a ``user_id``."""
+
+    def factory():
+        client = ff.app.test_client()
+        username = f"user_{uuid.uuid4().hex[:10]}"
+        response = client.post(
+            "/api/register",
+            json={"username": username, "email": f"{username}@example.com", "password": "pw"},
+        )
+        assert response.status_code == 200, response.get_json()
+        client.user_id = response.get_json()["user"]["id"]
+        client.username = username
+        return client
+
+    return factory
@@ -0,0 +1,148 @@
+"""AI apps: revision history, chat edits and published code assets."""
+
+import pytest
+
+
+def test_revision_number_race_retries(app_module, make_client, monkeypatch):
+    client = make_client()
+    db = app_module.db
+    with app_module.app.app_context():
+        ai_app = app_module.AIApp(developer_id=client.user_id, name="Race", code="<p>one</p>")
+        db.session.add(ai_app)
+        db.session.flush()
+        first = app_module.record_ai_app_revision(ai_app, "initial")
+        ai_app.code = "<p>two</p>"
+        app_module.record_ai_app_revision(ai_app, "edit")
+
+        # A concurrent save already took revision 2 when this one read the latest revision
+        build = app_module._build_ai_app_revision
+        stale = [first]
+
+        def build_from_stale(ai_app, code, code_hash, latest, source):
+            return build(ai_app, code, code_hash, stale.pop() if stale else latest, source)
+
+        monkeypatch.setattr(app_module, "_build_ai_app_revision", build_from_stale)
+        ai_app.code = "<p>three</p>"
+        revision = app_module.record_ai_app_revision(ai_app, "edit")
+        db.session.commit()
+
+        assert revision.revision == 3
+        numbers = [
+            number
+            for (number,) in db.session.query(app_module.AIAppRevision.revision)
+            .filter_by(app_id=ai_app.id)
+            .order_by(app_module.AIAppRevision.revision)
+        ]
+        assert numbers == [1, 2, 3]
+
+
+def test_full_mode_on_large_app_keeps_sections_outside_the_prompt(app_module, make_client, monkeypatch):
+    client = make_client()
+    filler = "".join(f"<p>filler paragraph number {n} with some padding text</p>\n" for n in range(40))
+    code = (
+        "<html>\n<body>\n"
+        '<button id="save">Save</button>\n'
+        f"{filler}"
+        '<script>\nfunction untouchedHelper() {\n  return "kept-outside-the-prompt";\n}\n</script>\n'
+        "</body>\n</html>\n"
+    )
+    with app_module.app.app_context():
+        ai_app = app_module.AIApp(developer_id=client.user_id, name="Big", code=code)
+        app_module.db.session.add(ai_app)
+        app_module.db.session.commit()
+        app_id = ai_app.id
+    monkeypatch.setattr(app_module, "AI_APP_CONTEXT_TOKEN_BUDGET", 200)  # only a few sections fit
+
+    prompts = []
+
+    def fake_openai(messages, system_prompt=None):
+        prompts.append(system_prompt)
+        return (
+            "Renamed the button.\n<<<<<<< SEARCH\n"
+            '<button id="save">Save</button>\n=======\n<button id="save">Store</button>\n>>>>>>> REPLACE'
+        )
+
+    monkeypatch.setattr(app_module, "call_openai", fake_openai)
+    response = client.post(f"/api/ai-apps/{app_id}/chat", json={"message": "rename the save button", "mode": "full"})
+    body = response.get_json()
+    assert response.status_code == 200, body
+
+    assert "kept-outside-the-prompt" not in prompts[0]  # left out of the prompt...
+    assert body["mode"] == "patch" and body["code_updated"]
+    assert '<button id="save">Store</button>' in body["code"]
+    assert 'return "kept-outside-the-prompt";' in body["code"]  # ...but still in the app
+
+
+def test_listing_reads_assets_and_the_migration_publishes_missing_ones(app_module, make_client, monkeypatch):
+    client = make_client()
+    db = app_module.db
+    with app_module.app.app_context():
+        # Saved before code assets existed
+        apps = [app_module.AIApp(developer_id=client.user_id, name=f"Old {n}", code=f"<p>{n}</p>") for n in range(3)]
+        empty = app_module.AIApp(developer_id=client.user_id, name="Empty", code="")
+        db.session.add_all([*apps, empty])
+        db.session.commit()
+        app_ids, empty_id = [ai_app.id for ai_app in apps], empty.id
+
+    monkeypatch.setattr(app_module, "publish_ai_app_asset", lambda ai_app: pytest.fail("listing published an asset"))
+    listed = {app_dict["id"]: app_dict for app_dict in client.get("/api/ai-apps").get_json()["my_apps"]}
+    assert all(listed[app_id]["code_url"] is None for app_id in app_ids)
+    monkeypatch.undo()
+
+    with app_module.app.app_context():
+        assert app_module.publish_missing_ai_app_assets(batch_size=2) >= 3
+        assert app_module.publish_missing_ai_app_assets() == 0  # the empty app is not retried
+        assert db.session.get(app_module.AIAppAsset, empty_id) is None
+
+    listed = {app_dict["id"]: app_dict for app_dict in client.get("/api/ai-apps").get_json()["my_apps"]}
+    code = client.get(listed[app_ids[0]]["code_url"])
+    assert code.status_code == 200 and code.get_data(as_text=True) == "<p>0</p>"
+
+
+def test_patches_are_parsed_from_blocks_and_diff_hunks(app_module):
+    reply = (
+        "Done.\n<<<<<<< SEARCH\n<h1>Hi</h1>\n=======\n<h1>Hello</h1>\n>>>>>>> REPLACE\n"
+        "```diff\n--- a/index.html\n+++ b/index.html\n@@ -1,2 +1,2 @@\n <body>\n-<p>old</p>\n+<p>new</p>\n```"
+    )
+    assert app_module.parse_ai_app_patches(reply) == [
+        ("<h1>Hi</h1>", "<h1>Hello</h1>"),
+        ("<body>\n<p>old</p>", "<body>\n<p>new</p>"),
+    ]
+
+
+def test_patch_application_falls_back_to_whitespace_insensitive_lines(app_module):
+    code = "<div>\n    <p>one</p>\n    <p>two</p>\n</div>\n"
+    assert app_module.apply_ai_app_patches(code, [("<p>one</p>", "<p>uno</p>")]) == code.replace("one", "uno")
+
+    # Indentation differs from the code: matched line by line, the replacement keeps its own text
+    patched = app_module.apply_ai_app_patches(code, [("\t<p>two</p>\n</div>", "  <p>dos</p>\n</div>")])
+    assert patched == "<div>\n    <p>one</p>\n  <p>dos</p>\n</div>\n"
+
+
+@pytest.mark.parametrize("patches, message", [
+    ([("<p>x</p>", "<p>y</p>")], "matches 2 places"),
+    ([("<p>missing</p>", "")], "does not match"),
+    ([("   ", "<p>y</p>")], "empty SEARCH"),
+    ([("<h1>t</h1>", "<h1>T</h1>"), ("<p>missing</p>", "")], "Patch 2 does not match"),
+])
+def test_patch_conflicts_are_all_or_nothing(app_module, patches, message):
+    code = "<h1>t</h1>\n<p>x</p>\n<p>x</p>\n"
+    with pytest.raises(app_module.PatchConflict, match=message):
+        app_module.apply_ai_app_patches(code, patches)
+
+
+def test_chat_reply_that_does_not_apply_leaves_the_code_alone(app_module, make_client, monkeypatch):
+    client = make_client()
+    with app_module.app.app_context():
+        ai_app = app_module.AIApp(developer_id=client.user_id, name="Small", code="<p>keep me</p>\n")
+        app_module.db.session.add(ai_app)
+        app_module.db.session.commit()
+        app_id = ai_app.id
+
+    reply = "Changed it.\n<<<<<<< SEARCH\n<p>not there</p>\n=======\n<p>new</p>\n>>>>>>> REPLACE"
+    monkeypatch.setattr(app_module, "call_openai", lambda messages, system_prompt=None: reply)
+    body = client.post(f"/api/ai-apps/{app_id}/chat", json={"message": "edit", "mode": "patch"}).get_json()
+    assert body["mode"] == "patch" and not body["code_updated"]
+    assert "does not match" in body["patch_error"]
+    with app_module.app.app_context():
+        assert app_module.db.session.get(app_module.AIApp, app_id).code == "<p>keep me</p>\n"
@@ -0,0 +1,89 @@
+"""AI chat memory: recent turns verbatim, older ones folded into a rolling summary in batches."""
+
+import pytest
+
+
+@pytest.fixture()
+def new_chat(app_module, app_context, make_client, monkeypatch):
+    monkeypatch.setattr(app_module, "get_openai_client", lambda: None)  # extractive summaries
+    owner_id = make_client().user_id
+
+    def factory(*contents):
+        chat = app_module.AIChat(owner_id=owner_id, title="Memory")
+        app_module.db.session.add(chat)
+        app_module.db.session.flush()
+        _say(app_module, chat, *contents)
+        return chat
+
+    return factory
+
+
+def _say(app_module, chat, *contents):
+    """Add messages alternating user/assistant, starting with the user."""
+    for content in contents:
+        role = "user" if len(chat.messages) % 2 == 0 else "assistant"
+        chat.messages.append(app_module.AIMessage(role=role, content=content))
+    app_module.db.session.flush()
+
+
+def test_short_chat_is_sent_verbatim(app_module, new_chat):
+    chat = new_chat("hi", "hello")
+    summary, recent = app_module.build_ai_chat_memory(chat)
+    assert summary == ""
+    assert recent == [{"role": "user", "content": "hi"}, {"role": "assistant", "content": "hello"}]
+    assert chat.memory.summarized_through_id == 0
+
+
+def test_older_turns_fold_into_the_summary_a_batch_at_a_time(app_module, new_chat, monkeypatch):
+    monkeypatch.setattr(app_module, "AI_CHAT_RECENT_TURNS", 2)  # four messages kept verbatim
+    chat = new_chat(*(f"message {n}" for n in range(5)))
+
+    # One message past the recent window is not worth a summary call yet
+    summary, recent = app_module.build_ai_chat_memory(chat)
+    assert summary == "" and len(recent) == 5
+
+    _say(app_module, chat, "message 5", "message 6", "message 7")
+    summary, recent = app_module.build_ai_chat_memory(chat)
+    assert [m["content"] for m in recent] == ["message 4", "message 5", "message 6", "message 7"]
+    assert summary.splitlines() == [f"- {speaker}: message {n}" for n, speaker in enumerate(["User", "Assistant"] * 2)]
+    assert chat.memory.summarized_through_id == chat.messages[3].id
+    assert chat.memory.summarized_messages == 4
+
+    # Already folded turns are not summarized again
+    monkeypatch.setattr(app_module, "summarize_ai_chat_turns", lambda summary, messages: pytest.fail("re-folded"))
+    assert app_module.build_ai_chat_memory(chat) == (summary, recent)
+
+
+def test_token_budget_folds_long_messages_within_the_turn_limit(app_module, new_chat, monkeypatch):
+    monkeypatch.setattr(app_module, "AI_CHAT_MEMORY_TOKEN_BUDGET", 100)
+    chat = new_chat(*(str(n) * 200 for n in range(4)))  # 50 tokens each
+
+    summary, recent = app_module.build_ai_chat_memory(chat)
+    assert [m["content"][0] for m in recent] == ["2", "3"]
+    assert chat.memory.summarized_messages == 2
+    assert summary.startswith("- User: 000")
+
+
+def test_long_backlog_is_summarized_in_budget_sized_batches(app_module, new_chat, monkeypatch):
+    monkeypatch.setattr(app_module, "AI_CHAT_RECENT_TURNS", 1)
+    monkeypatch.setattr(app_module, "AI_CHAT_MEMORY_TOKEN_BUDGET", 100)
+    chat = new_chat(*("x" * 160 for _ in range(8)))  # 40 tokens each
+
+    batches = []
+
+    def record(summary, messages):
+        batches.append(len(messages))
+        return f"{summary}+{len(messages)}"
+
+    monkeypatch.setattr(app_module, "summarize_ai_chat_turns", record)
+    summary, recent = app_module.build_ai_chat_memory(chat)
+    assert batches == [3, 3]
+    assert summary == "+3+3"
+    assert len(recent) == 2
+
+
+def test_fallback_summary_keeps_the_newest_lines_that_fit(app_module, new_chat):
+    chat = new_chat("first " * 100, "second")
+    summary = app_module._fallback_chat_summary("- User: earlier", chat.messages, budget_chars=60)
+    assert summary == "- Assistant: second"
+    assert len(app_module._fallback_chat_summary("", chat.messages, budget_chars=1000).splitlines()[0]) == len("- User: ") + 200
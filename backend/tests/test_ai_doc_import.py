@@ -0,0 +1,76 @@
+"""Document imports run in a killable worker process and keep whatever was read before a failure."""
+
+import time
+
+import pytest
+
+
+# Worker stand-ins: they run in the import's worker process, so they are module-level functions
+def _one_page_then_stuck(path, extension, results, memory_limit_bytes):
+    results.put(("total", 2))
+    results.put(("page", "first page text"))
+    time.sleep(60)
+
+
+def _stuck(path, extension, results, memory_limit_bytes):
+    time.sleep(60)
+
+
+def _unreadable(path, extension, results, memory_limit_bytes):
+    results.put(("error", "We couldn't read that document."))
+
+
+@pytest.fixture()
+def run_import(app_module, app_context, make_client, tmp_path):
+    owner_id = make_client().user_id
+    db = app_module.db
+
+    def run(text):
+        path = tmp_path / "upload.txt"
+        path.write_text(text)
+        doc = app_module.AIDoc(owner_id=owner_id, title="Imported", content="")
+        db.session.add(doc)
+        db.session.flush()
+        app_module.ensure_ai_doc_chunked(doc)
+        job = app_module.AIDocImport(owner_id=owner_id, doc_id=doc.id, filename="upload.txt", status="queued")
+        db.session.add(job)
+        db.session.commit()
+        doc_id = doc.id
+
+        app_module._drive_ai_doc_import(job, doc, str(path), ".txt")
+        return job, db.session.get(app_module.AIDoc, doc_id)
+
+    return run
+
+
+def test_import_stores_the_document_text(app_module, run_import):
+    job, doc = run_import("hello from a text file")
+    assert (job.status, job.error) == ("done", None)
+    assert app_module.get_ai_doc_text(doc) == "hello from a text file"
+
+
+def test_stalled_page_keeps_the_pages_already_read(app_module, run_import, monkeypatch):
+    monkeypatch.setattr(app_module, "document_import_process", _one_page_then_stuck)
+    monkeypatch.setattr(app_module, "AI_DOC_IMPORT_PAGE_TIMEOUT_SECONDS", 1)
+    job, doc = run_import("ignored")
+    assert job.status == "partial"
+    assert job.error.startswith("A page took too long to read.")
+    assert (job.pages_done, job.pages_total) == (1, 2)
+    assert app_module.get_ai_doc_text(doc) == "first page text"
+
+
+def test_import_timeout_with_nothing_read_fails(app_module, run_import, monkeypatch):
+    monkeypatch.setattr(app_module, "document_import_process", _stuck)
+    monkeypatch.setattr(app_module, "AI_DOC_IMPORT_TIMEOUT_SECONDS", 1)
+    started = time.monotonic()
+    job, doc = run_import("ignored")
+    assert time.monotonic() - started < 10  # the stuck worker was killed, not waited for
+    assert (job.status, job.error) == ("failed", "The import timed out.")
+    assert job.doc_id is None and doc is None
+
+
+def test_unreadable_document_fails_and_drops_the_empty_doc(app_module, run_import, monkeypatch):
+    monkeypatch.setattr(app_module, "document_import_process", _unreadable)
+    job, doc = run_import("ignored")
+    assert (job.status, job.error) == ("failed", "We couldn't read that document.")
+    assert job.doc_id is None and doc is None
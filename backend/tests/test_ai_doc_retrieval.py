@@ -0,0 +1,82 @@
+"""AI doc retrieval: BM25 over a user's chunks, cached until those chunks change."""
+
+from collections import OrderedDict
+
+import pytest
+
+
+@pytest.fixture()
+def new_doc(app_module, app_context, make_client, monkeypatch):
+    monkeypatch.setattr(app_module, "AI_DOC_CHUNK_CHARS", 20)  # one paragraph per chunk
+    monkeypatch.setattr(app_module, "_ai_doc_index_cache", OrderedDict())
+    default_owner = make_client().user_id
+
+    def factory(title, paragraphs, owner_id=None):
+        doc = app_module.AIDoc(owner_id=owner_id or default_owner, title=title, content="")
+        app_module.db.session.add(doc)
+        app_module.db.session.flush()
+        app_module.set_ai_doc_text(doc, "\n\n".join(paragraphs))
+        app_module.db.session.flush()
+        return doc
+
+    factory.owner_id = default_owner
+    return factory
+
+
+def _texts(app_module, owner_id, query, top_k=None):
+    return [passage["text"] for passage in app_module.search_ai_docs(owner_id, query, top_k)]
+
+
+def test_rare_terms_outrank_common_ones(app_module, new_doc):
+    new_doc("Garden", [
+        "the garden gets water every morning",
+        "water the tomatoes and the garden beds",
+        "the compost heap needs turning",
+    ])
+    new_doc("Kitchen", ["tomatoes are ripe in august", "water boils faster with a lid"])
+
+    # "compost" appears in one chunk, "water" in three; stopwords and plurals do not matter
+    assert _texts(app_module, new_doc.owner_id, "what about the composts and water?", top_k=1) == [
+        "the compost heap needs turning"
+    ]
+    passages = app_module.search_ai_docs(new_doc.owner_id, "ripe tomatoes")
+    assert [(p["title"], p["text"]) for p in passages] == [
+        ("Kitchen", "tomatoes are ripe in august"),
+        ("Garden", "water the tomatoes and the garden beds"),
+    ]
+    assert passages[0]["score"] > passages[1]["score"]
+    assert app_module.search_ai_docs(new_doc.owner_id, "the and of") == []
+
+
+def test_search_only_sees_the_owners_docs(app_module, new_doc, make_client):
+    other_owner = make_client().user_id
+    new_doc("Mine", ["private notes about sailing"])
+    new_doc("Theirs", ["their notes about sailing"], owner_id=other_owner)
+
+    assert _texts(app_module, new_doc.owner_id, "sailing") == ["private notes about sailing"]
+    assert _texts(app_module, other_owner, "sailing") == ["their notes about sailing"]
+
+
+def test_index_is_reused_until_the_chunks_change(app_module, new_doc):
+    doc = new_doc("Notes", ["alpha is the first letter", "beta is the second letter"])
+    owner_id = new_doc.owner_id
+    index = app_module.get_ai_doc_retrieval_index(owner_id)
+    assert app_module.get_ai_doc_retrieval_index(owner_id) is index
+
+    # Rewritten in place: same chunk count and ids, newer updated_at
+    chunk_ids = [row.id for row in app_module.ai_doc_chunk_rows(doc.id)]
+    app_module.set_ai_doc_text(doc, "alpha is the first letter\n\ngamma is the third letter")
+    app_module.db.session.flush()
+    assert [row.id for row in app_module.ai_doc_chunk_rows(doc.id)] == chunk_ids
+    rebuilt = app_module.get_ai_doc_retrieval_index(owner_id)
+    assert rebuilt is not index
+    assert _texts(app_module, owner_id, "gamma") == ["gamma is the third letter"]
+    assert _texts(app_module, owner_id, "beta") == []
+
+    new_doc("More", ["delta is the fourth letter"])
+    assert _texts(app_module, owner_id, "delta") == ["delta is the fourth letter"]
+
+    app_module.db.session.delete(doc)
+    app_module.db.session.flush()
+    assert _texts(app_module, owner_id, "alpha") == []
+    assert _texts(app_module, owner_id, "delta") == ["delta is the fourth letter"]
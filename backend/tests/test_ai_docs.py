@@ -0,0 +1,119 @@
+"""Chunked AI doc storage: ranged chunk replacement keeps order and touches only what changed."""
+
+import pytest
+
+
+@pytest.fixture()
+def new_doc(app_module, app_context, make_client, monkeypatch):
+    monkeypatch.setattr(app_module, "AI_DOC_CHUNK_CHARS", 10)  # one paragraph per chunk
+    owner_id = make_client().user_id
+
+    def factory(paragraphs):
+        doc = app_module.AIDoc(owner_id=owner_id, title="Chunks", content="")
+        app_module.db.session.add(doc)
+        app_module.db.session.flush()
+        app_module.set_ai_doc_text(doc, "".join(paragraphs))
+        app_module.db.session.flush()
+        return doc
+
+    return factory
+
+
+def _paragraphs(*names):
+    return [f"paragraph {name}\n\n" for name in names]
+
+
+def _rows(app_module, doc):
+    return app_module.ai_doc_chunk_rows(doc.id)
+
+
+def test_replace_rewrites_only_the_changed_chunk(app_module, new_doc):
+    doc = new_doc(_paragraphs("one", "two", "three"))
+    before = [(row.id, row.position, row.body) for row in _rows(app_module, doc)]
+    assert len(before) == 3
+
+    app_module.set_ai_doc_text(doc, "".join(_paragraphs("one", "TWO", "three")))
+    app_module.db.session.flush()
+
+    after = [(row.id, row.position, row.body) for row in _rows(app_module, doc)]
+    assert [row[:2] for row in after] == [row[:2] for row in before]
+    assert after[0] == before[0] and after[2] == before[2]
+    assert after[1][2] == "paragraph TWO\n\n"
+    assert doc.info.chunk_count == 3
+
+
+def test_insert_uses_the_gap_between_neighbours(app_module, new_doc):
+    doc = new_doc(_paragraphs("one", "four"))
+    first, last = _rows(app_module, doc)
+    first_position, last_position = first.position, last.position
+
+    text = "".join(_paragraphs("one", "two", "three", "four"))
+    app_module.set_ai_doc_text(doc, text)
+    app_module.db.session.flush()
+
+    rows = _rows(app_module, doc)
+    assert [row.id for row in (rows[0], rows[-1])] == [first.id, last.id]
+    assert (rows[0].position, rows[-1].position) == (first_position, last_position)
+    assert first_position < rows[1].position < rows[2].position < last_position
+    assert app_module.get_ai_doc_text(doc) == text
+    assert doc.info.chunk_count == 4
+
+
+def test_insert_without_room_respaces_the_document(app_module, new_doc):
+    doc = new_doc(_paragraphs("one", "three"))
+    first, last = _rows(app_module, doc)
+    first.position, last.position = 5, 6  # adjacent: nothing fits between them
+    app_module.db.session.flush()
+
+    text = "".join(_paragraphs("one", "two", "three"))
+    app_module.set_ai_doc_text(doc, text)
+    app_module.db.session.flush()
+
+    rows = _rows(app_module, doc)
+    gap = app_module.AI_DOC_CHUNK_POSITION_GAP
+    assert [row.position for row in rows] == [gap, 2 * gap, 3 * gap]
+    assert [row.body for row in rows] == _paragraphs("one", "two", "three")
+    assert app_module.get_ai_doc_text(doc) == text
+
+
+def test_delete_and_append_keep_size_and_order(app_module, new_doc):
+    doc = new_doc(_paragraphs("one", "two", "three"))
+
+    app_module.set_ai_doc_text(doc, "".join(_paragraphs("one", "three")))
+    app_module.append_ai_doc_text(doc, "tail")
+    app_module.db.session.flush()
+
+    text = "".join(_paragraphs("one", "three")) + "\ntail"
+    assert app_module.get_ai_doc_text(doc) == text
+    assert doc.info.size == len(text)
+    assert doc.info.chunk_count == len(_rows(app_module, doc))
+
+
+def test_legacy_docs_are_read_as_is_and_chunked_by_the_migration(app_module, make_client):
+    client = make_client()
+    text = "legacy text kept in the content column\n\nsecond paragraph"
+    with app_module.app.app_context():
+        docs = [app_module.AIDoc(owner_id=client.user_id, title=f"Old {n}", content=text) for n in range(3)]
+        app_module.db.session.add_all(docs)
+        app_module.db.session.commit()
+        doc_ids = [doc.id for doc in docs]
+
+    assert len(client.get("/api/ai/docs").get_json()["docs"]) == 3
+    opened = client.get(f"/api/ai/docs/{doc_ids[0]}").get_json()
+    assert opened["content"] == text and opened["chunks"] == []
+    chunks = client.get(f"/api/ai/docs/{doc_ids[0]}/chunks").get_json()
+    assert chunks["total"] == 1 and chunks["chunks"][0]["text"] == text
+
+    with app_module.app.app_context():
+        AIDocInfo = app_module.AIDocInfo
+        assert app_module.db.session.query(AIDocInfo).filter(AIDocInfo.doc_id.in_(doc_ids)).count() == 0  # reads never convert
+
+        assert app_module.chunk_legacy_ai_docs(batch_size=2) >= 3
+        assert app_module.chunk_legacy_ai_docs() == 0
+        for doc_id in doc_ids:
+            doc = app_module.db.session.get(app_module.AIDoc, doc_id)
+            assert doc.info is not None and doc.content == ""
+            assert app_module.get_ai_doc_text(doc) == text
+
+    opened = client.get(f"/api/ai/docs/{doc_ids[0]}").get_json()
+    assert opened["content"] == text and opened["chunks"]
@@ -0,0 +1,82 @@
+"""ZIP imports into a Cloud PC are validated up front and charged once per file written."""
+
+import io
+import os
+import zipfile
+
+import pytest
+
+
+@pytest.fixture()
+def pc(make_client):
+    client = make_client()
+    response = client.post("/api/cloud-pcs", json={"name": "archive pc"})
+    assert response.status_code in (200, 201), response.get_json()
+    client.pc_id = response.get_json()["cloud_pc"]["id"]
+    client.files = f"/api/cloud-pcs/{client.pc_id}/files"
+    return client
+
+
+def _zip(*entries):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name, data in entries:
+            archive.writestr(name, data)
+    buffer.seek(0)
+    return buffer
+
+
+def _import(client, archive, path="/"):
+    return client.post(
+        f"{client.files}/import",
+        data={"path": path, "file": (archive, "upload.zip")},
+        content_type="multipart/form-data",
+    )
+
+
+def _bytes_used(client):
+    response = client.get("/api/storage/usage")
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()["bytes_used"]
+
+
+def test_repeated_member_is_written_and_charged_once(pc, app_module):
+    before = _bytes_used(pc)
+    with pytest.warns(UserWarning, match="Duplicate name"):
+        archive = _zip(("notes.txt", b"first version"), ("notes.txt", b"last"))
+    response = _import(pc, archive)
+    assert response.status_code == 200, response.get_json()
+    assert response.get_json()["files"] == 1
+
+    with open(app_module.resolve_cloud_pc_path(pc.pc_id, "/notes.txt"), "rb") as f:
+        assert f.read() == b"last"
+    assert _bytes_used(pc) - before == len(b"last")
+
+
+@pytest.mark.parametrize(
+    "entries",
+    [
+        [("a", b"file"), ("a/b", b"nested")],
+        [("x/", b""), ("x", b"file")],
+    ],
+    ids=["file-then-child", "folder-then-file"],
+)
+def test_file_and_folder_with_same_path_is_rejected(pc, app_module, entries):
+    before = _bytes_used(pc)
+    response = _import(pc, _zip(*entries))
+    assert response.status_code == 400, response.get_json()
+    assert "both a file and a folder" in response.get_json()["error"]
+
+    assert _bytes_used(pc) == before
+    assert not os.path.exists(app_module.resolve_cloud_pc_path(pc.pc_id, "/a"))
+    assert not os.path.exists(app_module.resolve_cloud_pc_path(pc.pc_id, "/x"))
+
+
+def test_entry_below_an_existing_file_is_rejected(pc, app_module):
+    assert _import(pc, _zip(("report", b"plain file"))).status_code == 200
+    before = _bytes_used(pc)
+
+    response = _import(pc, _zip(("report/page.txt", b"child")))
+    assert response.status_code == 400, response.get_json()
+    assert _bytes_used(pc) == before
+    assert os.path.isfile(app_module.resolve_cloud_pc_path(pc.pc_id, "/report"))
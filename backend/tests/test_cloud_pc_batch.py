@@ -0,0 +1,56 @@
+"""Batch file operations: each runs in its own savepoint, so a failure undoes only its own accounting."""
+
+import os
+
+import pytest
+
+
+@pytest.fixture()
+def pc(make_client):
+    client = make_client()
+    response = client.post("/api/cloud-pcs", json={"name": "batch pc"})
+    assert response.status_code in (200, 201), response.get_json()
+    client.pc_id = response.get_json()["cloud_pc"]["id"]
+    client.files = f"/api/cloud-pcs/{client.pc_id}/files"
+    return client
+
+
+def _batch(client, operations, **options):
+    response = client.post(f"{client.files}/batch", json={"operations": operations, **options})
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()
+
+
+def _usage(client):
+    usage = client.get("/api/storage/usage").get_json()
+    pc_bytes = next(row["bytes_used"] for row in usage["cloud_pcs"] if row["id"] == client.pc_id)
+    return usage["bytes_used"], pc_bytes
+
+
+def test_failed_operation_rolls_back_only_its_own_charges(app_module, pc, monkeypatch):
+    # The PC ledger is charged before the user quota refuses the second write
+    monkeypatch.setattr(app_module, "USER_STORAGE_QUOTA_BYTES", 150)
+    body = _batch(pc, [
+        {"op": "write", "path": "/one.txt", "content": "a" * 100},
+        {"op": "write", "path": "/two.txt", "content": "b" * 100},
+        {"op": "write", "path": "/three.txt", "content": "c" * 20},
+    ])
+    assert [result["ok"] for result in body["results"]] == [True, False, True]
+    assert (body["succeeded"], body["failed"]) == (2, 1)
+
+    assert _usage(pc) == (120, 120)
+    assert not os.path.exists(app_module.resolve_cloud_pc_path(pc.pc_id, "/two.txt"))
+    names = [entry["name"] for entry in pc.get(pc.files).get_json()["files"]]
+    assert names == ["one.txt", "three.txt"]
+
+
+def test_stop_on_error_skips_the_rest(app_module, pc):
+    body = _batch(pc, [
+        {"op": "write", "path": "/keep.txt", "content": "keep"},
+        {"op": "delete", "path": "/missing.txt"},
+        {"op": "write", "path": "/skipped.txt", "content": "never written"},
+    ], stop_on_error=True)
+    assert [result["ok"] for result in body["results"]] == [True, False, False]
+    assert body["results"][2]["error"] == "Skipped after an earlier failure"
+    assert not os.path.exists(app_module.resolve_cloud_pc_path(pc.pc_id, "/skipped.txt"))
+    assert _usage(pc) == (4, 4)
@@ -0,0 +1,68 @@
+"""Cloud PC listings come from the file catalog; reconcile-cloud-pcs repairs drift from disk."""
+
+import os
+
+import pytest
+
+
+@pytest.fixture()
+def pc(make_client):
+    client = make_client()
+    response = client.post("/api/cloud-pcs", json={"name": "catalog pc"})
+    assert response.status_code in (200, 201), response.get_json()
+    client.pc_id = response.get_json()["cloud_pc"]["id"]
+    client.files = f"/api/cloud-pcs/{client.pc_id}/files"
+    return client
+
+
+def _listing(client, path="/", **params):
+    response = client.get(client.files, query_string={"path": path, **params})
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()
+
+
+def _names(client, path="/", **params):
+    return [entry["name"] for entry in _listing(client, path, **params)["files"]]
+
+
+def test_listing_is_served_from_the_catalog(app_module, pc, monkeypatch):
+    response = pc.post(f"{pc.files}/batch", json={"operations": [
+        {"op": "write", "path": "/b.txt", "content": "bb"},
+        {"op": "write", "path": "/a.txt", "content": "a"},
+        {"op": "mkdir", "path": "/docs"},
+    ]})
+    assert response.status_code == 200, response.get_json()
+
+    def no_disk_walk(*args, **kwargs):
+        pytest.fail("listing touched the storage directory")
+
+    monkeypatch.setattr(app_module.os, "listdir", no_disk_walk)
+    monkeypatch.setattr(app_module.os, "scandir", no_disk_walk)
+    assert _names(pc) == ["docs", "a.txt", "b.txt"]  # folders first, then by name
+    assert _names(pc, sort="size", order="desc") == ["docs", "b.txt", "a.txt"]
+
+    page = _listing(pc, per_page=1, page=2)
+    assert [entry["name"] for entry in page["files"]] == ["a.txt"]
+    assert page["pagination"]["total"] == 3
+
+
+def test_reconcile_command_repairs_drift(app_module, pc):
+    response = pc.post(f"{pc.files}/batch", json={"operations": [
+        {"op": "write", "path": "/kept.txt", "content": "kept"},
+        {"op": "write", "path": "/gone.txt", "content": "gone"},
+    ]})
+    assert response.status_code == 200, response.get_json()
+
+    # Changes made behind the app's back are not seen until a reconcile
+    os.remove(app_module.resolve_cloud_pc_path(pc.pc_id, "/gone.txt"))
+    with open(app_module.resolve_cloud_pc_path(pc.pc_id, "/new.txt"), "w") as f:
+        f.write("new")
+    assert _names(pc) == ["gone.txt", "kept.txt"]
+
+    result = app_module.app.test_cli_runner().invoke(args=["reconcile-cloud-pcs"])
+    assert result.exit_code == 0, result.output
+    assert f"Cloud PC {pc.pc_id}: 1 added, 0 updated, 1 removed" in result.output
+
+    listing = {entry["name"]: entry for entry in _listing(pc)["files"]}
+    assert sorted(listing) == ["kept.txt", "new.txt"]
+    assert listing["new.txt"]["size"] == 3 and listing["new.txt"]["content_hash"]
@@ -0,0 +1,73 @@
+"""Cloud PC change feed: gapless per-PC versions and a `since` cursor that resumes where it stopped."""
+
+import pytest
+
+
+@pytest.fixture()
+def pc(make_client):
+    client = make_client()
+    response = client.post("/api/cloud-pcs", json={"name": "feed pc"})
+    assert response.status_code in (200, 201), response.get_json()
+    client.pc_id = response.get_json()["cloud_pc"]["id"]
+    client.files = f"/api/cloud-pcs/{client.pc_id}/files"
+    return client
+
+
+def _batch(client, *operations):
+    response = client.post(f"{client.files}/batch", json={"operations": list(operations)})
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()
+
+
+def _changes(client, since, **params):
+    response = client.get(f"/api/cloud-pcs/{client.pc_id}/changes", query_string={"since": since, **params})
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()
+
+
+def test_cursor_pages_through_events_in_order(pc):
+    start = pc.get(pc.files).get_json()["version"]
+    _batch(
+        pc,
+        {"op": "write", "path": "/a.txt", "content": "a"},
+        {"op": "move", "from": "/a.txt", "to": "/b.txt"},
+        {"op": "write", "path": "/c.txt", "content": "c"},
+    )
+
+    first = _changes(pc, start, limit=2)
+    assert [(change["event"], change["path"]) for change in first["changes"]] == [("created", "/a.txt"), ("renamed", "/b.txt")]
+    assert first["changes"][1]["old_path"] == "/a.txt"
+    assert first["changes"][1]["entry"]["path"] == "/b.txt"  # current catalog row attached
+    assert first["has_more"] and first["version"] == start + 2
+
+    rest = _changes(pc, first["version"])
+    assert [(change["event"], change["path"]) for change in rest["changes"]] == [("created", "/c.txt")]
+    assert not rest["has_more"] and rest["version"] == rest["current_version"] == start + 3
+
+    assert _changes(pc, rest["version"])["changes"] == []
+
+
+def test_failed_operation_does_not_use_up_a_version(pc):
+    start = pc.get(pc.files).get_json()["version"]
+    body = _batch(
+        pc,
+        {"op": "write", "path": "/one.txt", "content": "1"},
+        {"op": "delete", "path": "/missing.txt"},
+        {"op": "write", "path": "/two.txt", "content": "2"},
+    )
+    assert [result["ok"] for result in body["results"]] == [True, False, True]
+
+    feed = _changes(pc, start)
+    assert [change["version"] for change in feed["changes"]] == [start + 1, start + 2]
+    assert feed["current_version"] == start + 2
+
+
+def test_cursor_outside_the_retained_window_resets(app_module, pc, monkeypatch):
+    monkeypatch.setattr(app_module, "CLOUD_PC_CHANGE_RETENTION", 2)
+    start = pc.get(pc.files).get_json()["version"]
+    _batch(pc, *({"op": "write", "path": f"/{n}.txt", "content": str(n)} for n in range(3)))
+
+    assert _changes(pc, start)["reset"]  # three events behind, only two are kept
+    assert not _changes(pc, start + 1)["reset"]
+    ahead = _changes(pc, start + 10)
+    assert ahead["reset"] and ahead["version"] == start + 3
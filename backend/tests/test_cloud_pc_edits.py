@@ -0,0 +1,77 @@
+"""Partial saves of Cloud PC text files: line-range edits and unified diffs."""
+
+import difflib
+import hashlib
+
+import pytest
+
+TEXT = "alpha\nbravo\ncharlie\ndelta\n"
+
+
+def _unified_diff(before, after):
+    """difflib's diff, with the marker git writes after a line that has no newline."""
+    lines = difflib.unified_diff(before.splitlines(True), after.splitlines(True), "a/file", "b/file")
+    return "".join(line if line.endswith("\n") else f"{line}\n\\ No newline at end of file\n" for line in lines)
+
+
+@pytest.mark.parametrize("edits, expected", [
+    ([{"start": 2, "end": 2, "text": "BRAVO\n"}], "alpha\nBRAVO\ncharlie\ndelta\n"),
+    ([{"start": 2, "end": 1, "text": "inserted\n"}], "alpha\ninserted\nbravo\ncharlie\ndelta\n"),
+    ([{"start": 5, "end": 4, "text": "echo\n"}], TEXT + "echo\n"),
+    ([{"start": 2, "end": 3, "text": ""}], "alpha\ndelta\n"),
+    # Ranges refer to the original lines, whatever order the edits come in
+    ([{"start": 4, "text": "D\n"}, {"start": 1, "text": "A\n"}], "A\nbravo\ncharlie\nD\n"),
+])
+def test_apply_line_edits(app_module, edits, expected):
+    assert app_module.apply_line_edits(TEXT, edits) == expected
+
+
+@pytest.mark.parametrize("edits", [
+    [{"start": 0, "end": 1, "text": ""}],
+    [{"start": 3, "end": 5, "text": ""}],
+    [{"start": 1, "end": 2, "text": "x\n"}, {"start": 2, "end": 3, "text": "y\n"}],
+    [{"end": 1}],
+    [{"start": 1, "text": 5}],
+])
+def test_invalid_line_edits_conflict(app_module, edits):
+    with pytest.raises(app_module.PatchConflict):
+        app_module.apply_line_edits(TEXT, edits)
+
+
+@pytest.mark.parametrize("before, after", [
+    (TEXT, "alpha\nbravo two\ncharlie\ndelta\necho\n"),
+    (TEXT, "zero\n" + TEXT),
+    (TEXT, "alpha\ndelta\n"),
+    ("".join(f"line {n}\n" for n in range(40)), "".join(f"line {n}\n" for n in range(40) if n not in (3, 30)) + "end"),
+    ("no newline", "no newline at all"),
+])
+def test_apply_unified_diff_round_trips_difflib(app_module, before, after):
+    assert app_module.apply_unified_diff(before, _unified_diff(before, after)) == after
+
+
+def test_unified_diff_with_stale_context_conflicts(app_module):
+    diff = _unified_diff(TEXT, TEXT.replace("bravo", "B"))
+    with pytest.raises(app_module.PatchConflict):
+        app_module.apply_unified_diff(TEXT.replace("alpha", "ALPHA"), diff)
+    with pytest.raises(app_module.PatchConflict):
+        app_module.apply_unified_diff(TEXT, "not a diff")
+
+
+def test_patch_endpoint_checks_etag(make_client):
+    client = make_client()
+    pc_id = client.post("/api/cloud-pcs", json={"name": "edits"}).get_json()["cloud_pc"]["id"]
+    files = f"/api/cloud-pcs/{pc_id}/files"
+    client.post(f"{files}/batch", json={"operations": [{"op": "write", "path": "/notes.txt", "content": TEXT}]})
+    etag = client.get(f"{files}/read", query_string={"path": "/notes.txt"}).get_json()["etag"]
+    assert etag == hashlib.sha256(TEXT.encode()).hexdigest()
+
+    edit = {"path": "/notes.txt", "base_etag": etag, "edits": [{"start": 3, "end": 3, "text": "CHARLIE\n"}]}
+    response = client.patch(files, json=edit)
+    assert response.status_code == 200, response.get_json()
+    assert client.patch(files, json=edit).status_code == 412  # the ETag moved on
+
+    diff = "@@ -1 +1 @@\n-alpha\n+ALPHA\n"
+    response = client.patch(files, json={"path": "/notes.txt", "base_etag": response.get_json()["etag"], "diff": diff})
+    assert response.status_code == 200, response.get_json()
+    content = client.get(f"{files}/read", query_string={"path": "/notes.txt"}).get_json()["content"]
+    assert content == "ALPHA\nbravo\nCHARLIE\ndelta\n"
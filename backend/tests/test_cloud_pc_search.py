@@ -0,0 +1,52 @@
+"""Cloud PC full-text search is maintained by the write paths; searching never writes."""
+
+import pytest
+
+
+@pytest.fixture()
+def pc(make_client):
+    client = make_client()
+    response = client.post("/api/cloud-pcs", json={"name": "search pc"})
+    assert response.status_code in (200, 201), response.get_json()
+    client.files = f"/api/cloud-pcs/{response.get_json()['cloud_pc']['id']}/files"
+    return client
+
+
+def _batch(client, *operations):
+    response = client.post(f"{client.files}/batch", json={"operations": list(operations)})
+    assert response.status_code == 200, response.get_json()
+
+
+def _paths(client, query):
+    response = client.get(f"{client.files}/search", query_string={"q": query})
+    assert response.status_code == 200, response.get_json()
+    return sorted(hit["path"] for hit in response.get_json()["results"])
+
+
+def test_rename_to_unindexed_extension_drops_text(pc):
+    _batch(pc, {"op": "write", "path": "/plan.txt", "content": "quokka roadmap"})
+    assert _paths(pc, "quokka") == ["/plan.txt"]
+
+    _batch(pc, {"op": "move", "from": "/plan.txt", "to": "/plan.bin"})
+    assert _paths(pc, "quokka") == []
+
+    _batch(pc, {"op": "move", "from": "/plan.bin", "to": "/plan.md"})
+    assert _paths(pc, "quokka") == ["/plan.md"]
+
+
+def test_copy_and_delete_keep_index_in_step(pc):
+    _batch(
+        pc,
+        {"op": "write", "path": "/docs/a.txt", "content": "wombat notes"},
+        {"op": "copy", "from": "/docs", "to": "/backup"},
+    )
+    assert _paths(pc, "wombat") == ["/backup/a.txt", "/docs/a.txt"]
+
+    _batch(pc, {"op": "delete", "path": "/docs"})
+    assert _paths(pc, "wombat") == ["/backup/a.txt"]
+
+
+def test_search_does_not_write(pc, app_module, monkeypatch):
+    _batch(pc, {"op": "write", "path": "/read.txt", "content": "numbat"})
+    monkeypatch.setattr(app_module, "sync_cloud_pc_search_index", lambda pc_id: pytest.fail("search synced"))
+    assert _paths(pc, "numbat") == ["/read.txt"]
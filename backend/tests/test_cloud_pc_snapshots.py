@@ -0,0 +1,78 @@
+"""Snapshots and clones share unchanged bytes on disk but never each other's edits."""
+
+import os
+
+import pytest
+
+
+@pytest.fixture()
+def pc(make_client):
+    client = make_client()
+    response = client.post("/api/cloud-pcs", json={"name": "snap pc"})
+    assert response.status_code in (200, 201), response.get_json()
+    client.pc_id = response.get_json()["cloud_pc"]["id"]
+    return client
+
+
+def _write(client, pc_id, path, content):
+    response = client.post(
+        f"/api/cloud-pcs/{pc_id}/files/batch",
+        json={"operations": [{"op": "write", "path": path, "content": content}]},
+    )
+    assert response.status_code == 200, response.get_json()
+
+
+def _read(app_module, pc_id, path):
+    with open(app_module.resolve_cloud_pc_path(pc_id, path), encoding="utf-8") as f:
+        return f.read()
+
+
+def _snapshot(client):
+    response = client.post(f"/api/cloud-pcs/{client.pc_id}/snapshots", json={"name": "before"})
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()["snapshot"]["id"]
+
+
+def _usage(client, pc_id=None):
+    usage = client.get("/api/storage/usage").get_json()
+    if pc_id is None:
+        return usage["bytes_used"]
+    return next(row["bytes_used"] for row in usage["cloud_pcs"] if row["id"] == pc_id)
+
+
+def test_writing_a_clone_leaves_the_snapshot_and_source_alone(app_module, pc):
+    _write(pc, pc.pc_id, "/notes.txt", "original")
+    snapshot_id = _snapshot(pc)
+    snapshot_file = os.path.join(app_module.get_cloud_pc_snapshot_dir(pc.pc_id, snapshot_id), "files", "notes.txt")
+    source_file = app_module.resolve_cloud_pc_path(pc.pc_id, "/notes.txt")
+    assert os.path.samefile(snapshot_file, source_file)  # shared, not copied
+
+    response = pc.post(f"/api/cloud-pcs/{pc.pc_id}/clone", json={"snapshot_id": snapshot_id})
+    assert response.status_code == 200, response.get_json()
+    clone_id = response.get_json()["cloud_pc"]["id"]
+    _write(pc, clone_id, "/notes.txt", "edited in the clone")
+
+    assert _read(app_module, clone_id, "/notes.txt") == "edited in the clone"
+    with open(snapshot_file, encoding="utf-8") as f:
+        assert f.read() == "original"
+    assert _read(app_module, pc.pc_id, "/notes.txt") == "original"
+
+
+def test_ledger_charges_clones_and_restores_but_not_snapshots(pc):
+    _write(pc, pc.pc_id, "/a.txt", "x" * 100)
+    assert _usage(pc) == 100
+
+    snapshot_id = _snapshot(pc)
+    assert _usage(pc) == 100  # snapshot files are hard links to the live ones
+
+    response = pc.post(f"/api/cloud-pcs/{pc.pc_id}/clone", json={})
+    clone_id = response.get_json()["cloud_pc"]["id"]
+    assert _usage(pc, clone_id) == 100
+    assert _usage(pc) == 200
+
+    _write(pc, pc.pc_id, "/b.txt", "y" * 50)
+    assert _usage(pc, pc.pc_id) == 150
+    response = pc.post(f"/api/cloud-pcs/{pc.pc_id}/snapshots/{snapshot_id}/restore")
+    assert response.status_code == 200, response.get_json()
+    assert _usage(pc, pc.pc_id) == 100
+    assert _usage(pc) == 200
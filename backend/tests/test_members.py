@@ -0,0 +1,89 @@
+"""Member index: prefix and word-start lookups kept in step with signups, and keyset paging."""
+
+import uuid
+from collections import namedtuple
+
+import pytest
+
+Row = namedtuple("Row", "id username email is_admin")
+
+
+@pytest.fixture()
+def index(app_module):
+    return app_module._MemberIndex([
+        Row(1, "mary_jane", "mj@example.com", False),
+        Row(2, "JohnSmith", "john.smith@mail.org", True),
+        Row(3, "janet", "jb@example.com", False),
+    ])
+
+
+def _register(client, username):
+    response = client.post(
+        "/api/register", json={"username": username, "email": f"{username}@example.com", "password": "pw"}
+    )
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()["user"]["id"]
+
+
+def test_prefix_and_word_start_matching(index):
+    assert index.matching_ids("ja") == {1, 3}  # "janet", and "jane" inside "mary_jane"
+    assert index.matching_ids("JOHN") == {2}
+    assert index.matching_ids("smi") == {2}  # word in the email
+    assert index.matching_ids("example") == {1, 3}
+    assert index.matching_ids("ary") == set()  # not a word start
+    assert [member["username"] for member in index.complete("ja", 10)] == ["janet", "mary_jane"]
+    assert len(index.complete("ja", 1)) == 1
+
+
+def test_add_and_remove_keep_keys_and_order(index):
+    index.add(4, "jasper", "jasper@example.com", False)
+    assert index.matching_ids("jas") == {4}
+    assert index.ids_desc == [4, 3, 2, 1]
+
+    # Re-adding replaces the old keys
+    index.add(3, "bella", "bella@example.com", False)
+    assert index.matching_ids("ja") == {1, 4}
+    assert index.matching_ids("bel") == {3}
+
+    index.remove(2)
+    index.remove(99)  # unknown ids are ignored
+    assert index.matching_ids("john") == set()
+    assert index.ids_desc == [4, 3, 1]
+    assert 2 not in index.members
+
+
+def test_signups_show_up_in_autocomplete(make_client):
+    client = make_client()
+    tag = uuid.uuid4().hex[:8]
+    user_id = _register(client, f"auto{tag}_fresh")
+    members = client.get("/api/members/autocomplete", query_string={"q": f"auto{tag}"}).get_json()["members"]
+    assert [member["id"] for member in members] == [user_id]
+    members = client.get("/api/members/autocomplete", query_string={"q": "fresh", "limit": 50}).get_json()["members"]
+    assert user_id in [member["id"] for member in members]  # word start after the underscore
+
+
+def test_before_cursor_pages_newest_first(make_client):
+    client = make_client()
+    tag = uuid.uuid4().hex[:8]
+    ids = [_register(client, f"page{tag}_{n}") for n in range(5)]
+    newest_first = sorted(ids, reverse=True)
+
+    def page(**params):
+        response = client.get("/api/members", query_string={"search": f"page{tag}", "per_page": 2, **params})
+        assert response.status_code == 200, response.get_json()
+        return response.get_json()
+
+    seen, before = [], None
+    while True:
+        body = page(**({"before": before} if before else {}))
+        assert body["pagination"]["total"] == 5
+        seen.extend(member["id"] for member in body["members"])
+        before = body["pagination"]["next_before"]
+        if before is None:
+            break
+    assert seen == newest_first
+
+    # Page numbers still work and agree with the cursor
+    second = page(page=2)
+    assert [member["id"] for member in second["members"]] == newest_first[2:4]
+    assert second["pagination"]["page"] == 2 and "page" not in page(before=newest_first[1])["pagination"]
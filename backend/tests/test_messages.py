@@ -0,0 +1,77 @@
+"""Conversation summaries (inbox rows, unread counters and read marks)."""
+
+
+def _send(client, recipient, body):
+    response = client.post("/api/messages", json={"recipient": recipient.username, "body": body})
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()["data"]["id"]
+
+
+def test_backfill_rebuilds_missing_conversations(app_module, make_client):
+    alice, bob = make_client(), make_client()
+    _send(alice, bob, "hi")
+    last_id = _send(bob, alice, "hello")
+    pair = (min(alice.user_id, bob.user_id), max(alice.user_id, bob.user_id))
+    with app_module.app.app_context():
+        Conversation = app_module.Conversation
+        # Message history from before the conversations table existed
+        app_module.db.session.query(Conversation).filter_by(user_low_id=pair[0], user_high_id=pair[1]).delete()
+        app_module.db.session.commit()
+
+        assert app_module.backfill_conversations(batch_size=1) >= 1
+        assert app_module.backfill_conversations() == 0
+        row = app_module.db.session.query(Conversation).filter_by(user_low_id=pair[0], user_high_id=pair[1]).one()
+        assert row.last_message_id == last_id
+        assert (row.unread_low, row.unread_high) == (0, 0)
+
+    inbox = alice.get("/api/messages").get_json()["conversations"]
+    assert [conversation["partner"]["id"] for conversation in inbox] == [bob.user_id]
+
+
+def test_unread_counts_and_user_named_unread(app_module, make_client):
+    alice, bob = make_client(), make_client()
+    _send(alice, bob, "ping")
+    _send(alice, bob, "ping again")
+
+    counts = bob.get("/api/messages-unread").get_json()
+    assert counts["total"] == 2
+    assert counts["conversations"] == [{"partner_id": alice.user_id, "unread_count": 2}]
+
+    # /api/messages/<username> belongs to threads, whatever the username
+    with app_module.app.app_context():
+        app_module.db.session.query(app_module.User).filter_by(id=alice.user_id).update({"username": "unread"})
+        app_module.db.session.commit()
+    alice.username = "unread"
+    thread = bob.get("/api/messages/unread").get_json()
+    assert [message["body"] for message in thread["messages"]] == ["ping", "ping again"]
+    assert thread["unread_count"] == 2
+
+
+def test_read_mark_migration_adds_columns(app_module, tmp_path):
+    from sqlalchemy import create_engine, inspect, text
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as conn:
+        # conversations as created before read receipts
+        conn.execute(text(
+            "CREATE TABLE conversations (id INTEGER PRIMARY KEY, user_low_id INTEGER, user_high_id INTEGER, "
+            "last_message_id INTEGER, unread_low INTEGER, unread_high INTEGER)"
+        ))
+        app_module._migrate_conversation_read_marks(conn)
+        app_module._migrate_conversation_read_marks(conn)  # re-running is a no-op
+    columns = {column["name"] for column in inspect(engine).get_columns("conversations")}
+    assert {"last_read_low_id", "last_read_high_id"} <= columns
+    engine.dispose()
+
+
+def test_inbox_page_size_is_clamped(make_client):
+    alice, bob, carol = make_client(), make_client(), make_client()
+    _send(bob, alice, "from bob")
+    _send(carol, alice, "from carol")
+
+    for per_page in (0, -1):
+        response = alice.get("/api/messages", query_string={"per_page": per_page})
+        assert response.status_code == 200, response.get_json()
+        page = response.get_json()
+        assert [conversation["partner"]["id"] for conversation in page["conversations"]] == [carol.user_id]
+        assert page["next_before"] is not None
@@ -0,0 +1,225 @@
+"""Paint storage: compact encoding, the op log and server-side renders."""
+
+import concurrent.futures
+import json
+import os
+import time
+
+import pytest
+
+LINE = {"points": [{"x": 1, "y": 2}, {"x": 30.5, "y": 40.5}], "brushColor": "#ff0000", "brushRadius": 4}
+
+
+@pytest.fixture()
+def painter(make_client):
+    client = make_client()
+    response = client.post("/api/paint", json={"name": "Sky", "data": {"lines": [LINE], "width": 200, "height": 100}})
+    assert response.status_code == 200, response.get_json()
+    client.paint = response.get_json()["paint"]
+    return client
+
+
+def test_render_cache_keeps_only_current_revision(app_module, painter):
+    paint_id = painter.paint["id"]
+    render_dir = app_module.get_paint_render_dir(paint_id)
+    with app_module.app.app_context():
+        paint = app_module.db.session.get(app_module.Paint, paint_id)
+        revision = paint.state.revision
+        # Left behind by a render that finished after the last save invalidated the cache
+        os.makedirs(render_dir, exist_ok=True)
+        open(os.path.join(render_dir, f"r{revision - 1}_200x100.png"), "wb").close()
+
+        app_module.get_paint_render(paint, (200, 100), "PNG")
+        assert os.listdir(render_dir) == [f"r{revision}_200x100.png"]
+
+        # A render of a superseded revision is returned but not cached
+        paint.state.revision = revision - 1
+        app_module.get_paint_render(paint, (100, 50), "PNG")
+        assert os.listdir(render_dir) == [f"r{revision}_200x100.png"]
+        app_module.db.session.rollback()
+
+
+def test_drawing_render_timeout_returns_503(app_module, painter, monkeypatch):
+    pc_id = painter.post("/api/cloud-pcs", json={"name": "pc"}).get_json()["cloud_pc"]["id"]
+
+    def slow_render(*args):
+        raise concurrent.futures.TimeoutError()
+
+    monkeypatch.setattr(app_module, "get_paint_render", slow_render)
+    response = painter.post(
+        f"/api/cloud-pcs/{pc_id}/files/drawing",
+        json={"path": "/", "filename": "sky.png", "paint_id": painter.paint["id"]},
+    )
+    assert response.status_code == 503
+
+
+def _stuck_render(snapshot, ops, size, image_format, conn):
+    time.sleep(60)  # runs in the worker process
+
+
+def _crashing_render(snapshot, ops, size, image_format, conn):
+    os._exit(1)
+
+
+def test_timed_out_renders_are_killed_and_free_their_slot(app_module, painter, monkeypatch):
+    monkeypatch.setattr(app_module, "PAINT_RENDER_TIMEOUT_SECONDS", 1)
+    with app_module.app.app_context():
+        paint = app_module.db.session.get(app_module.Paint, painter.paint["id"])
+
+        monkeypatch.setattr(app_module, "render_paint_process", _stuck_render)
+        for size in [(100, 50)] * (app_module.PAINT_RENDER_WORKERS + 1):
+            started = time.monotonic()
+            with pytest.raises(concurrent.futures.TimeoutError):
+                app_module.get_paint_render(paint, size, "PNG")
+            assert time.monotonic() - started < 5  # each waits out only its own timeout
+
+        # No worker is still held by the stuck renders
+        monkeypatch.undo()
+        assert app_module.get_paint_render(paint, (100, 50), "PNG")[:4] == b"\x89PNG"
+
+
+def test_crashed_render_worker_is_an_error_not_an_in_process_render(app_module, painter, monkeypatch):
+    monkeypatch.setattr(app_module, "render_paint_process", _crashing_render)
+    response = painter.get(f"/api/paint/{painter.paint['id']}/thumbnail")
+    assert response.status_code == 500
+
+
+def test_ops_reject_non_string_name(painter):
+    paint = painter.paint
+    response = painter.post(
+        f"/api/paint/{paint['id']}/ops",
+        json={"base_revision": paint["revision"], "ops": [{"type": "clear"}], "name": 42},
+    )
+    assert response.status_code == 400
+    assert painter.get(f"/api/paint/{paint['id']}").get_json()["paint"]["revision"] == paint["revision"]
+
+
+def test_encoding_round_trips_at_quantized_precision(app_module):
+    data = {
+        "lines": [LINE, {"points": [{"x": 0.04, "y": 1000.06}], "brushColor": "#00f", "brushRadius": 12.5}],
+        "width": 640,
+        "height": 480,
+    }
+    blob = app_module.encode_paint_data(data)
+    assert blob[:4] == app_module.PAINT_STROKES_MAGIC
+
+    decoded = app_module.decode_paint_data(blob)
+    assert decoded["width"] == 640 and decoded["height"] == 480
+    assert [line["brushColor"] for line in decoded["lines"]] == ["#ff0000", "#00f"]
+    assert decoded["lines"][0] == LINE
+    assert decoded["lines"][1]["points"] == [{"x": 0.0, "y": 1000.1}]
+    assert decoded["lines"][1]["brushRadius"] == 12.5
+
+
+def test_unexpected_shapes_are_kept_as_json(app_module):
+    data = {"lines": [{"points": [], "brushColor": "#000", "brushRadius": 1, "extra": True}]}
+    blob = app_module.encode_paint_data(data)
+    assert blob[:4] == app_module.PAINT_JSON_MAGIC
+    assert app_module.decode_paint_data(blob) == data
+
+
+def test_replay_applies_strokes_undo_and_clear_in_order(app_module):
+    def line(x):
+        return {"points": [{"x": x, "y": x}], "brushColor": "#111", "brushRadius": 2}
+
+    ops = [
+        (kind, payload)
+        for kind, payload, _, _ in app_module._parse_paint_ops([
+            {"type": "strokes", "lines": [line(1), line(2)]},
+            {"type": "undo", "count": 1},
+            {"type": "strokes", "lines": [line(3)]},
+        ])
+    ]
+    data = app_module.replay_paint_ops({"lines": [line(0)]}, ops)
+    assert [line["points"][0]["x"] for line in data["lines"]] == [0, 1, 3]
+
+    # Undo past the start just empties the painting; clear drops everything before it
+    ops = [(kind, payload) for kind, payload, _, _ in app_module._parse_paint_ops([{"type": "undo", "count": 9}])]
+    assert app_module.replay_paint_ops({"lines": [line(0)]}, ops)["lines"] == []
+    ops = [(kind, payload) for kind, payload, _, _ in app_module._parse_paint_ops([
+        {"type": "clear"}, {"type": "strokes", "lines": [line(5)]},
+    ])]
+    assert [line["points"][0]["x"] for line in app_module.replay_paint_ops({"lines": [line(0)]}, ops)["lines"]] == [5]
+
+
+@pytest.mark.parametrize("ops", [
+    {"type": "strokes"},
+    [{"type": "strokes", "lines": []}],
+    [{"type": "strokes", "lines": [{"points": []}]}],
+    [{"type": "undo", "count": 0}],
+    [{"type": "redo"}],
+])
+def test_invalid_ops_are_rejected(app_module, ops):
+    with pytest.raises(ValueError):
+        app_module._parse_paint_ops(ops)
+
+
+def test_ops_endpoint_matches_full_save(painter):
+    paint = painter.paint
+    second = {"points": [{"x": 5, "y": 6}], "brushColor": "#00ff00", "brushRadius": 3}
+    response = painter.post(
+        f"/api/paint/{paint['id']}/ops",
+        json={"base_revision": paint["revision"], "ops": [{"type": "strokes", "lines": [second]}]},
+    )
+    assert response.status_code == 200, response.get_json()
+    assert response.get_json()["paint"]["revision"] == paint["revision"] + 1
+
+    stale = painter.post(f"/api/paint/{paint['id']}/ops", json={"base_revision": paint["revision"], "ops": [{"type": "clear"}]})
+    assert stale.status_code == 409
+
+    saved = painter.get(f"/api/paint/{paint['id']}").get_json()["paint"]["data"]
+    assert saved["lines"] == [LINE, second]
+
+
+def test_legacy_paintings_are_read_as_is_and_encoded_by_the_migration(app_module, make_client):
+    client = make_client()
+    data = {"lines": [LINE], "width": 200, "height": 100}
+    with app_module.app.app_context():
+        paints = [app_module.Paint(owner_id=client.user_id, name=f"Old {n}", data=json.dumps(data)) for n in range(3)]
+        app_module.db.session.add_all(paints)
+        app_module.db.session.commit()
+        paint_ids = [paint.id for paint in paints]
+
+    assert len(client.get("/api/paint").get_json()["paintings"]) == 3
+    assert client.get(f"/api/paint/{paint_ids[0]}").get_json()["paint"]["data"] == data
+    assert client.get(f"/api/paint/{paint_ids[0]}/thumbnail").status_code == 503
+    with app_module.app.app_context():
+        PaintState = app_module.PaintState
+        assert app_module.db.session.query(PaintState).filter(PaintState.paint_id.in_(paint_ids)).count() == 0  # reads never convert
+
+        assert app_module.encode_legacy_paints(batch_size=2) >= 3
+        assert app_module.encode_legacy_paints() == 0
+        for paint_id in paint_ids:
+            paint = app_module.db.session.get(app_module.Paint, paint_id)
+            assert paint.state.revision == 1 and paint.data == ""
+            assert app_module.get_paint_data(paint) == data
+
+    assert client.get(f"/api/paint/{paint_ids[0]}/thumbnail").status_code == 200
+
+
+def test_full_save_checks_base_revision(painter):
+    paint = painter.paint
+    stale = paint["revision"]
+    moved = painter.post(f"/api/paint/{paint['id']}/ops", json={"base_revision": stale, "ops": [{"type": "clear"}]})
+    assert moved.status_code == 200
+
+    conflict = painter.post("/api/paint", json={"id": paint["id"], "base_revision": stale, "name": "Sky", "data": {"lines": [LINE]}})
+    assert conflict.status_code == 409
+    assert "full_save_required" not in conflict.get_json()
+    assert painter.get(f"/api/paint/{paint['id']}").get_json()["paint"]["data"]["lines"] == []
+
+    current = moved.get_json()["paint"]["revision"]
+    saved = painter.post("/api/paint", json={"id": paint["id"], "base_revision": current, "name": "Sky", "data": {"lines": [LINE]}})
+    assert saved.status_code == 200, saved.get_json()
+    assert saved.get_json()["paint"]["revision"] == current + 1
+    assert painter.get(f"/api/paint/{paint['id']}").get_json()["paint"]["data"]["lines"] == [LINE]
+
+
+def test_ops_on_json_painting_ask_for_a_full_save(painter):
+    response = painter.post("/api/paint", json={"name": "Odd", "data": {"lines": [dict(LINE, extra=True)]}})
+    paint = response.get_json()["paint"]
+    stale = painter.post(f"/api/paint/{paint['id']}/ops", json={"base_revision": paint["revision"] - 1, "ops": [{"type": "clear"}]})
+    assert stale.status_code == 409 and "full_save_required" not in stale.get_json()
+
+    needs_full = painter.post(f"/api/paint/{paint['id']}/ops", json={"base_revision": paint["revision"], "ops": [{"type": "clear"}]})
+    assert needs_full.status_code == 409 and needs_full.get_json()["full_save_required"]
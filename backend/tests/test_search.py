@@ -0,0 +1,93 @@
+"""Unified search index (search_documents) stays in step with its sources."""
+
+
+def _search(client, query, **params):
+    response = client.get("/api/search", query_string={"q": query, **params})
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()["results"]
+
+
+def test_search_respects_ownership(make_client):
+    alice, bob = make_client(), make_client()
+    alice.post("/api/todos", json={"title": "walrus shopping"})
+    bob.post("/api/todos", json={"title": "walrus secret"})
+
+    titles = [hit["title"] for hit in _search(alice, "walrus", types="todo")]
+    assert titles == ["walrus shopping"]
+
+
+def test_todo_edit_and_delete_update_index(make_client):
+    client = make_client()
+    todo_id = client.post("/api/todos", json={"title": "buy narwhal plush"}).get_json()["todo"]["id"]
+    client.put(f"/api/todos/{todo_id}", json={"title": "buy beluga plush"})
+
+    assert _search(client, "narwhal") == []
+    assert [hit["id"] for hit in _search(client, "beluga")] == [todo_id]
+
+    client.delete(f"/api/todos/{todo_id}")
+    assert _search(client, "beluga") == []
+
+
+def test_legacy_doc_convert_then_edit_drops_old_chunks(app_module, make_client):
+    client = make_client()
+    with app_module.app.app_context():
+        # A doc stored before chunked storage, with retrieval chunks from the older index
+        doc = app_module.AIDoc(owner_id=client.user_id, title="Legacy", content="oldchunk alpha\n\noldchunk bravo")
+        app_module.db.session.add(doc)
+        app_module.db.session.flush()
+        for position, body in enumerate(["oldchunk alpha\n\n", "oldchunk bravo"]):
+            app_module.db.session.add(app_module.AIDocChunk(
+                doc_id=doc.id, owner_id=client.user_id, position=position, content_hash="legacy", body=body,
+            ))
+        app_module.db.session.commit()
+        doc_id = doc.id
+
+    assert client.get(f"/api/ai/docs/{doc_id}").status_code == 200  # converts to chunked storage
+    assert client.put(f"/api/ai/docs/{doc_id}", json={"content": "zulu only"}).status_code == 200
+
+    assert _search(client, "oldchunk") == []
+    assert [hit["id"] for hit in _search(client, "zulu")] == [doc_id]
+    with app_module.app.app_context():
+        bodies = [
+            row.body
+            for row in app_module.db.session.query(app_module.SearchDocument).filter_by(result_type="doc", result_id=doc_id)
+        ]
+    assert not any("oldchunk" in body for body in bodies)
+
+
+def test_deleting_doc_removes_its_search_rows(app_module, make_client):
+    client = make_client()
+    with app_module.app.app_context():
+        doc = app_module.AIDoc(owner_id=client.user_id, title="Temp", content="")
+        app_module.db.session.add(doc)
+        app_module.db.session.flush()
+        app_module.set_ai_doc_text(doc, "quokka facts\n\nmore quokka facts")
+        app_module.db.session.commit()
+        doc_id = doc.id
+
+    assert [hit["id"] for hit in _search(client, "quokka")] == [doc_id]
+    client.delete(f"/api/ai/docs/{doc_id}")
+    with app_module.app.app_context():
+        assert app_module.db.session.query(app_module.SearchDocument).filter_by(result_id=doc_id, result_type="doc").count() == 0
+
+
+def test_backfill_indexes_missing_rows_in_batches(app_module, make_client):
+    client = make_client()
+    db = app_module.db
+    with app_module.app.app_context():
+        chat = app_module.AIChat(owner_id=client.user_id, title="Backfill chat")
+        chat.messages = [app_module.AIMessage(role="user", content=f"platypus note {n}") for n in range(3)]
+        db.session.add(chat)
+        db.session.commit()
+        chat_id = chat.id
+        # Rows written before the index existed have no search documents
+        db.session.query(app_module.SearchDocument).filter_by(result_type="chat", result_id=chat_id).delete()
+        db.session.commit()
+        assert _search(client, "platypus") == []
+
+        assert app_module.backfill_search_documents(batch_size=2) >= 4
+        assert app_module.backfill_search_documents(batch_size=2) == 0
+
+    hits = _search(client, "platypus")
+    assert [(hit["type"], hit["id"]) for hit in hits] == [("chat", chat_id)]
+    assert _search(make_client(), "platypus") == []
@@ -0,0 +1,80 @@
+"""Byte-exact storage ledger: atomic quota checks, streamed uploads, overwrites and reconciliation."""
+
+import io
+import os
+
+import pytest
+
+
+@pytest.fixture()
+def pc(make_client):
+    client = make_client()
+    response = client.post("/api/cloud-pcs", json={"name": "ledger pc"})
+    assert response.status_code in (200, 201), response.get_json()
+    client.pc_id = response.get_json()["cloud_pc"]["id"]
+    return client
+
+
+def _upload(client, data, filename="blob.bin"):
+    return client.post(
+        f"/api/cloud-pcs/{client.pc_id}/files/upload",
+        data={"path": "/", "file": (io.BytesIO(data), filename)},
+        content_type="multipart/form-data",
+    )
+
+
+def _ledger(app_module, scope, scope_id):
+    with app_module.app.app_context():
+        return app_module.get_storage_used(scope, scope_id)
+
+
+def test_charge_checks_quota_in_the_same_update(app_module, app_context, make_client):
+    user_id = make_client().user_id
+    assert app_module._charge_ledger("user", user_id, 60, quota=100)
+    assert not app_module._charge_ledger("user", user_id, 50, quota=100)  # would reach 110
+    assert app_module._charge_ledger("user", user_id, 40, quota=100)  # exactly at the quota
+    assert app_module.get_storage_used("user", user_id) == 100
+
+    # Shrinking is never refused and never goes below zero
+    assert app_module._charge_ledger("user", user_id, -250, quota=100)
+    assert app_module.get_storage_used("user", user_id) == 0
+
+
+def test_upload_over_quota_is_rejected_while_streaming(app_module, pc, monkeypatch):
+    monkeypatch.setattr(app_module, "USER_STORAGE_QUOTA_BYTES", 50)
+    response = _upload(pc, b"x" * 1000)  # small enough to pass the Content-Length precheck
+    assert response.status_code == 413
+    assert response.get_json()["code"] == "storage_quota_exceeded"
+
+    storage_dir = app_module.get_cloud_pc_storage_dir(pc.pc_id)
+    assert os.listdir(storage_dir) == []  # no file and no leftover .part
+    assert _ledger(app_module, "user", pc.user_id) == 0
+    assert _ledger(app_module, "cloud_pc", pc.pc_id) == 0
+
+
+def test_stream_stops_at_the_byte_limit(app_module, tmp_path):
+    with pytest.raises(app_module.StorageQuotaExceeded):
+        app_module.stream_to_temp_file(io.BytesIO(b"x" * 100), str(tmp_path / "out"), max_bytes=99)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_overwrite_is_charged_for_the_size_change(app_module, pc):
+    assert _upload(pc, b"a" * 100).status_code == 200
+    assert _ledger(app_module, "cloud_pc", pc.pc_id) == 100
+
+    assert _upload(pc, b"b" * 40).status_code == 200
+    assert _ledger(app_module, "cloud_pc", pc.pc_id) == 40
+    assert _ledger(app_module, "user", pc.user_id) == 40
+
+
+def test_reconcile_rebuilds_the_ledger_from_disk(app_module, pc):
+    assert _upload(pc, b"c" * 64).status_code == 200
+    with app_module.app.app_context():
+        app_module._set_ledger("user", pc.user_id, 999_999)
+        app_module._set_ledger("cloud_pc", pc.pc_id, 7)
+        app_module.db.session.commit()
+
+        stats = app_module.reconcile_storage_ledger()
+        assert stats["cloud_pcs"] >= 1
+    assert _ledger(app_module, "cloud_pc", pc.pc_id) == 64
+    assert _ledger(app_module, "user", pc.user_id) == 64
@@ -249,6 +249,14 @@ const getStyles = (isMobile) => ({
     flexWrap: 'wrap',
     gap: '0.75rem',
   },
+  docsToggle: {
+    display: 'flex',
+    alignItems: 'center',
+    gap: '0.4rem',
+    fontSize: '0.85rem',
+    color: '#4b5563',
+    cursor: 'pointer',
+  },
   sendButton: {
     backgroundColor: '#2563eb',
     color: '#ffffff',
@@ -353,6 +361,7 @@ function AiChat() {
   const [input, setInput] = useState('');
   const [error, setError] = useState(null);
   const [latestSearchResults, setLatestSearchResults] = useState(null);
+  const [useDocs, setUseDocs] = useState(false);
   const transcriptEndRef = useRef(null);
   const [isMobile, setIsMobile] = useState(window.innerWidth <= 768);
 
@@ -545,6 +554,7 @@ function AiChat() {
         payload.title = trimmed.slice(0, 60);
       }
       payload.use_search = true;
+      payload.use_docs = useDocs;
 
       const { data } = await api.post('/api/ai/chat', payload);
       const chat = data?.chat;
@@ -592,7 +602,7 @@ function AiChat() {
     } finally {
       setSending(false);
     }
-  }, [input, selectedChat, sending]);
+  }, [input, selectedChat, sending, useDocs]);
 
   const handleKeyDown = useCallback(
     (event) => {
@@ -781,6 +791,15 @@ function AiChat() {
               <span style={styles.status}>
                 {sending ? 'Thinking…' : 'Press Enter to send, Shift + Enter for newline.'}
               </span>
+              <label style={styles.docsToggle}>
+                <input
+                  type="checkbox"
+                  checked={useDocs}
+                  onChange={(event) => setUseDocs(event.target.checked)}
+                  disabled={sending}
+                />
+                Use my AI Docs
+              </label>
               <button
                 type="button"
                 onClick={sendMessage}
@@ -5,6 +5,42 @@ import api from '../../services/api';
 import { useAuth } from '../../contexts/AuthContext';
 import { useTheme } from '../../contexts/ThemeContext';
 
+// Work out which run of the loaded chunks an edit touched: chunks matching the start or the
+// end of the new text are kept, everything between them is replaced by the changed text.
+function buildDocChunkEdit(chunks, original, content) {
+  const texts = [];
+  let offset = 0;
+  chunks.forEach((chunk) => {
+    texts.push(original.slice(offset, offset + chunk.length));
+    offset += chunk.length;
+  });
+
+  let start = 0;
+  let head = 0;
+  while (start < texts.length && content.startsWith(texts[start], head)) {
+    head += texts[start].length;
+    start += 1;
+  }
+  let end = texts.length;
+  let tail = content.length;
+  while (end > start && tail - texts[end - 1].length >= head && content.endsWith(texts[end - 1], tail)) {
+    tail -= texts[end - 1].length;
+    end -= 1;
+  }
+
+  const replaced = chunks.slice(start, end);
+  return {
+    start,
+    end,
+    payload: {
+      chunk_ids: replaced.map((chunk) => chunk.id),
+      hashes: replaced.map((chunk) => chunk.hash),
+      after: start > 0 ? chunks[start - 1].id : null,
+      text: content.slice(head, tail),
+    },
+  };
+}
+
 function AiDocs() {
   const { user } = useAuth();
   const theme = useTheme();
@@ -39,6 +75,9 @@ function AiDocs() {
 
   const docInputRef = useRef(null);
   const downloadMenuRef = useRef(null);
+  // Chunk ids/hashes/lengths of the loaded doc, used to save edits as chunk-level patches
+  const docChunksRef = useRef([]);
+  const selectedDocIdRef = useRef(null);
 
   const selectedDoc = docs.find(d => d.id === selectedDocId);
   const selectedImage = images.find(img => img.id === selectedImageId);
@@ -100,22 +139,32 @@ function AiDocs() {
     }
   };
 
+  // The docs list only carries titles and excerpts; fetch the text when a doc is opened
+  const loadDoc = useCallback(async (docId) => {
+    const { data } = await api.get(`/api/ai/docs/${docId}`);
+    if (selectedDocIdRef.current !== docId) return;
+    docChunksRef.current = Array.isArray(data?.chunks) ? data.chunks : [];
+    setDocTitle(data.title);
+    setDocContent(data.content);
+    setOriginalDocTitle(data.title);
+    setOriginalDocContent(data.content);
+    setHasUnsavedChanges(false);
+  }, []);
+
   useEffect(() => {
-    if (selectedDoc) {
-      setDocTitle(selectedDoc.title);
-      setDocContent(selectedDoc.content);
-      setOriginalDocTitle(selectedDoc.title);
-      setOriginalDocContent(selectedDoc.content);
-      setHasUnsavedChanges(false);
-      setSuccess(null); // Clear any success message when selecting a new doc
-    } else {
-      setDocTitle('');
-      setDocContent('');
-      setOriginalDocTitle('');
-      setOriginalDocContent('');
-      setHasUnsavedChanges(false);
-    }
-  }, [selectedDoc]);
+    selectedDocIdRef.current = selectedDocId;
+    docChunksRef.current = [];
+    setDocTitle('');
+    setDocContent('');
+    setOriginalDocTitle('');
+    setOriginalDocContent('');
+    setHasUnsavedChanges(false);
+    if (!selectedDocId) return;
+    setSuccess(null); // Clear any success message when selecting a new doc
+    loadDoc(selectedDocId).catch((err) => {
+      setError(err.response?.data?.error || 'Unable to open this document right now.');
+    });
+  }, [selectedDocId, loadDoc]);
 
   useEffect(() => {
     if (!downloadMenuOpen) return undefined;
@@ -188,6 +237,26 @@ function AiDocs() {
     }
   };
 
+  const pollDocImport = useCallback(async (importId) => {
+    let pagesShown = 0;
+    for (;;) {
+      await new Promise((resolve) => setTimeout(resolve, 1500));
+      const { data } = await api.get(`/api/ai/docs/imports/${importId}`);
+      const job = data?.import;
+      if (data?.doc) {
+        setDocs((prev) => prev.map((doc) => (doc.id === data.doc.id ? data.doc : doc)));
+        const finished = !job || !['queued', 'processing'].includes(job.status);
+        if (selectedDocIdRef.current === data.doc.id && (finished || job.pages_done !== pagesShown)) {
+          pagesShown = job?.pages_done || 0;
+          await loadDoc(data.doc.id);
+        }
+      }
+      if (!job || !['queued', 'processing'].includes(job.status)) {
+        return job;
+      }
+    }
+  }, [loadDoc]);
+
   const handleDocInputUpload = async () => {
     if (!docInputRef.current || !docInputRef.current.files?.length) {
       setError('Please choose a document to import.');
@@ -207,7 +276,25 @@ function AiDocs() {
         headers: { 'Content-Type': 'multipart/form-data' },
       });
 
-      if (data?.doc) {
+      if (data?.doc && data?.import) {
+        // PDF/DOCX text is extracted in the background; show pages as they are stored
+        setDocs((prev) => [data.doc, ...prev]);
+        setSelectedDocId(data.doc.id);
+        setSuccess('Importing… the text will appear as pages are read.');
+        const job = await pollDocImport(data.import.id);
+        if (job?.status === 'failed') {
+          setDocs((prev) => prev.filter((doc) => doc.id !== data.doc.id));
+          setSelectedDocId(null);
+          setSuccess(null);
+          setError(job.error || 'Unable to import this document right now.');
+        } else if (job?.status === 'partial') {
+          setSuccess(null);
+          setError(job.error);
+        } else {
+          setSuccess('Document imported! You can edit it now.');
+          setTimeout(() => setSuccess(null), 2500);
+        }
+      } else if (data?.doc) {
         setDocs((prev) => [data.doc, ...prev]);
         setSelectedDocId(data.doc.id);
         setSuccess('Document imported! You can edit it now.');
@@ -275,16 +362,38 @@ function AiDocs() {
     
     setSavingDoc(true);
     setError(null);
+    const savedContent = docContent;
     try {
-      const { data } = await api.put(`/api/ai/docs/${selectedDocId}`, {
-        title: docTitle.trim(),
-        content: docContent,
-      });
+      let data;
+      try {
+        // Send only the run of chunks that changed
+        const edit = buildDocChunkEdit(docChunksRef.current, originalDocContent, savedContent);
+        ({ data } = await api.patch(`/api/ai/docs/${selectedDocId}`, {
+          title: docTitle.trim(),
+          edits: contentChanged ? [edit.payload] : [],
+        }));
+        if (contentChanged) {
+          const applied = data?.edits?.[0];
+          const chunks = [...docChunksRef.current];
+          chunks.splice(applied.start, applied.removed, ...applied.chunks);
+          docChunksRef.current = chunks;
+        }
+      } catch (patchError) {
+        if (patchError.response?.status !== 409 || !contentChanged) throw patchError;
+        // The doc changed elsewhere since it was loaded: save the full text, as before
+        ({ data } = await api.put(`/api/ai/docs/${selectedDocId}`, {
+          title: docTitle.trim(),
+          content: savedContent,
+        }));
+        await loadDoc(selectedDocId);
+      }
       if (data?.doc) {
-        setDocs(prev => prev.map(doc => doc.id === data.doc.id ? data.doc : doc));
+        const docMeta = { ...data.doc };
+        delete docMeta.content;
+        setDocs(prev => prev.map(doc => doc.id === docMeta.id ? docMeta : doc));
         // Update original values to match saved values
         setOriginalDocTitle(data.doc.title);
-        setOriginalDocContent(data.doc.content);
+        setOriginalDocContent(savedContent);
         setHasUnsavedChanges(false);
         // Only show success message if there were actual changes
         if (titleChanged || contentChanged) {
@@ -298,7 +407,7 @@ function AiDocs() {
     } finally {
       setSavingDoc(false);
     }
-  }, [selectedDocId, docTitle, docContent, originalDocTitle, originalDocContent, savingDoc]);
+  }, [selectedDocId, docTitle, docContent, originalDocTitle, originalDocContent, savingDoc, loadDoc]);
 
   // Track changes to detect unsaved edits
   useEffect(() => {
@@ -571,6 +680,7 @@ function AiDocs() {
                     onClick={() => setSelectedDocId(doc.id)}
                   >
                     <h3 style={styles.listTitle}>{doc.title || 'Untitled doc'}</h3>
+                    {doc.excerpt && <p style={styles.listExcerpt}>{doc.excerpt}</p>}
                     <div style={styles.listMeta}>
                       {doc.updated_at ? `Updated ${new Date(doc.updated_at).toLocaleString()}` : `Created ${new Date(doc.created_at).toLocaleString()}`}
                     </div>
@@ -1089,6 +1199,14 @@ const styles = {
     color: 'rgba(255, 255, 255, 0.6)',
     marginTop: '0.25rem',
   },
+  listExcerpt: {
+    fontSize: '0.8rem',
+    color: 'rgba(255, 255, 255, 0.75)',
+    margin: '0.25rem 0 0',
+    overflow: 'hidden',
+    textOverflow: 'ellipsis',
+    whiteSpace: 'nowrap',
+  },
   imageGrid: {
     display: 'grid',
     gridTemplateColumns: 'repeat(auto-fill, minmax(150px, 1fr))',
@@ -193,7 +193,9 @@ function AIAppBuilder({ pcId }) {
     try {
       const { data } = await api.post(`/api/ai-apps/${selectedApp.id}/chat`, {
         message: message,
-        pc_id: pcId // Pass Cloud PC ID so AI knows the context
+        pc_id: pcId, // Pass Cloud PC ID so AI knows the context
+        // Existing apps are edited with small patches instead of being regenerated
+        mode: selectedApp.code && selectedApp.developer_id === user?.id ? 'patch' : 'full'
       });
 
       // Replace optimistic message with real one and add AI response
@@ -202,6 +204,18 @@ function AIAppBuilder({ pcId }) {
         return [...filtered, data.user_message, data.ai_response];
       });
 
+      // In patch mode the server applies and saves the change itself
+      if (data.code_updated) {
+        setSelectedApp(prev => ({ ...prev, code: data.code }));
+        showPopupMessage('success', '✅ Changes applied and saved automatically!');
+        return;
+      }
+      if (data.patch_error) {
+        showPopupMessage('warning', `Could not apply the AI's changes: ${data.patch_error}`);
+      }
+      // A patch-mode reply never replaces the whole app (large apps are always patched)
+      if (data.mode === 'patch') return;
+
       // Extract and apply code automatically if AI provided it
       const aiResponseText = data.ai_response?.response || data.ai_response?.message || '';
       let extractedCode = null;
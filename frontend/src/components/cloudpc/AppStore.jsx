@@ -1,6 +1,6 @@
 import React, { useState, useEffect } from 'react';
 import { useAuth } from '../../contexts/AuthContext';
-import api from '../../services/api';
+import api, { fetchAppCode } from '../../services/api';
 import './AppStore.css';
 
 function AppStore({ pcId, onOpenApp }) {
@@ -70,17 +70,29 @@ function AppStore({ pcId, onOpenApp }) {
     }
   };
 
-  const handlePreview = (app) => {
-    setSelectedApp(app);
-    setShowPreview(true);
+  const handlePreview = async (app) => {
+    try {
+      const code = await fetchAppCode(app);
+      setSelectedApp({ ...app, code });
+      setShowPreview(true);
+    } catch (err) {
+      showPopupMessage('error', err.response?.data?.error || 'Failed to load app');
+    }
   };
 
-  const handleOpenApp = (app) => {
+  const handleOpenApp = async (app) => {
     // Open the app as a Cloud PC window
     if (onOpenApp) {
+      let code;
+      try {
+        code = await fetchAppCode(app);
+      } catch (err) {
+        showPopupMessage('error', err.response?.data?.error || 'Failed to load app');
+        return;
+      }
       onOpenApp({
         name: app.name,
-        code: app.code,
+        code,
         appId: app.id,
         isDownloadedApp: true
       });
@@ -92,7 +104,7 @@ function AppStore({ pcId, onOpenApp }) {
     const pinnedApp = {
       id: app.id,
       name: app.name,
-      code: app.code,
+      code_url: app.code_url,
       developer: app.developer
     };
     
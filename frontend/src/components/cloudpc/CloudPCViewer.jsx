@@ -1,7 +1,7 @@
 import React, { useState, useEffect, useRef } from 'react';
 import { useParams, useNavigate } from 'react-router-dom';
 import { useAuth } from '../../contexts/AuthContext';
-import api from '../../services/api';
+import api, { fetchAppCode } from '../../services/api';
 import FileManager from './FileManager';
 import DrawingApp from './DrawingApp';
 import AIAppBuilder from './AIAppBuilder';
@@ -247,7 +247,7 @@ function CloudPCViewer() {
   }, [openApps, pcId, passwordVerified]);
 
   const openApp = (appNameOrAppData) => {
-    let appName, appCode, appId, isDownloadedApp;
+    let appName, appCode, appId, isDownloadedApp, codeUrl;
     
     // Handle both string (app name) and object (app data) formats
     if (typeof appNameOrAppData === 'string') {
@@ -258,6 +258,7 @@ function CloudPCViewer() {
     } else {
       appName = appNameOrAppData.name;
       appCode = appNameOrAppData.code;
+      codeUrl = appNameOrAppData.codeUrl;
       appId = appNameOrAppData.appId;
       isDownloadedApp = appNameOrAppData.isDownloadedApp || false;
     }
@@ -290,6 +291,13 @@ function CloudPCViewer() {
     };
     setOpenApps([...openApps, newApp]);
     setShowStartMenu(false);
+
+    // Pinned apps only remember their code URL; load the code into the window once it arrives
+    if (isDownloadedApp && !appCode && codeUrl) {
+      fetchAppCode({ code_url: codeUrl })
+        .then(code => setOpenApps(prev => prev.map(app => app.id === newApp.id ? { ...app, code } : app)))
+        .catch(err => console.error('Failed to load app code:', err));
+    }
     
     // Focus Minecraft iframe when opened
     if (appName === 'Minecraft') {
@@ -658,6 +666,7 @@ function CloudPCViewer() {
                     <div key={pinnedApp.id} className="start-menu-item" onClick={() => openApp({
                       name: pinnedApp.name,
                       code: pinnedApp.code,
+                      codeUrl: pinnedApp.code_url,
                       appId: pinnedApp.id,
                       isDownloadedApp: true
                     })}>
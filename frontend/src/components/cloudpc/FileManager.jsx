@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import api from '../../services/api';
 import './FileManager.css';
 
@@ -20,6 +20,12 @@ function FileManager({ pcId }) {
   const [imagePreview, setImagePreview] = useState(null);
   const [renamingFile, setRenamingFile] = useState(null);
   const [renameFileName, setRenameFileName] = useState('');
+  // Change-feed version of the listing on screen; used to fetch only what changed since
+  const versionRef = useRef(null);
+  // ETag of the file open in the editor, so saves are rejected if it changed elsewhere
+  const editingEtagRef = useRef(null);
+  // Content the editor opened with; saves send only the lines that differ from it
+  const editingBaseRef = useRef('');
 
   const showPopup = (type, message) => {
     setPopup({ type, message });
@@ -30,12 +36,19 @@ function FileManager({ pcId }) {
     loadFiles();
   }, [currentPath]);
 
+  // Pick up changes made from other windows of this PC
+  useEffect(() => {
+    const interval = setInterval(() => syncChanges(), 5000);
+    return () => clearInterval(interval);
+  }, [currentPath]);
+
   const loadFiles = async () => {
     try {
       setLoading(true);
       const { data } = await api.get(`/api/cloud-pcs/${pcId}/files`, {
         params: { path: currentPath }
       });
+      versionRef.current = data.version ?? null;
       setFiles(data.files || []);
     } catch (err) {
       const errorMsg = err.response?.data?.error || 'Failed to load files';
@@ -46,6 +59,54 @@ function FileManager({ pcId }) {
     }
   };
 
+  const parentOf = (path) => path.substring(0, path.lastIndexOf('/')) || '/';
+
+  const syncChanges = async () => {
+    if (versionRef.current === null) {
+      loadFiles();
+      return;
+    }
+    try {
+      let hasMore = true;
+      while (hasMore) {
+        const { data } = await api.get(`/api/cloud-pcs/${pcId}/changes`, {
+          params: { since: versionRef.current }
+        });
+        const leftCurrentPath = data.changes.some(change =>
+          (change.event === 'deleted' || change.event === 'renamed') &&
+          (currentPath === (change.old_path || change.path) || currentPath.startsWith(`${change.old_path || change.path}/`))
+        );
+        if (data.reset || leftCurrentPath) {
+          loadFiles();
+          return;
+        }
+        setFiles(prev => {
+          let next = prev;
+          data.changes.forEach(change => {
+            const name = change.path.substring(change.path.lastIndexOf('/') + 1);
+            if (change.event === 'renamed' && parentOf(change.old_path) === currentPath) {
+              const oldName = change.old_path.substring(change.old_path.lastIndexOf('/') + 1);
+              next = next.filter(f => f.name !== oldName);
+            }
+            if (parentOf(change.path) !== currentPath) return;
+            next = next.filter(f => f.name !== name);
+            if (change.event !== 'deleted' && change.entry) {
+              next = [...next, change.entry];
+            }
+          });
+          return next === prev ? prev : [...next].sort((a, b) =>
+            (a.type === b.type ? a.name.localeCompare(b.name) : a.type === 'directory' ? -1 : 1)
+          );
+        });
+        versionRef.current = data.version;
+        hasMore = data.has_more;
+      }
+    } catch (err) {
+      // Fall back to a full listing if the feed is unavailable
+      loadFiles();
+    }
+  };
+
   const handleFileClick = async (file) => {
     if (file.type === 'directory') {
       setCurrentPath(currentPath === '/' ? `/${file.name}` : `${currentPath}/${file.name}`);
@@ -62,6 +123,8 @@ function FileManager({ pcId }) {
           const { data } = await api.get(`/api/cloud-pcs/${pcId}/files/read`, {
             params: { path: filePath }
           });
+          editingEtagRef.current = data.etag || null;
+          editingBaseRef.current = data.content || '';
           setEditingFile(filePath);
           setFileContent(data.content || '');
         } catch (err) {
@@ -116,7 +179,7 @@ function FileManager({ pcId }) {
       });
       setShowCreateFile(false);
       setNewFileName('');
-      loadFiles();
+      syncChanges();
       showPopup('success', `File "${filename}" created successfully`);
     } catch (err) {
       const errorMsg = err.response?.data?.error || 'Failed to create file';
@@ -136,7 +199,7 @@ function FileManager({ pcId }) {
       });
       setShowCreateFolder(false);
       setNewFolderName('');
-      loadFiles();
+      syncChanges();
       showPopup('success', `Folder "${newFolderName.trim()}" created successfully`);
     } catch (err) {
       const errorMsg = err.response?.data?.error || 'Failed to create folder';
@@ -144,17 +207,67 @@ function FileManager({ pcId }) {
     }
   };
 
+  // The server splits lines like Python's str.splitlines; only diff text whose sole break is \n
+  const OTHER_LINE_BREAKS = /[\r\v\f\x1c-\x1e\x85\u2028\u2029]/;
+  const splitLines = (text) => text.match(/[^\n]*\n|[^\n]+$/g) || [];
+
+  // One line-range edit replacing the lines between the common prefix and suffix
+  const lineRangeEdit = (before, after) => {
+    const oldLines = splitLines(before);
+    const newLines = splitLines(after);
+    let prefix = 0;
+    while (prefix < oldLines.length && prefix < newLines.length && oldLines[prefix] === newLines[prefix]) {
+      prefix++;
+    }
+    let suffix = 0;
+    while (
+      suffix < oldLines.length - prefix &&
+      suffix < newLines.length - prefix &&
+      oldLines[oldLines.length - 1 - suffix] === newLines[newLines.length - 1 - suffix]
+    ) {
+      suffix++;
+    }
+    return {
+      start: prefix + 1,
+      end: oldLines.length - suffix,
+      text: newLines.slice(prefix, newLines.length - suffix).join('')
+    };
+  };
+
+  const saveFileContent = async () => {
+    const base = editingBaseRef.current;
+    const canPatch = editingEtagRef.current && !OTHER_LINE_BREAKS.test(base) && !OTHER_LINE_BREAKS.test(fileContent);
+    if (canPatch) {
+      if (fileContent === base) return;
+      try {
+        await api.patch(`/api/cloud-pcs/${pcId}/files`, {
+          path: editingFile,
+          edits: [lineRangeEdit(base, fileContent)],
+          base_etag: editingEtagRef.current
+        });
+        return;
+      } catch (err) {
+        // A conflicting patch or stale ETag is settled by a full, still ETag-guarded, save
+        if (![409, 412].includes(err.response?.status)) throw err;
+      }
+    }
+    await api.put(`/api/cloud-pcs/${pcId}/files`, {
+      path: editingFile,
+      content: fileContent,
+      base_etag: editingEtagRef.current
+    });
+  };
+
   const handleSaveFile = async () => {
     if (!editingFile) return;
 
     try {
-      await api.put(`/api/cloud-pcs/${pcId}/files`, {
-        path: editingFile,
-        content: fileContent
-      });
+      await saveFileContent();
+      editingEtagRef.current = null;
+      editingBaseRef.current = '';
       setEditingFile(null);
       setFileContent('');
-      loadFiles();
+      syncChanges();
       showPopup('success', 'File saved successfully');
     } catch (err) {
       const errorMsg = err.response?.data?.error || 'Failed to save file';
@@ -175,7 +288,7 @@ function FileManager({ pcId }) {
       await api.post(`/api/cloud-pcs/${pcId}/files/upload`, formData, {
         headers: { 'Content-Type': 'multipart/form-data' }
       });
-      loadFiles();
+      syncChanges();
       showPopup('success', `File "${file.name}" uploaded successfully`);
     } catch (err) {
       const errorMsg = err.response?.data?.error || 'Failed to upload file';
@@ -203,7 +316,7 @@ function FileManager({ pcId }) {
         old_path: oldPath,
         new_path: newPath
       });
-      loadFiles();
+      syncChanges();
       showPopup('success', `${file.type === 'directory' ? 'Folder' : 'File'} renamed successfully`);
     } catch (err) {
       showPopup('error', err.response?.data?.error || 'Failed to rename file');
@@ -218,7 +331,7 @@ function FileManager({ pcId }) {
       await api.delete(`/api/cloud-pcs/${pcId}/files`, {
         data: { path: filePath }
       });
-      loadFiles();
+      syncChanges();
       showPopup('success', `${file.type === 'directory' ? 'Folder' : 'File'} deleted successfully`);
     } catch (err) {
       showPopup('error', err.response?.data?.error || 'Failed to delete file');
@@ -17,6 +17,8 @@ function Messages() {
   const [viewingImage, setViewingImage] = useState(null);
   const [hoveredImage, setHoveredImage] = useState(null);
   const [searchQuery, setSearchQuery] = useState(''); // Search query for filtering users
+  const [unreadCounts, setUnreadCounts] = useState({}); // partner id -> unread messages
+  const [partnerLastReadId, setPartnerLastReadId] = useState(null); // read receipt for own messages
   const bottomRef = useRef(null);
   const fileInputRef = useRef(null);
   const [notificationPermission, setNotificationPermission] = useState('default');
@@ -38,10 +40,8 @@ function Messages() {
       setLoadingUsers(false);
       return;
     }
-    setLoadingUsers(true); // Set loading when starting to fetch
-    fetchAllUsers();
     const interval = setInterval(() => {
-      fetchAllUsers(); // Don't show loading for refresh
+      fetchUnreadCounts(); // Only the badges change often; the member list is loaded on demand
     }, 30000); // Refresh every 30 seconds
     return () => clearInterval(interval);
   }, [user, authLoading]);
@@ -77,14 +77,16 @@ function Messages() {
       setLoadingUsers(true);
     }
     try {
-      // Use search query if provided, otherwise fetch first page
-      const params = searchQuery ? { search: searchQuery, per_page: 100 } : { per_page: 100 };
-      const res = await api.get('/api/members', { params });
+      // Typing uses the prefix autocomplete index; otherwise fetch the first page of members
+      const res = searchQuery
+        ? await api.get('/api/members/autocomplete', { params: { q: searchQuery, limit: 50 } })
+        : await api.get('/api/members', { params: { per_page: 100 } });
       const members = res.data?.members || [];
       // Filter out current user
       const otherUsers = members.filter(m => m.id !== user?.id);
       setAllUsers(otherUsers);
       setError(null);
+      fetchUnreadCounts();
     } catch (e) {
       console.error('Failed to load users:', e);
       // Only show login error if user is actually not logged in
@@ -110,6 +112,19 @@ function Messages() {
     }
   };
 
+  const fetchUnreadCounts = async () => {
+    try {
+      const res = await api.get('/api/messages-unread');
+      const counts = {};
+      (res.data?.conversations || []).forEach((entry) => {
+        counts[entry.partner_id] = entry.unread_count;
+      });
+      setUnreadCounts(counts);
+    } catch (e) {
+      console.error('Failed to load unread counts:', e);
+    }
+  };
+
   // Debounce search to avoid too many API calls
   useEffect(() => {
     if (!user) return;
@@ -156,7 +171,15 @@ function Messages() {
       const res = await api.get(`/api/messages/${selectedUsername}`);
       const messages = res.data?.messages || [];
       setThread(messages);
+      setPartnerLastReadId(res.data?.partner_last_read_message_id ?? null);
       setError(null);
+      if (res.data?.unread_count > 0) {
+        const partnerId = res.data?.partner?.id;
+        await api.post(`/api/messages/${selectedUsername}/read`, {
+          message_id: messages[messages.length - 1]?.id,
+        });
+        setUnreadCounts((counts) => ({ ...counts, [partnerId]: 0 }));
+      }
       
       if (messages.length > 0 && Notification.permission === 'granted') {
         const lastMessage = messages[messages.length - 1];
@@ -389,6 +412,9 @@ function Messages() {
                     <div style={styles.partnerName}>
                       {member.username}
                       {member.is_admin && <span style={styles.adminBadge}> 👑</span>}
+                      {unreadCounts[member.id] > 0 && (
+                        <span style={styles.unreadBadge}>{unreadCounts[member.id]}</span>
+                      )}
                     </div>
                     <div style={styles.partnerEmail}>{member.email}</div>
                   </div>
@@ -499,6 +525,7 @@ function Messages() {
                         )}
                         <div style={styles.messageTime}>
                           {new Date(msg.created_at).toLocaleTimeString()}
+                          {isOwn && partnerLastReadId && msg.id <= partnerLastReadId && ' · Seen'}
                         </div>
                       </div>
                     </div>
@@ -773,6 +800,15 @@ const styles = {
   adminBadge: {
     fontSize: '0.9rem',
   },
+  unreadBadge: {
+    marginLeft: '0.5rem',
+    padding: '0.1rem 0.5rem',
+    borderRadius: '999px',
+    background: '#667eea',
+    color: '#fff',
+    fontSize: '0.75rem',
+    fontWeight: '700',
+  },
   chatArea: {
     backgroundColor: 'rgba(255, 255, 255, 0.95)',
     backdropFilter: 'blur(10px)',
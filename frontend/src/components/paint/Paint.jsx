@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import CanvasDraw from 'react-canvas-draw';
 import api from '../../services/api';
 
@@ -16,6 +16,9 @@ function Paint() {
   const [brushShape, setBrushShape] = useState('round'); // round or square
   const [canvasKey, setCanvasKey] = useState(0); // Used only when explicitly forcing reset
   const [selectedPainting, setSelectedPainting] = useState(null); // For viewing full size
+  // Painting loaded for editing: { id, revision, lineCount, minLines }. minLines is the fewest of the
+  // loaded lines left on the canvas (after undo/clear), so saves can send just the ops since loading.
+  const editingRef = useRef(null);
 
   const normalizePainting = (raw = {}) => {
     const name = raw.name || raw.title || 'Untitled Painting';
@@ -36,15 +39,15 @@ function Paint() {
       // Legacy format - image_data should be JSON string for CanvasDraw
       saveData = raw.image_data;
     } else {
-      // Default empty painting
-      saveData = JSON.stringify([]);
+      // List entries carry no strokes; they are fetched when the painting is opened
+      return { ...raw, name, saveData: '' };
     }
     
-    // Validate saveData is valid JSON array
+    // Validate saveData is CanvasDraw save data ({ lines, width, height }) or a legacy array
     if (saveData && typeof saveData === 'string') {
       try {
         const parsed = JSON.parse(saveData);
-        if (!Array.isArray(parsed)) {
+        if (!Array.isArray(parsed) && !Array.isArray(parsed?.lines)) {
           console.warn('Painting data is not an array, resetting to empty');
           saveData = JSON.stringify([]);
         }
@@ -109,16 +112,66 @@ function Paint() {
       } catch (err) {
         strokes = [];
       }
-      const response = await api.post('/api/paint', {
+      const editing = editingRef.current;
+      // A full save of an open painting only overwrites the revision it was loaded at
+      const saveWhole = (baseRevision) => api.post('/api/paint', {
+        ...(editing ? { id: editing.id } : {}),
+        ...(baseRevision ? { base_revision: baseRevision } : {}),
         name: title.trim(),
         data: strokes
       });
-      const created = response.data?.paint ? normalizePainting(response.data.paint) : null;
-      if (created) {
-        setPaintings([...paintings, created]);
+      let response = null;
+      try {
+        if (editing && Array.isArray(strokes?.lines)) {
+          // Send only what changed since the painting was loaded
+          const ops = [];
+          if (editing.minLines === 0 && editing.lineCount > 0) {
+            ops.push({ type: 'clear' });
+          } else if (editing.minLines < editing.lineCount) {
+            ops.push({ type: 'undo', count: editing.lineCount - editing.minLines });
+          }
+          const newLines = strokes.lines.slice(editing.minLines);
+          if (newLines.length) {
+            ops.push({ type: 'strokes', lines: newLines });
+          }
+          try {
+            response = await api.post(`/api/paint/${editing.id}/ops`, {
+              base_revision: editing.revision,
+              name: title.trim(),
+              ops,
+            });
+          } catch (opsError) {
+            // Only a painting the op log cannot hold needs the whole thing resent; a stale
+            // revision is a real conflict and is handled below
+            if (!opsError.response?.data?.full_save_required) throw opsError;
+          }
+        }
+        if (!response) {
+          response = await saveWhole(editing?.revision);
+        }
+      } catch (saveError) {
+        if (saveError.response?.status !== 409 || !editing) throw saveError;
+        const overwrite = window.confirm(
+          'This painting was changed somewhere else since you opened it.\n\n' +
+          'OK saves your version over it. Cancel loads the latest version instead.'
+        );
+        if (!overwrite) {
+          editingRef.current = null;
+          await loadPaintingToCanvas({ id: editing.id });
+          setError('This painting was changed elsewhere, so the latest version was loaded.');
+          return;
+        }
+        response = await saveWhole(null);
+      }
+      const saved = response.data?.paint ? normalizePainting(response.data.paint) : null;
+      if (saved && editing) {
+        setPaintings(paintings.map((p) => (p.id === saved.id ? saved : p)));
+      } else if (saved) {
+        setPaintings([...paintings, saved]);
       } else {
         await fetchPaintings();
       }
+      editingRef.current = null;
       setTitle('');
       canvas.clear();
     } catch (err) {
@@ -144,11 +197,26 @@ function Paint() {
     }
   };
 
-  const loadPaintingToCanvas = (painting) => {
-    if (!canvas || !painting) {
+  const withSaveData = async (painting) => {
+    if (painting.saveData) return painting;
+    const response = await api.get(`/api/paint/${painting.id}`);
+    return normalizePainting(response.data?.paint);
+  };
+
+  const loadPaintingToCanvas = async (listedPainting) => {
+    if (!canvas || !listedPainting) {
       setError('Canvas not ready or painting data invalid');
       return;
     }
+
+    let painting;
+    try {
+      painting = await withSaveData(listedPainting);
+    } catch (err) {
+      console.error('Failed to load painting:', err);
+      setError('Failed to load painting');
+      return;
+    }
     
     if (!painting.saveData) {
       setError('Failed to read file data: No save data found');
@@ -161,7 +229,7 @@ function Paint() {
         // Try to parse it to validate
         try {
           const parsed = JSON.parse(painting.saveData);
-          if (!Array.isArray(parsed)) {
+          if (!Array.isArray(parsed) && !Array.isArray(parsed?.lines)) {
             throw new Error('Invalid painting data format');
           }
         } catch (parseErr) {
@@ -171,6 +239,10 @@ function Paint() {
       }
 
       canvas.loadSaveData(painting.saveData, true);
+      const loadedLines = JSON.parse(painting.saveData)?.lines;
+      editingRef.current = Array.isArray(loadedLines) && painting.revision
+        ? { id: painting.id, revision: painting.revision, lineCount: loadedLines.length, minLines: loadedLines.length }
+        : null;
       setTitle(painting.name);
       setSelectedPainting(null);
       setError(null);
@@ -189,8 +261,15 @@ function Paint() {
     }
   };
 
-  const viewPaintingFullSize = (painting) => {
-    setSelectedPainting(normalizePainting(painting));
+  const viewPaintingFullSize = async (painting) => {
+    try {
+      const normalized = normalizePainting(painting);
+      // Server-rendered paintings are shown as an image; strokes are fetched only when loaded to the canvas
+      setSelectedPainting(normalized.image_url ? normalized : await withSaveData(normalized));
+    } catch (err) {
+      console.error('Failed to load painting:', err);
+      setError('Failed to load painting');
+    }
   };
 
   return (
@@ -343,8 +422,22 @@ function Paint() {
           <button onClick={savePainting} style={styles.saveButton} disabled={saving}>
             {saving ? 'Saving...' : 'Save Painting'}
           </button>
+          <button onClick={() => {
+            if (!canvas) return;
+            canvas.undo();
+            const editing = editingRef.current;
+            if (editing) {
+              const remaining = JSON.parse(canvas.getSaveData()).lines.length;
+              editing.minLines = Math.min(editing.minLines, remaining);
+            }
+          }} style={styles.clearButton}>
+            Undo
+          </button>
           <button onClick={() => {
             canvas?.clear();
+            if (editingRef.current) {
+              editingRef.current.minLines = 0;
+            }
           }} style={styles.clearButton}>
             Clear Canvas
           </button>
@@ -361,14 +454,25 @@ function Paint() {
                 className="painting-thumbnail"
                 onClick={() => viewPaintingFullSize(painting)}
               >
-                <CanvasDraw
-                  disabled
-                  hideGrid
-                  loadTimeOffset={0}
-                  saveData={painting.saveData}
-                  canvasWidth={200}
-                  canvasHeight={150}
-                />
+                {painting.thumbnail_url ? (
+                  <img
+                    src={painting.thumbnail_url}
+                    alt={painting.name}
+                    loading="lazy"
+                    width={200}
+                    height={150}
+                    style={styles.paintingImage}
+                  />
+                ) : (
+                  <CanvasDraw
+                    disabled
+                    hideGrid
+                    loadTimeOffset={0}
+                    saveData={painting.saveData}
+                    canvasWidth={200}
+                    canvasHeight={150}
+                  />
+                )}
               </div>
               <div style={styles.paintingInfo}>
                 <span style={styles.paintingTitle}>{painting.name}</span>
@@ -413,14 +517,24 @@ function Paint() {
               </button>
             </div>
             <div style={styles.modalCanvas}>
-              <CanvasDraw
-                disabled
-                hideGrid
-                loadTimeOffset={0}
-                saveData={selectedPainting.saveData}
-                canvasWidth={800}
-                canvasHeight={600}
-              />
+              {selectedPainting.image_url ? (
+                <img
+                  src={`${selectedPainting.image_url}&w=800&h=600`}
+                  alt={selectedPainting.name}
+                  width={800}
+                  height={600}
+                  style={styles.modalImage}
+                />
+              ) : (
+                <CanvasDraw
+                  disabled
+                  hideGrid
+                  loadTimeOffset={0}
+                  saveData={selectedPainting.saveData}
+                  canvasWidth={800}
+                  canvasHeight={600}
+                />
+              )}
             </div>
             <div style={styles.modalActions}>
               <button
@@ -631,6 +745,19 @@ const styles = {
     cursor: 'pointer',
     transition: 'opacity 0.2s',
   },
+  paintingImage: {
+    display: 'block',
+    width: '200px',
+    height: '150px',
+    objectFit: 'contain',
+    background: '#ffffff',
+  },
+  modalImage: {
+    display: 'block',
+    maxWidth: '100%',
+    height: 'auto',
+    background: '#ffffff',
+  },
   paintingInfo: {
     padding: '0.75rem',
     display: 'flex',
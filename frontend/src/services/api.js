@@ -99,4 +99,16 @@ api.interceptors.response.use(
   }
 );
 
+// App listings carry a `code_url` instead of the code itself. The asset URL is
+// immutable (it contains the code hash), so repeat loads come from the HTTP cache.
+export const fetchAppCode = async (app) => {
+  if (app.code) return app.code;
+  if (!app.code_url) return '';
+  const { data } = await api.get(app.code_url, {
+    responseType: 'text',
+    transformResponse: [(body) => body],
+  });
+  return data;
+};
+
 export default api;
@@ -57,6 +57,11 @@ export default defineConfig(({ mode }) => {
             })
           },
         },
+        '/apps': {
+          target: proxyTarget,
+          changeOrigin: true,
+          secure: false,
+        },
         '/uploads': {
           target: proxyTarget,
           changeOrigin: true,